@@ -0,0 +1,130 @@
+"""
+Tabelle di anteprima dell'app (tabelle Arrow tipizzate, mostrate una pagina alla volta).
+
+- tabella_report: una riga per metrica del report appena generato
+- tabella_metriche: celle scritte sul modello da un'elaborazione Athletic Data
+- tabella_storico: tutte le date di un atleta nello storico
+- tabella_confronto: due date di un atleta nello storico, affiancate
+- tabella_squadra: una metrica per tutti gli atleti dello storico
+Le colonne hanno il loro tipo (numeri float64, date date32, testi ripetuti come dizionario): la
+formattazione (es. la variazione % con due decimali) è applicata solo in visualizzazione, vedi
+FORMATI. Le tabelle Arrow sono immutabili e pagina() ne restituisce una fetta senza copiare i
+dati, quindi al browser arriva solo la pagina mostrata.
+Le funzioni non usano Streamlit: la cache e i widget di paginazione sono di chi le chiama.
+"""
+import math
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Righe di una pagina di anteprima
+RIGHE_PAGINA = int(os.environ.get("CHRONOJUMP_RIGHE_ANTEPRIMA", "200"))
+
+# Formato di visualizzazione per colonna (printf per i numeri, moment.js per le date)
+FORMATI = {
+    "Diff %": "%.2f%%",
+    "Data": "DD/MM/YYYY",
+}
+
+_TESTO_RIPETUTO = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMA_REPORT = pa.schema([
+    ("Test", pa.string()),
+    ("PRIMA", pa.float64()),
+    ("DOPO", pa.float64()),
+    ("Diff", pa.float64()),
+    ("Diff %", pa.float64()),  # punti percentuali (10.5 = +10.50%), nullo se la metrica non ha variazione %
+])
+
+SCHEMA_METRICHE = pa.schema([
+    ("Sezione", _TESTO_RIPETUTO),
+    ("Metrica", _TESTO_RIPETUTO),
+    ("Dato", _TESTO_RIPETUTO),
+    ("Prova", pa.int32()),
+    ("Cella", pa.string()),
+    ("Valore", pa.float64()),
+    ("Testo", pa.string()),
+])
+
+SCHEMA_STORICO = pa.schema([("Data", pa.date32())] + list(SCHEMA_METRICHE))
+
+SCHEMA_CONFRONTO = pa.schema(list(SCHEMA_METRICHE)[:5] + [
+    ("PRE", pa.float64()),
+    ("POST", pa.float64()),
+    ("Diff", pa.float64()),
+])
+
+SCHEMA_SQUADRA = pa.schema([
+    ("Atleta", _TESTO_RIPETUTO),
+    ("Data", pa.date32()),
+    ("Valore", pa.float64()),
+    ("Prove", pa.int32()),
+])
+
+
+def _tabella(colonne, schema):
+    """Tabella dallo schema: una sequenza (lista, array o Series) per campo, nello stesso ordine."""
+    return pa.table([pa.array(c, type=campo.type, from_pandas=True) for c, campo in zip(colonne, schema)],
+                    schema=schema)
+
+
+def _date(testi):
+    """Date ISO (YYYY-MM-DD) dello storico come date32."""
+    return pc.cast(pc.strptime(pa.array(testi, pa.string()), format="%Y-%m-%d", unit="s"), pa.date32())
+
+
+def tabella_report(preview_data):
+    """Righe dell'anteprima del report (vedi genera_report_comparativo) con la variazione % numerica."""
+    return _tabella([
+        [str(r["Test"]) for r in preview_data],
+        [r["PRIMA"] for r in preview_data],
+        [r["DOPO"] for r in preview_data],
+        [r["Diff"] for r in preview_data],
+        [r["PercRaw"] if r["Diff %"] else None for r in preview_data],
+    ], SCHEMA_REPORT)
+
+
+def tabella_metriche(righe):
+    """Metriche scritte da un'elaborazione: tuple di storico.estrai_metriche_da_foglio."""
+    if not righe:
+        return SCHEMA_METRICHE.empty_table()
+    return _tabella(list(zip(*righe)), SCHEMA_METRICHE)
+
+
+def tabella_storico(df):
+    """Serie di un atleta (DataFrame di storico.storico_atleta), una riga per cella e data."""
+    return _tabella([
+        _date(df["data_test"]), df["sezione"], df["metrica"], df["dato"], df["indice"], df["cella"],
+        df["valore_num"], df["valore_testo"],
+    ], SCHEMA_STORICO)
+
+
+def tabella_confronto(df):
+    """Confronto PRE/POST di un atleta (DataFrame di storico.confronto_pre_post), una riga per cella."""
+    return _tabella([
+        df["sezione"], df["metrica"], df["dato"], df["indice"], df["cella"], df["pre"], df["post"], df["diff"],
+    ], SCHEMA_CONFRONTO)
+
+
+def tabella_squadra(serie):
+    """Una metrica per la squadra (DataFrame di storico.serie_squadra), una riga per atleta e data."""
+    return _tabella([serie["atleta"], _date(serie["data_test"]), serie["valore"], serie["prove"]],
+                    SCHEMA_SQUADRA)
+
+
+def numero_pagine(tabella, righe=RIGHE_PAGINA):
+    return max(math.ceil(tabella.num_rows / righe), 1)
+
+
+def pagina(tabella, numero, righe=RIGHE_PAGINA):
+    """Righe della pagina 'numero' (da 1): una fetta della tabella, senza copia."""
+    return tabella.slice((numero - 1) * righe, righe)
+
+
+def formati(tabella):
+    """(colonna, 'data' o 'numero', formato) delle colonne della tabella con un formato di visualizzazione."""
+    return [
+        (campo.name, "data" if pa.types.is_date(campo.type) else "numero", FORMATI[campo.name])
+        for campo in tabella.schema if campo.name in FORMATI
+    ]
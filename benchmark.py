@@ -0,0 +1,165 @@
+"""
+Benchmark della pipeline su export sintetici (vedi genera_export.py).
+
+Per ogni dimensione e formato misura caricamento, step 1, step 2, step 3, salvataggio e
+generazione del report PRE/POST, e accoda i risultati (mediana delle ripetizioni) a un file
+JSONL etichettato con la versione, per il confronto tra versioni.
+
+Esempio:
+    python benchmark.py --dimensioni 100 1000 10000 --formati xlsx csv-semicolon --ripetizioni 3
+    python benchmark.py --dimensioni 1000 --confronta v1.0
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+# Il benchmark non deve toccare lo storico né il log prestazioni di produzione
+os.environ["CHRONOJUMP_DB_STORICO"] = os.path.join(tempfile.gettempdir(), "benchmark_storico.db")
+os.environ["CHRONOJUMP_LOG_PRESTAZIONI"] = ""
+
+import main
+import genera_export
+
+FILE_RISULTATI_DEFAULT = "benchmark_risultati.jsonl"
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+
+
+def etichetta_versione():
+    """Etichetta di default: git describe del repository, 'sviluppo' se non disponibile."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=CARTELLA_PROGETTO
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "sviluppo"
+
+
+def _buffer(path_o_bytes, nome):
+    """Buffer in memoria con attributo .name, come un file caricato da Streamlit."""
+    dati = open(path_o_bytes, "rb").read() if isinstance(path_o_bytes, str) else path_o_bytes
+    buffer = io.BytesIO(dati)
+    buffer.name = nome
+    return buffer
+
+
+def esegui_caso(path_sorgente, data_pre, data_post, modello, template_report):
+    """Una ripetizione: pipeline su due date (PRE e POST) e report. Restituisce {stadio: record}."""
+    nome = os.path.basename(path_sorgente)
+    stadi = {}
+
+    risultati = {}
+    for etichetta, data in (("pre", data_pre), ("post", data_post)):
+        r = main.esegui_elaborazione_atleta(_buffer(path_sorgente, nome), modello, data)
+        risultati[etichetta] = r["output"]
+        # Le metriche della pipeline si riferiscono all'elaborazione POST (l'ultima data)
+        for s in r["misura"].stadi:
+            stadi[s["stadio"]] = s
+
+    r = main.genera_report_comparativo(
+        _buffer(risultati["pre"], "pre.xlsx"), _buffer(risultati["post"], "post.xlsx"), template_report
+    )
+    totale = {"stadio": "report", "wall_s": 0.0, "cpu_s": 0.0, "picco_mem_mb": 0.0, "conteggi": {}}
+    for s in r["misura"].stadi:
+        stadi[f"report: {s['stadio']}"] = s
+        totale["wall_s"] += s["wall_s"]
+        totale["cpu_s"] += s["cpu_s"]
+        totale["picco_mem_mb"] = max(totale["picco_mem_mb"], s["picco_mem_mb"] or 0.0)
+    stadi["report"] = totale
+    return stadi
+
+
+def riassumi(ripetizioni):
+    """Mediana di wall/CPU e massimo del picco di memoria per stadio."""
+    riepilogo = {}
+    for nome in ripetizioni[0]:
+        valori = [r[nome] for r in ripetizioni]
+        riepilogo[nome] = {
+            "wall_s": round(statistics.median(v["wall_s"] for v in valori), 4),
+            "cpu_s": round(statistics.median(v["cpu_s"] for v in valori), 4),
+            "picco_mem_mb": max((v["picco_mem_mb"] or 0.0) for v in valori),
+            "conteggi": valori[0]["conteggi"],
+        }
+    return riepilogo
+
+
+def carica_risultati(path, etichetta=None):
+    """Record del file JSONL dei risultati, eventualmente filtrati per etichetta."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        record = [json.loads(riga) for riga in f if riga.strip()]
+    return [r for r in record if etichetta is None or r["etichetta"] == etichetta]
+
+
+def stampa_confronto(record, riferimento):
+    """Tabella dei tempi con il rapporto rispetto al riferimento (stessa dimensione e formato)."""
+    chiave_rif = {(r["salti"], r["formato"]): r for r in riferimento}
+    for r in record:
+        rif = chiave_rif.get((r["salti"], r["formato"]))
+        print(f"\n== {r['salti']} salti, {r['date']} date, {r['formato']} ==")
+        for nome, s in r["stadi"].items():
+            riga = f"  {nome:<45} {s['wall_s']:>9.3f}s  cpu {s['cpu_s']:>8.3f}s  mem {s['picco_mem_mb']:>8.1f}MB"
+            if rif and nome in rif["stadi"] and rif["stadi"][nome]["wall_s"] > 0:
+                rapporto = s["wall_s"] / rif["stadi"][nome]["wall_s"]
+                riga += f"  x{rapporto:.2f} vs {rif['etichetta']}"
+            print(riga)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline Chronojump su export sintetici.")
+    parser.add_argument("--dimensioni", type=int, nargs="+", default=[100, 1000, 10000], help="Salti per export")
+    parser.add_argument("--date", type=int, default=None, help="Sessioni per export (default: 1 ogni 200 salti, max 50)")
+    parser.add_argument("--formati", nargs="+", default=["xlsx", "csv-semicolon"], choices=list(genera_export.FORMATI))
+    parser.add_argument("--ripetizioni", type=int, default=3)
+    parser.add_argument("--etichetta", default=None, help="Etichetta della versione (default: git describe)")
+    parser.add_argument("--output", default=FILE_RISULTATI_DEFAULT, help="File JSONL dei risultati")
+    parser.add_argument("--confronta", default=None, help="Etichetta di riferimento per il confronto")
+    parser.add_argument("--cartella", default=None, help="Cartella per gli export generati (default: temporanea)")
+    parser.add_argument("--modello", default=os.path.join(CARTELLA_PROGETTO, main.FILE_MODELLO_DEFAULT))
+    parser.add_argument("--template-report", default=os.path.join(CARTELLA_PROGETTO, main.FILE_REPORT_DEFAULT))
+    args = parser.parse_args()
+
+    etichetta = args.etichetta or etichetta_versione()
+    cartella = args.cartella or tempfile.mkdtemp(prefix="chronojump_bench_")
+    nuovi = []
+
+    for n_salti in args.dimensioni:
+        n_date = args.date or min(max(n_salti // 200, 1), 50)
+        date = genera_export.date_sessioni(n_date, datetime(2024, 1, 8, 9, 0))
+        data_pre, data_post = date[0].date(), date[-1].date()
+        for path in genera_export.genera_file(cartella, n_salti, n_date, 1, args.formati):
+            formato = next(f for f in args.formati if f"_{f}." in os.path.basename(path))
+            print(f"-> {os.path.basename(path)} ({args.ripetizioni} ripetizioni)", file=sys.stderr)
+            ripetizioni = [
+                esegui_caso(path, data_pre, data_post, args.modello, args.template_report)
+                for _ in range(args.ripetizioni)
+            ]
+            nuovi.append({
+                "etichetta": etichetta,
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "salti": n_salti,
+                "date": n_date,
+                "formato": formato,
+                "ripetizioni": args.ripetizioni,
+                "stadi": riassumi(ripetizioni),
+            })
+
+    with open(args.output, "a", encoding="utf-8") as f:
+        for r in nuovi:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    riferimento = carica_risultati(args.output, args.confronta) if args.confronta else []
+    stampa_confronto(nuovi, riferimento)
+
+
+if __name__ == "__main__":
+    main_benchmark()
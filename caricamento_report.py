@@ -0,0 +1,96 @@
+"""
+Caricamento in parallelo dei file PRE e POST della pagina 'Report'.
+
+Per ciascun file servono il DataFrame (carica_file_universale) e i valori del foglio 'ATLETA'
+(load_excel_robust): openpyxl decomprime e analizza l'XML in Python, quindi in thread diversi
+i caricamenti resterebbero in fila sul GIL. Vengono eseguiti in un pool di processi, mentre il
+processo principale carica il template; genera_report_comparativo li attende in un solo punto.
+Dal processo di lavoro torna solo ciò che il report legge: il DataFrame, i valori del foglio
+(FoglioValori, non il workbook openpyxl) e gli eventi del registro.
+
+Le funzioni eseguite nel pool stanno in questo modulo e non in main.py: sotto Streamlit main.py
+gira come '__main__', e un processo avviato con 'spawn' non potrebbe ritrovarle.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# --- CONFIGURAZIONE CARICAMENTO REPORT ---
+# Processi del pool (uno per file: PRE e POST); 0 = caricamenti in sequenza
+WORKER_REPORT = int(os.environ.get("CHRONOJUMP_WORKER_REPORT", "2"))
+
+
+class _Cella:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class FoglioValori:
+    """Valori di un foglio (righe dalla prima cella A1), letti come ws.cell(row=, column=).value."""
+
+    __slots__ = ("titolo", "righe")
+
+    def __init__(self, titolo, righe):
+        self.titolo = titolo
+        self.righe = righe
+
+    @classmethod
+    def da_worksheet(cls, ws):
+        return cls(ws.title, [tuple(riga) for riga in ws.iter_rows(values_only=True)])
+
+    def cell(self, row, column):
+        # Fuori dall'area usata il foglio openpyxl restituisce una cella vuota: qui lo stesso
+        if row <= len(self.righe) and column <= len(self.righe[row - 1]):
+            return _Cella(self.righe[row - 1][column - 1])
+        return _Cella(None)
+
+
+def copia_sorgente(file):
+    """Sorgente da inviare al pool: i path restano tali, i buffer diventano BytesIO con lo stesso nome."""
+    if file is None or isinstance(file, str):
+        return file
+    file.seek(0)
+    buffer = io.BytesIO(file.read())
+    buffer.name = getattr(file, "name", "file.xlsx")
+    file.seek(0)
+    return buffer
+
+
+def carica_sorgente(sorgente, etichetta, soglia, attivo):
+    """
+    DataFrame e valori del foglio 'ATLETA' di un file PRE o POST (eseguita nel pool).
+    Restituisce {"df", "foglio" (FoglioValori o None), "errore", "eventi"}.
+    """
+    import main  # nel processo di lavoro main.py è un modulo normale
+
+    # Stessa soglia del registro del chiamante, che riceve gli eventi al termine
+    registro = main.RegistroEventi(attivo=attivo)
+    registro.soglia = soglia
+    df = main.carica_file_universale(sorgente, registro)
+    ws_val, _, errore = main.load_excel_robust(sorgente, etichetta, registro)
+    return {
+        "df": df,
+        "foglio": FoglioValori.da_worksheet(ws_val) if ws_val is not None else None,
+        "errore": errore,
+        "eventi": registro.eventi,
+    }
+
+
+def _pronto():
+    return os.getpid()
+
+
+def crea_pool(worker=WORKER_REPORT):
+    """
+    Pool di processi per i caricamenti; i processi partono subito, non alla prima richiesta.
+    None con worker a 0 o su una sola CPU, dove i processi aggiungerebbero solo il trasferimento.
+    """
+    if worker < 1 or (os.cpu_count() or 1) < 2:
+        return None
+    pool = ProcessPoolExecutor(max_workers=worker, mp_context=get_context("spawn"))
+    for _ in range(worker):
+        pool.submit(_pronto)
+    return pool
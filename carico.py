@@ -0,0 +1,456 @@
+"""
+Prova di carico: N sessioni simultanee che usano le due pagine dell'app.
+
+Ogni sessione simulata è un allenatore che ripete il percorso delle due pagine, ogni volta con un
+export sintetico diverso (un atleta per percorso: la cache dei risultati del servizio non
+restituisce il lavoro già fatto e ogni richiesta è un'elaborazione vera):
+  1. Athletic Data: carica export e modello, elabora la prima data (PRE), scarica il risultato
+  2. Athletic Data: stesso export, ultima data (POST)
+  3. Report: carica i due risultati e il template, genera il report, lo scarica
+Il percorso misurato si sceglie con --percorso:
+  - app (default): il percorso del container Streamlit, in questo processo. Ogni sessione è un
+    thread che fa ciò che fa lo script ad ogni clic: lettura e indice del file nel governatore
+    della memoria, main.invia_elaborazione sul pool di thread condiviso (CHRONOJUMP_WORKER) e
+    output registrato nel governatore; il report con genera_report_comparativo e il pool dei
+    report. Non passa dal server Streamlit (websocket e rendering dei widget sono esclusi).
+  - servizio: le richieste vanno a servizio.py (POST /elabora e /report), che usa le stesse
+    funzioni della UI su un pool di processi. Senza --url il servizio viene avviato in questo
+    processo su una porta libera, con --worker e --coda.
+
+Al termine riporta il percorso misurato, throughput (sessioni e richieste al secondo), percentili
+di latenza per operazione, errori (codice HTTP o eccezione) e memoria residente (attuale e picco)
+di ogni processo: il processo server e i suoi processi di lavoro (Linux, da /proc). Con --url la
+memoria è misurata solo se si indica --pid del servizio.
+
+Esempio:
+    python carico.py --sessioni 8 --ripetizioni 3 --salti 3000
+    python carico.py --percorso servizio --sessioni 8 --ripetizioni 3 --salti 3000 --worker 2 --coda 8
+    python carico.py --percorso servizio --url http://127.0.0.1:8765 --pid 12345 --sessioni 20
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+# La prova non deve toccare lo storico né il log prestazioni di produzione
+os.environ["CHRONOJUMP_DB_STORICO"] = os.path.join(tempfile.gettempdir(), "carico_storico.db")
+os.environ["CHRONOJUMP_LOG_PRESTAZIONI"] = ""
+
+import filigrana
+import genera_export
+import incrementale
+import main
+import servizio
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+PERCENTILI = (50, 90, 95, 99)
+OPERAZIONI = ("elabora PRE", "elabora POST", "report")
+PERCORSI = {
+    "app": "container Streamlit (main.invia_elaborazione e governatore, in processo)",
+    "servizio": "servizio HTTP (servizio.py, pool di processi)",
+}
+
+
+# --- CLIENT HTTP ---
+
+def corpo_multipart(campi):
+    """(content_type, corpo) multipart/form-data da {campo: bytes | (nome file, bytes) | str}."""
+    confine = uuid.uuid4().hex
+    parti = []
+    for nome, valore in campi.items():
+        if isinstance(valore, tuple):
+            nome_file, dati = valore
+            intestazione = (f'Content-Disposition: form-data; name="{nome}"; filename="{nome_file}"\r\n'
+                            f"Content-Type: application/octet-stream\r\n\r\n")
+        else:
+            dati = valore.encode("utf-8") if isinstance(valore, str) else valore
+            intestazione = f'Content-Disposition: form-data; name="{nome}"\r\n\r\n'
+        parti.append(f"--{confine}\r\n".encode() + intestazione.encode("utf-8") + dati + b"\r\n")
+    corpo = b"".join(parti) + f"--{confine}--\r\n".encode()
+    return f"multipart/form-data; boundary={confine}", corpo
+
+
+def invia(url, campi, timeout):
+    """POST multipart. Restituisce (stato HTTP, intestazioni, corpo); stato 0 se la connessione fallisce."""
+    content_type, corpo = corpo_multipart(campi)
+    richiesta = urllib.request.Request(url, data=corpo, method="POST", headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(richiesta, timeout=timeout) as risposta:
+            return risposta.status, dict(risposta.headers), risposta.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+    except (urllib.error.URLError, OSError):
+        return 0, {}, b""
+
+
+# --- MEMORIA DEI PROCESSI (Linux) ---
+
+def _ruolo(pid, pid_server):
+    if pid == pid_server:
+        return "server"
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            if b"resource_tracker" in f.read():
+                return "tracker"   # processo di servizio di multiprocessing
+    except OSError:
+        pass
+    return "worker"
+
+
+def _status_kb(pid):
+    """{'VmRSS': kB, 'VmHWM': kB} dal /proc del processo; vuoto se non disponibile."""
+    valori = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for riga in f:
+                campo = riga.split(":", 1)[0]
+                if campo in ("VmRSS", "VmHWM"):
+                    valori[campo] = int(riga.split()[1])
+    except OSError:
+        pass
+    return valori
+
+
+def processi_discendenti(pid):
+    """Pid del processo e di tutti i suoi discendenti (da /proc/*/stat)."""
+    figli = {}
+    try:
+        voci = os.listdir("/proc")
+    except OSError:
+        return [pid]
+    for voce in voci:
+        if not voce.isdigit():
+            continue
+        try:
+            with open(f"/proc/{voce}/stat") as f:
+                # Il nome del comando è tra parentesi e può contenere spazi: ppid è il secondo campo dopo ')'
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        figli.setdefault(ppid, []).append(int(voce))
+    trovati, da_visitare = [], [pid]
+    while da_visitare:
+        corrente = da_visitare.pop()
+        trovati.append(corrente)
+        da_visitare.extend(figli.get(corrente, []))
+    return trovati
+
+
+class CampionatoreMemoria:
+    """Campiona a intervalli la memoria residente del servizio e dei suoi processi di lavoro."""
+
+    def __init__(self, pid, intervallo_s=0.5):
+        self.pid = pid
+        self.intervallo_s = intervallo_s
+        self.processi = {}   # pid -> {"ruolo", "rss_mb", "picco_mb"}
+        self._ferma = threading.Event()
+        self._thread = threading.Thread(target=self._ciclo, daemon=True)
+
+    def avvia(self):
+        self.campiona()
+        self._thread.start()
+
+    def ferma(self):
+        self._ferma.set()
+        self._thread.join()
+        self.campiona()
+
+    def _ciclo(self):
+        while not self._ferma.wait(self.intervallo_s):
+            self.campiona()
+
+    def campiona(self):
+        for pid in processi_discendenti(self.pid):
+            stato = _status_kb(pid)
+            if "VmRSS" not in stato:
+                continue
+            voce = self.processi.get(pid)
+            if voce is None:
+                voce = self.processi[pid] = {"ruolo": _ruolo(pid, self.pid), "rss_mb": 0.0, "picco_mb": 0.0}
+            voce["rss_mb"] = round(stato["VmRSS"] / 1024, 1)
+            # VmHWM è il picco visto dal kernel, anche tra un campione e l'altro
+            voce["picco_mb"] = round(max(voce["picco_mb"], stato.get("VmHWM", stato["VmRSS"]) / 1024), 1)
+
+
+# --- SESSIONI SIMULATE ---
+
+class _GestoreSilenzioso(servizio.GestoreRichieste):
+    """Senza una riga di log per richiesta sullo stderr."""
+
+    def log_message(self, *args):
+        pass
+
+
+def esegui_sessione(n, base_url, export, data_pre, data_post, modello, template, timeout, esiti):
+    """Percorsi di una sessione, uno per export; ogni richiesta aggiunge un record a esiti."""
+    def richiesta(operazione, endpoint, campi):
+        inizio = time.perf_counter()
+        stato, intestazioni, corpo = invia(base_url + endpoint, campi, timeout)
+        # Scaricato davvero un xlsx (zip), non un messaggio d'errore
+        valido = stato == 200 and corpo[:2] == b"PK"
+        esiti.append({
+            "sessione": n, "operazione": operazione, "stato": stato, "valido": valido,
+            "latenza_s": time.perf_counter() - inizio, "bytes": len(corpo),
+            "cache": intestazioni.get("X-Cache", ""),
+        })
+        return corpo if valido else None
+
+    completate = 0
+    for path in export:
+        nome = os.path.basename(path)
+        with open(path, "rb") as f:
+            dati = f.read()
+        pre = richiesta("elabora PRE", "/elabora",
+                        {"sorgente": (nome, dati), "data": data_pre.isoformat(), "modello": ("excel.xlsx", modello)})
+        post = richiesta("elabora POST", "/elabora",
+                         {"sorgente": (nome, dati), "data": data_post.isoformat(), "modello": ("excel.xlsx", modello)})
+        if pre is None or post is None:
+            continue
+        report = richiesta("report", "/report",
+                           {"pre": ("pre.xlsx", pre), "post": ("post.xlsx", post), "template": ("report.xlsx", template)})
+        if report is not None:
+            completate += 1
+    return completate
+
+
+def _upload(dati, nome):
+    """Buffer in memoria con attributo .name, come un file caricato da Streamlit."""
+    buffer = io.BytesIO(dati)
+    buffer.name = nome
+    return buffer
+
+
+def esegui_sessione_app(n, export, data_pre, data_post, modello, template, timeout, esiti):
+    """
+    Percorsi di una sessione sul percorso del container Streamlit: gli stessi passi della pagina
+    Athletic Data (file nel governatore, lavoro sul pool condiviso) e della pagina Report.
+    """
+    governatore, sessione = main.get_governatore_memoria(), f"carico-{n}"
+
+    def richiesta(operazione, funzione):
+        inizio = time.perf_counter()
+        try:
+            corpo, stato = funzione(), 200
+        except Exception as e:
+            corpo, stato = None, type(e).__name__
+        valido = corpo is not None and corpo[:2] == b"PK"
+        esiti.append({
+            "sessione": n, "operazione": operazione, "stato": stato, "valido": valido,
+            "latenza_s": time.perf_counter() - inizio, "bytes": len(corpo or b""), "cache": "",
+        })
+        return corpo if valido else None
+
+    def elabora(upload, firma, data_test):
+        if governatore.prendi(sessione, "sorgente_athletic", firma=firma) is None:
+            # Caricamento del file: lettura, indice delle sessioni e sorgente in cache, come nello script
+            df = main.carica_file_universale(main.copia_upload(upload))
+            if df is None:
+                raise ValueError("Errore lettura file sorgente")
+            indici[firma] = filigrana.indicizza(df, governatore)
+            governatore.registra(sessione, "sorgente_athletic", df, "sorgente", firma=firma)
+        dati_modello = governatore.prendi(sessione, "modello_athletic", firma="modello")
+        if dati_modello is None:
+            dati_modello = modello
+            governatore.registra(sessione, "modello_athletic", dati_modello, "modello", firma="modello")
+        governatore.rimuovi(sessione, "output_athletic")
+        passi = governatore.prendi(sessione, "passi_athletic")
+        if passi is None:
+            passi = incrementale.CacheStep()
+            governatore.registra(sessione, "passi_athletic", passi, "modello")
+        lavoro = main.invia_elaborazione(
+            main.copia_upload(upload), _upload(dati_modello, "excel.xlsx"), data_test, "carico.xlsx",
+            indice=indici[firma], df_sorgente=governatore.prendi(sessione, "sorgente_athletic", firma=firma),
+            passi=passi
+        )
+        risultato = lavoro.future.result(timeout=timeout)
+        governatore.registra(sessione, "output_athletic", risultato.pop("output"), "output", firma=id(lavoro))
+        return governatore.prendi(sessione, "output_athletic", firma=id(lavoro))
+
+    def report(pre, post):
+        risultato = main.genera_report_comparativo(
+            _upload(pre, "pre.xlsx"), _upload(post, "post.xlsx"), _upload(template, "report.xlsx"),
+            main.RegistroEventi(main.LIVELLO_LOG_DEFAULT), pool=main.get_pool_report()
+        )
+        return risultato["output"]
+
+    completate, indici = 0, {}
+    for path in export:
+        nome = os.path.basename(path)
+        with open(path, "rb") as f:
+            upload = _upload(f.read(), nome)
+        firma = f"{nome}_{len(upload.getvalue())}"
+        pre = richiesta("elabora PRE", lambda: elabora(upload, firma, data_pre))
+        post = richiesta("elabora POST", lambda: elabora(upload, firma, data_post))
+        if pre is None or post is None:
+            continue
+        if richiesta("report", lambda: report(pre, post)) is not None:
+            completate += 1
+    return completate
+
+
+def percentili(latenze):
+    if not latenze:
+        return {}
+    valori = np.percentile(np.asarray(latenze), PERCENTILI)
+    riepilogo = {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILI, valori)}
+    riepilogo["max"] = round(max(latenze), 3)
+    return riepilogo
+
+
+def riassumi(percorso, esiti, durata_s, sessioni_completate, memoria):
+    """Record della prova: percorso misurato, throughput, latenze per operazione, errori e memoria per processo."""
+    per_operazione = {}
+    for operazione in OPERAZIONI:
+        proprie = [e for e in esiti if e["operazione"] == operazione]
+        valide = [e["latenza_s"] for e in proprie if e["valido"]]
+        per_operazione[operazione] = {
+            "richieste": len(proprie),
+            "ok": len(valide),
+            "da_cache": sum(1 for e in proprie if e["cache"] in ("cache", "condiviso")),
+            "latenza_s": percentili(valide),
+        }
+    errori = {}
+    for e in esiti:
+        if not e["valido"]:
+            chiave = str(e["stato"]) if e["stato"] else "connessione"
+            errori[chiave] = errori.get(chiave, 0) + 1
+    return {
+        "percorso": percorso,
+        "durata_s": round(durata_s, 2),
+        "richieste": len(esiti),
+        "richieste_al_s": round(len(esiti) / durata_s, 3) if durata_s else 0.0,
+        "sessioni_completate": sessioni_completate,
+        "sessioni_al_minuto": round(60 * sessioni_completate / durata_s, 2) if durata_s else 0.0,
+        "latenza_s": percentili([e["latenza_s"] for e in esiti if e["valido"]]),
+        "operazioni": per_operazione,
+        "errori": errori,
+        "memoria": memoria,
+    }
+
+
+def stampa_riepilogo(r):
+    print(f"\nPercorso misurato: {PERCORSI[r['percorso']]}")
+    print(f"{r['sessioni_completate']} percorsi completati in {r['durata_s']}s: "
+          f"{r['sessioni_al_minuto']} al minuto, {r['richieste_al_s']} richieste/s")
+    for operazione, o in r["operazioni"].items():
+        lat = o["latenza_s"]
+        dettaglio = "  ".join(f"{k} {v:.3f}s" for k, v in lat.items()) if lat else "-"
+        print(f"  {operazione:<13} {o['ok']:>4}/{o['richieste']:<4} ok  (cache {o['da_cache']})  {dettaglio}")
+    if r["errori"]:
+        print("  errori: " + ", ".join(f"{k}: {v}" for k, v in sorted(r["errori"].items())))
+    if r["memoria"]:
+        totale = sum(p["rss_mb"] for p in r["memoria"].values())
+        print(f"  memoria (RSS attuale / picco, MB), totale attuale {totale:.1f}:")
+        for pid, p in sorted(r["memoria"].items(), key=lambda v: (v[1]["ruolo"] != "server", int(v[0]))):
+            print(f"    {p['ruolo']:<7} pid {pid:<8} {p['rss_mb']:>8.1f} / {p['picco_mb']:>8.1f}")
+
+
+def main_carico():
+    parser = argparse.ArgumentParser(description="Prova di carico con sessioni simultanee sull'app o sul servizio di elaborazione.")
+    parser.add_argument("--percorso", default="app", choices=list(PERCORSI),
+                        help="app: container Streamlit in processo; servizio: servizio HTTP")
+    parser.add_argument("--sessioni", type=int, default=4, help="Sessioni simultanee (allenatori)")
+    parser.add_argument("--ripetizioni", type=int, default=2, help="Percorsi completi per sessione")
+    parser.add_argument("--salti", type=int, default=3000, help="Salti per export sintetico")
+    parser.add_argument("--date", type=int, default=None, help="Sessioni per export (default: 1 ogni 200 salti, max 50)")
+    parser.add_argument("--formato", default="xlsx", choices=list(genera_export.FORMATI))
+    parser.add_argument("--url", default=None, help="Servizio già avviato (default: avviato qui)")
+    parser.add_argument("--pid", type=int, default=None, help="Pid del servizio indicato con --url, per la memoria")
+    parser.add_argument("--worker", type=int, default=servizio.WORKER_DEFAULT, help="Processi del servizio avviato qui")
+    parser.add_argument("--coda", type=int, default=servizio.CODA_DEFAULT, help="Coda del servizio avviato qui")
+    parser.add_argument("--timeout", type=float, default=servizio.TIMEOUT_S, help="Attesa massima per richiesta (s)")
+    parser.add_argument("--modello", default=os.path.join(CARTELLA_PROGETTO, "excel.xlsx"))
+    parser.add_argument("--template-report", default=os.path.join(CARTELLA_PROGETTO, "report.xlsx"))
+    parser.add_argument("--output", default=None, help="File JSONL a cui accodare il risultato")
+    args = parser.parse_args()
+    if args.url and args.percorso != "servizio":
+        parser.error("--url richiede --percorso servizio")
+
+    n_date = args.date or min(max(args.salti // 200, 1), 50)
+    date = genera_export.date_sessioni(n_date, datetime(2024, 1, 8, 9, 0))
+    data_pre, data_post = date[0].date(), date[-1].date()
+    cartella = tempfile.mkdtemp(prefix="chronojump_carico_")
+    # Un atleta diverso per ogni percorso di ogni sessione
+    export = genera_export.genera_file(cartella, args.salti, n_date, args.sessioni * args.ripetizioni, [args.formato])
+    with open(args.modello, "rb") as f:
+        modello = f.read()
+    with open(args.template_report, "rb") as f:
+        template = f.read()
+
+    server, base_url = None, None
+    if args.percorso == "app":
+        pid = os.getpid()
+        descrizione = f"app in processo, {main.WORKER_ELABORAZIONE} thread di elaborazione"
+    elif args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        server = servizio.crea_server(0, servizio.ServizioElaborazione(args.worker, args.coda))
+        server.RequestHandlerClass = _GestoreSilenzioso
+        server.servizio.riscalda()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url, pid = f"http://{servizio.HOST}:{server.server_port}", os.getpid()
+    if base_url:
+        descrizione = f"servizio {base_url}"
+    campionatore = CampionatoreMemoria(pid) if pid and os.path.exists(f"/proc/{pid}") else None
+
+    print(f"{args.sessioni} sessioni x {args.ripetizioni} percorsi, export da {args.salti} salti ({args.formato}), "
+          f"{descrizione}", file=sys.stderr)
+    esiti, completate = [], [0] * args.sessioni
+
+    def sessione(n):
+        propri = export[n * args.ripetizioni:(n + 1) * args.ripetizioni]
+        if args.percorso == "app":
+            completate[n] = esegui_sessione_app(n, propri, data_pre, data_post, modello, template, args.timeout, esiti)
+        else:
+            completate[n] = esegui_sessione(n, base_url, propri, data_pre, data_post, modello, template,
+                                            args.timeout, esiti)
+
+    if campionatore:
+        campionatore.avvia()
+    inizio = time.perf_counter()
+    thread = [threading.Thread(target=sessione, args=(n,)) for n in range(args.sessioni)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    durata = time.perf_counter() - inizio
+    if campionatore:
+        campionatore.ferma()
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server.servizio.chiudi()
+    if args.percorso == "app":
+        main.get_executor_elaborazioni().shutdown()
+        if main.get_pool_report() is not None:
+            main.get_pool_report().shutdown()
+
+    risultato = riassumi(args.percorso, esiti, durata, sum(completate), campionatore.processi if campionatore else {})
+    stampa_riepilogo(risultato)
+    if args.output:
+        risultato.update({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sessioni": args.sessioni, "ripetizioni": args.ripetizioni, "salti": args.salti,
+            "formato": args.formato,
+            "worker": main.WORKER_ELABORAZIONE if args.percorso == "app" else None if args.url else args.worker,
+            "coda": None if args.url or args.percorso == "app" else args.coda,
+        })
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(risultato, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main_carico()
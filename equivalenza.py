@@ -0,0 +1,747 @@
+"""
+Verifica di equivalenza dei motori di elaborazione 'Athletic Data' su un corpus di export.
+
+Un motore riceve un export (bytes e nome), le date da elaborare e il modello, e restituisce il
+workbook prodotto per ogni data. Il motore di riferimento è una copia congelata della pipeline
+com'era prima delle ottimizzazioni (pd.read_excel, step 1-3 riga per riga scritti con openpyxl),
+indipendente da main.py: una regressione delle riscritture non può riprodursi anche
+nell'oracolo. Il candidato (di default la pipeline della pagina) deve produrre esattamente le
+stesse celle: stesso valore (anche il tipo: 12 non è 12.0 né '12') e stesso formato numerico, su
+ogni foglio. Le sessioni da confrontare sono trovate dal riferimento (rif_date_sessioni); una
+sessione che la pipeline attuale non elenca, o elenca in più, è una differenza del file.
+Per ogni file vengono riportate le differenze e il rapporto tra i tempi.
+
+Motori disponibili (vedi MOTORI) oppure 'modulo:funzione' con la stessa firma di motore_riferimento.
+Il corpus sono file e cartelle di export reali, più eventualmente export sintetici generati al volo.
+
+Esempio:
+    python equivalenza.py --corpus export_reali/ --sintetici 1000 10000 --candidato incrementale
+    python equivalenza.py --corpus a.xlsx b.csv --candidato mio_modulo:elabora --ripetizioni 3
+"""
+import argparse
+import importlib
+import io
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+# La verifica non deve toccare lo storico né il log prestazioni di produzione
+os.environ["CHRONOJUMP_DB_STORICO"] = os.path.join(tempfile.gettempdir(), "equivalenza_storico.db")
+os.environ["CHRONOJUMP_LOG_PRESTAZIONI"] = ""
+
+import pandas as pd
+from numbers_parser import Document
+from openpyxl import load_workbook
+
+import main
+import genera_export
+import incrementale
+import sessioni
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+ESTENSIONI = (".xlsx", ".csv", ".numbers")
+
+# Differenze stampate per file (il conteggio è sempre completo)
+MAX_DIFFERENZE_MOSTRATE = 20
+
+
+def _buffer(dati, nome):
+    buffer = io.BytesIO(dati)
+    buffer.name = nome
+    return buffer
+
+
+# --- RIFERIMENTO CONGELATO ---
+# Copia della pipeline com'era prima delle ottimizzazioni (lettura con pd.read_excel, filtro delle
+# date riga per riga, step scritti con openpyxl), senza Streamlit. Non deve importare nulla da
+# main.py né dai moduli nuovi: è l'oracolo contro cui si misurano le riscritture. Le regole di
+# scrittura sono quelle di allora (le stesse di regole.json), CHRONOJUMP_REGOLE non vale qui.
+
+RIF_ANAGRAFICA = [
+    {"etichetta": "Data di nascita", "cella": "B2"},
+    {"etichetta": "Altezza", "cella": "C3"},
+    {"etichetta": "Sesso", "cella": "G2"},
+    {"etichetta": "Peso", "cella": "C4"},
+    {"etichetta": "lunghezza gamba", "cella": "E5"},
+    {"etichetta": "altezza dei fianchi durante flessione SJ", "cella": "E6"},
+]
+
+RIF_SALTI = [
+    {"tipo": "ABK", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["F9", "G9", "H9"]}]},
+    {"tipo": "CMJ", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["F10", "G10", "H10"]}]},
+    {"tipo": "ABK", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["F12", "G12", "H12"]}]},
+    {"tipo": "CMJ", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["F13", "G13", "H13"]}]},
+    {"tipo": "SJ", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["S15", "T15", "U15"]}]},
+    {"tipo": "slCMJleft", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["F16", "G16", "H16"]}]},
+    {"tipo": "slCMJright", "discriminante": None, "outputs": [{"dato": "Altezza", "celle": ["F15", "G15", "H15"]}]},
+] + [
+    {"tipo": "DJa", "discriminante": ("Caduta", caduta),
+     "outputs": [{"dato": "Altezza", "celle": [f"P{r}", f"Q{r}", f"R{r}"]}, {"dato": "TC", "celle": [f"T{r}", f"U{r}", f"V{r}"]}]}
+    for r, caduta in zip(range(4, 10), (30, 45, 60, 75, 90, 105))
+] + [
+    {"tipo": "SJl", "discriminante": None, "weight_output": f"R{r}",
+     "outputs": [{"dato": "Altezza", "celle": [f"S{r}", f"T{r}", f"U{r}"]}]}
+    for r in range(16, 20)
+]
+
+
+def rif_custom_round(val, decimals=0):
+    try:
+        if val is None or str(val).strip() == "":
+            return val
+        n = float(str(val).replace(',', '.'))
+        multiplier = 10 ** decimals
+        res = int(n * multiplier + 0.5) / multiplier
+        if decimals == 0:
+            return int(res)
+        return res
+    except:
+        return val
+
+
+def rif_carica_file(sorgente):
+    """pd.read_excel(header=None), poi .numbers, poi CSV con i tre separatori."""
+    sorgente.seek(0)
+    try:
+        df = pd.read_excel(sorgente, header=None)
+        sorgente.seek(0)
+        return df
+    except:
+        pass
+    sorgente.seek(0)
+    if sorgente.name.endswith('.numbers'):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".numbers") as tmp:
+            tmp.write(sorgente.read())
+            tmp_path = tmp.name
+        try:
+            tables = Document(tmp_path).sheets[0].tables
+            sorgente.seek(0)
+            return pd.DataFrame(tables[0].rows(values_only=True))
+        finally:
+            os.remove(tmp_path)
+    for sep in [',', ';', '\t']:
+        try:
+            sorgente.seek(0)
+            df = pd.read_csv(sorgente, header=None, sep=sep, encoding='latin1', on_bad_lines='skip', engine='python')
+            if df.shape[1] > 1:
+                sorgente.seek(0)
+                return df
+        except:
+            continue
+    sorgente.seek(0)
+    return None
+
+
+def rif_raggruppa_salti(df_salti):
+    gruppi = []
+    if df_salti.empty: return gruppi
+    current_chunk = []
+    first_row = df_salti.iloc[0]
+    last_tipo, last_caduta, last_peso = first_row['Tipo'], first_row['Caduta'], first_row['Peso Kg']
+    for _, row in df_salti.iterrows():
+        curr_tipo, curr_caduta, curr_peso = row['Tipo'], row['Caduta'], row['Peso Kg']
+        cambio_serie = (curr_tipo != last_tipo) or \
+                       (abs(float(curr_caduta) - float(last_caduta)) > 0.1) or \
+                       (abs(float(curr_peso) - float(last_peso)) > 0.1)
+        if cambio_serie:
+            gruppi.append({'tipo': last_tipo, 'caduta': last_caduta, 'peso': last_peso, 'data': pd.DataFrame(current_chunk)})
+            current_chunk = []
+            last_tipo, last_caduta, last_peso = curr_tipo, curr_caduta, curr_peso
+        current_chunk.append(row)
+    if current_chunk:
+        gruppi.append({'tipo': last_tipo, 'caduta': last_caduta, 'peso': last_peso, 'data': pd.DataFrame(current_chunk)})
+    return gruppi
+
+
+def rif_step1_anagrafica(df, ws, data_selezionata):
+    ws["F2"] = data_selezionata.strftime("%d/%m/%Y")
+    riga_header = -1
+    col_map = {}
+    for i, riga in df.iterrows():
+        riga_check = [str(x).strip().lower() for x in riga.tolist()]
+        if "id" in riga_check and "nome" in riga_check:
+            riga_header = i
+            for idx, col_name in enumerate(riga_check):
+                col_map[col_name] = idx
+            break
+    if riga_header == -1:
+        return
+    riga_atleta = df.iloc[riga_header + 1]
+
+    def prendi_solo_da_riga_id(nome_colonna):
+        n = nome_colonna.lower().strip()
+        if n in col_map:
+            val = str(riga_atleta.iloc[col_map[n]]).strip()
+            if val.lower() in ["nan", "none", "", "0", "0.0"]:
+                return ""
+            return val
+        return ""
+
+    full_name = prendi_solo_da_riga_id("nome")
+    if not full_name: full_name = prendi_solo_da_riga_id("nome persona")
+    if full_name:
+        parti = full_name.split(" ", 1)
+        ws["C1"] = parti[0].strip().upper() if len(parti) > 0 else ""
+        ws["E1"] = parti[1].strip().upper() if len(parti) > 1 else ""
+
+    for item in RIF_ANAGRAFICA:
+        etichetta, cella = item['etichetta'], item['cella']
+        valore = prendi_solo_da_riga_id(etichetta)
+        if not valore and etichetta.lower() == "peso":
+            valore = prendi_solo_da_riga_id("peso kg")
+        if etichetta.lower() == "sesso":
+            if valore.upper() == "M": valore = "UOMO"
+            elif valore.upper() == "F": valore = "DONNA"
+        is_number = False
+        try:
+            val_num = float(str(valore).replace(',', '.'))
+            valore = rif_custom_round(val_num, 0)
+            is_number = True
+        except:
+            pass
+        ws[cella] = valore
+        if is_number:
+            ws[cella].number_format = '0'
+
+
+def rif_step2_salti(df, ws, data_selezionata):
+    riga_header = -1
+    col_map = {}
+    for i, riga in df.iterrows():
+        riga_lista = [str(x).strip().lower() for x in riga.tolist()]
+        if "tipo" in riga_lista and "altezza" in riga_lista:
+            riga_header = i
+            for idx, val in enumerate(riga_lista): col_map[val] = idx
+            break
+    if riga_header == -1:
+        return
+    df_data = df.iloc[riga_header + 1:].copy()
+
+    def get_col_values(nome_col):
+        if nome_col.lower() in col_map: return df_data.iloc[:, col_map[nome_col.lower()]]
+        return None
+
+    def numerica(raw):
+        return pd.to_numeric(raw.astype(str).str.replace(',', '.'), errors='coerce')
+
+    clean_df = pd.DataFrame()
+    clean_df['Tipo'] = get_col_values('Tipo').astype(str).str.strip()
+    raw_alt = get_col_values('Altezza')
+    clean_df['Altezza'] = numerica(raw_alt) if raw_alt is not None else 0.0
+    raw_tc = get_col_values('TC')
+    clean_df['TC'] = numerica(raw_tc) if raw_tc is not None else 0.0
+    raw_caduta = get_col_values('Caduta')
+    clean_df['Caduta'] = numerica(raw_caduta).fillna(-1) if raw_caduta is not None else -1
+    raw_peso = get_col_values('Peso Kg')
+    if raw_peso is None: raw_peso = get_col_values('Peso')
+    clean_df['Peso Kg'] = numerica(raw_peso).fillna(-1) if raw_peso is not None else -1
+
+    raw_data = get_col_values('Data')
+    if raw_data is not None:
+        clean_df['Data_Originale'] = raw_data.astype(str).str.strip()
+
+        def confronta_date(data_file_str, data_selected):
+            try:
+                return pd.to_datetime(data_file_str).date() == data_selected
+            except:
+                return str(data_selected) in data_file_str
+
+        clean_df = clean_df[clean_df['Data_Originale'].apply(lambda x: confronta_date(x, data_selezionata))]
+    clean_df = clean_df.dropna(subset=['Altezza'])
+
+    gruppi_disponibili = rif_raggruppa_salti(clean_df)
+    gruppi_usati = [False] * len(gruppi_disponibili)
+    for regola in RIF_SALTI:
+        tipo_req, discrim = regola['tipo'], regola['discriminante']
+        gruppo_trovato, idx_trovato = None, -1
+        for i, gruppo in enumerate(gruppi_disponibili):
+            if gruppi_usati[i]: continue
+            if gruppo['tipo'].lower() != tipo_req.lower(): continue
+            discrim_ok = True
+            if discrim:
+                nome_d, val_d = discrim
+                val_gruppo = gruppo['caduta'] if nome_d == "Caduta" else gruppo['peso']
+                if abs(float(val_gruppo) - float(val_d)) > 0.1:
+                    discrim_ok = False
+            if discrim_ok:
+                gruppo_trovato, idx_trovato = gruppo['data'], i
+                break
+
+        if gruppo_trovato is None:
+            for out_conf in regola['outputs']:
+                for cella in out_conf['celle']:
+                    ws[cella] = ""
+            continue
+
+        gruppi_usati[idx_trovato] = True
+        if "weight_output" in regola:
+            peso_effettivo = gruppi_disponibili[idx_trovato]['peso']
+            try:
+                peso_effettivo = rif_custom_round(float(str(peso_effettivo).replace(',', '.')), 1)
+            except:
+                pass
+            ws[regola["weight_output"]] = peso_effettivo
+            if isinstance(peso_effettivo, (int, float)):
+                ws[regola["weight_output"]].number_format = '0.00'
+
+        top_3_indices = gruppo_trovato.sort_values(by='Altezza', ascending=False).head(3).index
+        df_sorted_top = gruppo_trovato.loc[top_3_indices].sort_index()
+        for out_conf in regola['outputs']:
+            col_dato, celle = out_conf['dato'], out_conf['celle']
+            no_round_dja = (tipo_req == "DJa" and col_dato == "TC")
+            vals_processed = []
+            for v in df_sorted_top[col_dato].tolist():
+                try:
+                    val_float = float(str(v).replace(',', '.'))
+                    vals_processed.append(val_float if no_round_dja else rif_custom_round(val_float, 1))
+                except:
+                    if v is not None and str(v).lower() != "nan":
+                        vals_processed.append(v)
+            if len(vals_processed) == 1:
+                vals_processed = vals_processed * 3
+            elif len(vals_processed) == 2:
+                try:
+                    media = (float(vals_processed[0]) + float(vals_processed[1])) / 2
+                    if not no_round_dja:
+                        media = rif_custom_round(media, 1)
+                    vals_processed.append(media)
+                except:
+                    pass
+            for k, cella in enumerate(celle):
+                val = vals_processed[k] if k < len(vals_processed) else ""
+                ws[cella] = val
+                if isinstance(val, (int, float)):
+                    ws[cella].number_format = '0.000' if no_round_dja else '0.00'
+
+
+def rif_step3_rj(df, ws, data_selezionata):
+    idx_tipo = idx_data = -1
+    for _, riga in df.iterrows():
+        riga_lista = [str(x).strip().lower() for x in riga.tolist()]
+        if "tipo di salto" in riga_lista:
+            for idx, val in enumerate(riga_lista):
+                if "tipo di salto" in val: idx_tipo = idx
+                if "data" in val: idx_data = idx
+            break
+    if idx_tipo == -1:
+        return
+
+    def to_float(val):
+        try:
+            return float(str(val).replace(',', '.').strip())
+        except:
+            return None
+
+    def check_date_match(val_cella, target):
+        try:
+            s = str(val_cella).strip()
+            if pd.to_datetime(s, dayfirst=True, errors='coerce').date() == target: return True
+            if str(target) in s: return True
+        except:
+            pass
+        return False
+
+    def is_number(val):
+        return to_float(val) is not None
+
+    n_rows = len(df)
+    sessions_found = []
+    i = 0
+    while i < n_rows:
+        row = df.iloc[i]
+        is_rj = False
+        try:
+            if "rj" in str(row.iloc[idx_tipo]).strip().lower():
+                if idx_data != -1 and check_date_match(row.iloc[idx_data], data_selezionata):
+                    is_rj = True
+        except: pass
+        if not is_rj:
+            i += 1
+            continue
+
+        r_sigle = i + 1
+        if r_sigle >= n_rows: break
+        row_sigle = df.iloc[r_sigle]
+        try:
+            sigla_b = str(row_sigle.iloc[1]).strip().lower()
+            sigla_d = str(row_sigle.iloc[3]).strip().lower()
+            ok_b = any(x in sigla_b for x in ['tc', 'contact', 'time'])
+            ok_d = any(x in sigla_d for x in ['altezza', 'height', 'h '])
+            if not (ok_b and ok_d):
+                i += 1
+                continue
+        except:
+            i += 1
+            continue
+        r_sd = i + 4
+        if r_sd >= n_rows: break
+        try:
+            sigla_sd = str(df.iloc[r_sd].iloc[0]).strip().lower()
+            if "sd" not in sigla_sd and "jump" not in sigla_sd:
+                i += 1
+                continue
+        except:
+            i += 1
+            continue
+
+        collected_jumps = []
+        k = i + 5
+        while k < n_rows:
+            d_row = df.iloc[k]
+            if not is_number(d_row.iloc[0]):
+                break
+            try:
+                val_tc, val_h, val_rsi = to_float(d_row.iloc[1]), to_float(d_row.iloc[3]), to_float(d_row.iloc[4])
+                if val_h is not None and val_h > 0:
+                    collected_jumps.append({'h': val_h, 'tc': val_tc if val_tc else 0.0, 'rsi': val_rsi if val_rsi else 0.0})
+            except:
+                pass
+            k += 1
+
+        if collected_jumps:
+            df_sess = pd.DataFrame(collected_jumps)
+            df_sess = df_sess[df_sess['h'] > 0].copy()
+            if not df_sess.empty:
+                top_5 = df_sess.sort_values(by='h', ascending=False).head(5) if len(df_sess) > 5 else df_sess
+
+                def mean_exclude_zeros(series):
+                    valid_vals = series[series > 0]
+                    return 0.0 if valid_vals.empty else valid_vals.mean()
+
+                sessions_found.append({'avg_h': top_5['h'].mean(), 'avg_tc': mean_exclude_zeros(top_5['tc']),
+                                       'avg_rsi': mean_exclude_zeros(top_5['rsi'])})
+        i = k
+
+    if not sessions_found:
+        ws["F19"] = ""; ws["H19"] = ""; ws["I19"] = ""
+        return
+    best = max(sessions_found, key=lambda x: x['avg_h'])
+    ws["F19"] = rif_custom_round(best['avg_h'], 2)
+    ws["F19"].number_format = '0.00'
+    if best['avg_tc'] > 0:
+        ws["H19"] = rif_custom_round(best['avg_tc'], 3)
+        ws["H19"].number_format = '0.000'
+    else:
+        ws["H19"] = ""
+    if best['avg_rsi'] > 0:
+        ws["I19"] = rif_custom_round(best['avg_rsi'], 3)
+        ws["I19"].number_format = '0.000'
+    else:
+        ws["I19"] = ""
+
+
+def rif_date_sessioni(df):
+    """
+    Date delle sessioni dell'export lette come gli step 2 e 3 congelati trovano le righe: salti con
+    'Data' interpretabile e altezza numerica sotto l'intestazione Tipo/Altezza, righe RJ con una
+    data nella colonna 'data'. Una data per riga (un valore ISO vale per i suoi primi 10 caratteri).
+    """
+    trovate = set()
+
+    def data_cella(val):
+        s = str(val).strip()
+        if re.match(r"\d{4}-\d{2}-\d{2}", s):
+            try:
+                return date.fromisoformat(s[:10])
+            except ValueError:
+                return None
+        d = pd.to_datetime(s, dayfirst=True, errors='coerce')
+        return None if pd.isna(d) else d.date()
+
+    for i, riga in df.iterrows():
+        riga_lista = [str(x).strip().lower() for x in riga.tolist()]
+        if "tipo" in riga_lista and "altezza" in riga_lista:
+            if "data" in riga_lista:
+                df_data = df.iloc[i + 1:]
+                altezze = pd.to_numeric(df_data.iloc[:, riga_lista.index("altezza")].astype(str).str.replace(',', '.'),
+                                        errors='coerce')
+                for val, altezza in zip(df_data.iloc[:, riga_lista.index("data")].astype(str).str.strip(), altezze):
+                    if pd.isna(altezza):
+                        continue
+                    try:
+                        trovate.add(pd.to_datetime(val).date())
+                    except:
+                        pass
+            break
+
+    idx_tipo = idx_data = -1
+    for _, riga in df.iterrows():
+        riga_lista = [str(x).strip().lower() for x in riga.tolist()]
+        if "tipo di salto" in riga_lista:
+            for idx, val in enumerate(riga_lista):
+                if "tipo di salto" in val: idx_tipo = idx
+                if "data" in val: idx_data = idx
+            break
+    if idx_tipo != -1 and idx_data != -1:
+        for _, riga in df.iterrows():
+            if "rj" in str(riga.iloc[idx_tipo]).strip().lower():
+                d = data_cella(riga.iloc[idx_data])
+                if d is not None:
+                    trovate.add(d)
+    return sorted(trovate)
+
+
+def rif_elabora(sorgente, modello, data_test):
+    """Bytes del modello elaborato per una data, con la pipeline congelata."""
+    df = rif_carica_file(sorgente)
+    if df is None:
+        raise ValueError("Errore lettura file sorgente. Verifica il formato.")
+    wb = load_workbook(modello)
+    ws = wb.worksheets[0]
+    rif_step1_anagrafica(df, ws, data_test)
+    rif_step2_salti(df, ws, data_test)
+    rif_step3_rj(df, ws, data_test)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# --- MOTORI ---
+
+def motore_riferimento(dati, nome, date, modello):
+    """Pipeline congelata (vedi sopra): ogni data da zero. {data: bytes}."""
+    return {d: rif_elabora(_buffer(dati, nome), modello, d) for d in date}
+
+
+def motore_pipeline(dati, nome, date, modello):
+    """Pipeline attuale di main.py, ogni data da zero senza indice delle sessioni né cache."""
+    return {
+        d: main.esegui_elaborazione_atleta(_buffer(dati, nome), modello, d)["output"]
+        for d in date
+    }
+
+
+def motore_indice(dati, nome, date, modello):
+    """Export letto e indicizzato una volta (tabelle tipizzate), ogni data sul modello appena caricato."""
+    sorgente = _buffer(dati, nome)
+    df = main.carica_file_universale(sorgente)
+    indice = sessioni.indicizza_sessioni(df) if df is not None else None
+    return {
+        d: main.esegui_elaborazione_atleta(sorgente, modello, d, indice=indice, df_sorgente=df)["output"]
+        for d in date
+    }
+
+
+def motore_incrementale(dati, nome, date, modello):
+    """Come nella pagina Athletic Data: indice, modello in cache e step memorizzati tra una data e l'altra."""
+    sorgente = _buffer(dati, nome)
+    df = main.carica_file_universale(sorgente)
+    indice = sessioni.indicizza_sessioni(df) if df is not None else None
+    passi = incrementale.CacheStep()
+    return {
+        d: main.esegui_elaborazione_atleta(sorgente, modello, d, indice=indice, df_sorgente=df, passi=passi)["output"]
+        for d in date
+    }
+
+
+MOTORI = {
+    "riferimento": motore_riferimento,
+    "pipeline": motore_pipeline,
+    "indice": motore_indice,
+    "incrementale": motore_incrementale,
+}
+
+
+def risolvi_motore(nome):
+    """Motore per nome (MOTORI) oppure 'modulo:funzione' importabile."""
+    if nome in MOTORI:
+        return MOTORI[nome]
+    modulo, sep, funzione = nome.partition(":")
+    if not sep:
+        raise ValueError(f"Motore '{nome}' sconosciuto: usare {', '.join(MOTORI)} oppure 'modulo:funzione'")
+    return getattr(importlib.import_module(modulo), funzione)
+
+
+# --- CONFRONTO ---
+
+def _valore(valore):
+    """Valore confrontabile: le formule matrice (ArrayFormula e simili) diventano testo e intervallo."""
+    if hasattr(valore, "text"):
+        return f"{getattr(valore, 'ref', '')}:{valore.text}"
+    return valore
+
+
+def celle_workbook(dati):
+    """{foglio: {coordinata: (tipo, valore, formato)}} delle celle con un valore o un formato non 'General'."""
+    wb = load_workbook(io.BytesIO(dati))
+    fogli = {}
+    for ws in wb.worksheets:
+        celle = {}
+        for cella in ws._cells.values():
+            if cella.value is None and cella.number_format == "General":
+                continue
+            celle[cella.coordinate] = (type(cella.value).__name__, _valore(cella.value), cella.number_format)
+        fogli[ws.title] = celle
+    return fogli
+
+
+def _uguali(a, b):
+    if a == b:
+        return True
+    # NaN è diverso da sé stesso ma due NaN sono la stessa cella
+    return (a[0], a[2]) == (b[0], b[2]) and isinstance(a[1], float) and isinstance(b[1], float) \
+        and math.isnan(a[1]) and math.isnan(b[1])
+
+
+def confronta_workbook(atteso, ottenuto):
+    """Differenze cella per cella tra due workbook (bytes): lista di (foglio, coordinata, atteso, ottenuto)."""
+    fogli_attesi, fogli_ottenuti = celle_workbook(atteso), celle_workbook(ottenuto)
+    differenze = []
+    for foglio in fogli_attesi.keys() | fogli_ottenuti.keys():
+        if foglio not in fogli_ottenuti or foglio not in fogli_attesi:
+            differenze.append((foglio, "-", "presente" if foglio in fogli_attesi else "assente",
+                               "presente" if foglio in fogli_ottenuti else "assente"))
+            continue
+        a, o = fogli_attesi[foglio], fogli_ottenuti[foglio]
+        for coordinata in a.keys() | o.keys():
+            cella_a, cella_o = a.get(coordinata), o.get(coordinata)
+            if cella_a is None or cella_o is None or not _uguali(cella_a, cella_o):
+                differenze.append((foglio, coordinata, cella_a, cella_o))
+    return sorted(differenze, key=lambda d: (d[0], d[1]))
+
+
+# --- CORPUS ---
+
+def raccogli_corpus(percorsi):
+    """Path degli export (file indicati e file delle cartelle, senza sottocartelle), in ordine."""
+    trovati = []
+    for percorso in percorsi:
+        if os.path.isdir(percorso):
+            trovati.extend(
+                os.path.join(percorso, f) for f in sorted(os.listdir(percorso))
+                if f.lower().endswith(ESTENSIONI) and not f.startswith((".", "~$"))
+            )
+        else:
+            trovati.append(percorso)
+    return trovati
+
+
+def date_riferimento(dati, nome):
+    """Sessioni dell'export secondo il riferimento congelato (lettura e scansione senza main.py)."""
+    df = rif_carica_file(_buffer(dati, nome))
+    return rif_date_sessioni(df) if df is not None else []
+
+
+def date_candidato(dati, nome):
+    """Sessioni dell'export secondo la pipeline attuale (quelle offerte nella pagina)."""
+    df = main.carica_file_universale(_buffer(dati, nome))
+    return sessioni.indicizza_sessioni(df).date if df is not None else []
+
+
+def campiona_date(date, max_date=None):
+    """Tutte le date o max_date distribuite uniformemente, sempre con prima e ultima."""
+    if max_date and len(date) > max_date:
+        passo = (len(date) - 1) / max(max_date - 1, 1)
+        date = sorted({date[round(i * passo)] for i in range(max_date)})
+    return date
+
+
+def cronometra(motore, dati, nome, date, modello, ripetizioni):
+    """(output dell'ultima esecuzione, tempo migliore in secondi)."""
+    migliore, output = float("inf"), None
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        output = motore(dati, nome, date, modello)
+        migliore = min(migliore, time.perf_counter() - inizio)
+    return output, migliore
+
+
+def verifica_file(path, riferimento, candidato, modello, ripetizioni=1, max_date=None):
+    """Esito della verifica di un export: date, tempi, differenze per data."""
+    nome = os.path.basename(path)
+    with open(path, "rb") as f:
+        dati = f.read()
+    # Le date da confrontare vengono dal riferimento: una data persa o fusa dal caricamento o
+    # dall'indice attuale deve risultare una differenza, non una data mai verificata
+    tutte = date_riferimento(dati, nome)
+    date = campiona_date(tutte, max_date)
+    esito = {"file": nome, "date": len(date), "differenze": {}, "errore": None}
+    if not date:
+        esito["errore"] = "nessuna sessione trovata"
+        return esito
+    trovate = set(date_candidato(dati, nome))
+    for d in sorted(set(tutte) ^ trovate):
+        esito["differenze"][d] = [("-", "sessione", "presente" if d in tutte else "assente",
+                                   "presente" if d in trovate else "assente")]
+    try:
+        attesi, esito["tempo_riferimento"] = cronometra(riferimento, dati, nome, date, modello, ripetizioni)
+        ottenuti, esito["tempo_candidato"] = cronometra(candidato, dati, nome, date, modello, ripetizioni)
+    except Exception as e:
+        esito["errore"] = f"{type(e).__name__}: {e}"
+        return esito
+    for d in date:
+        if d not in ottenuti:
+            esito["differenze"].setdefault(d, []).append(("-", "-", "output", "assente"))
+            continue
+        differenze = confronta_workbook(attesi[d], ottenuti[d])
+        if differenze:
+            esito["differenze"].setdefault(d, []).extend(differenze)
+    return esito
+
+
+def stampa_esito(esito):
+    if esito["errore"]:
+        print(f"ERRORE  {esito['file']}: {esito['errore']}")
+        return
+    rapporto = esito["tempo_riferimento"] / esito["tempo_candidato"] if esito["tempo_candidato"] > 0 else float("inf")
+    n_celle = sum(len(v) for v in esito["differenze"].values())
+    stato = "OK     " if not n_celle else "DIVERSO"
+    print(f"{stato} {esito['file']:<55} {esito['date']:>3} date  "
+          f"rif {esito['tempo_riferimento']:>8.3f}s  cand {esito['tempo_candidato']:>8.3f}s  x{rapporto:.2f}")
+    mostrate = 0
+    for d, differenze in esito["differenze"].items():
+        print(f"    {d.isoformat()}: {len(differenze)} celle diverse")
+        for foglio, coordinata, atteso, ottenuto in differenze:
+            if mostrate >= MAX_DIFFERENZE_MOSTRATE:
+                break
+            print(f"      {foglio}!{coordinata}: atteso {atteso} ottenuto {ottenuto}")
+            mostrate += 1
+
+
+def main_equivalenza():
+    parser = argparse.ArgumentParser(description="Verifica che un motore di elaborazione produca le stesse celle del riferimento.")
+    parser.add_argument("--corpus", nargs="*", default=[], help="File o cartelle di export reali")
+    parser.add_argument("--sintetici", type=int, nargs="*", default=[], help="Salti degli export sintetici da generare")
+    parser.add_argument("--formati", nargs="+", default=["xlsx", "csv-semicolon"], choices=list(genera_export.FORMATI),
+                        help="Formati degli export sintetici")
+    parser.add_argument("--riferimento", default="riferimento", help="Motore di riferimento")
+    parser.add_argument("--candidato", default="incrementale", help="Motore da verificare")
+    parser.add_argument("--max-date", type=int, default=None, help="Sessioni verificate per file (default: tutte)")
+    parser.add_argument("--ripetizioni", type=int, default=1, help="Esecuzioni per motore (vale il tempo migliore)")
+    parser.add_argument("--modello", default=os.path.join(CARTELLA_PROGETTO, main.FILE_MODELLO_DEFAULT))
+    args = parser.parse_args()
+
+    riferimento, candidato = risolvi_motore(args.riferimento), risolvi_motore(args.candidato)
+    corpus = raccogli_corpus(args.corpus)
+    if args.sintetici:
+        cartella = tempfile.mkdtemp(prefix="chronojump_equivalenza_")
+        for n_salti in args.sintetici:
+            n_date = min(max(n_salti // 200, 1), 50)
+            corpus.extend(genera_export.genera_file(cartella, n_salti, n_date, 1, args.formati))
+    if not corpus:
+        parser.error("corpus vuoto: indicare --corpus e/o --sintetici")
+
+    print(f"{args.candidato} contro {args.riferimento}, {len(corpus)} file "
+          f"({datetime.now().isoformat(timespec='seconds')})")
+    esiti = []
+    for path in corpus:
+        esito = verifica_file(path, riferimento, candidato, args.modello, args.ripetizioni, args.max_date)
+        stampa_esito(esito)
+        esiti.append(esito)
+
+    validi = [e for e in esiti if not e["errore"]]
+    diversi = [e for e in validi if e["differenze"]]
+    if validi:
+        totale_rif = sum(e["tempo_riferimento"] for e in validi)
+        totale_cand = sum(e["tempo_candidato"] for e in validi)
+        print(f"\nTotale: {len(validi) - len(diversi)}/{len(esiti)} file identici, "
+              f"rif {totale_rif:.3f}s  cand {totale_cand:.3f}s  x{totale_rif / max(totale_cand, 1e-9):.2f}")
+    sys.exit(1 if diversi or len(validi) < len(esiti) else 0)
+
+
+if __name__ == "__main__":
+    main_equivalenza()
@@ -0,0 +1,210 @@
+"""
+Indicizzazione incrementale degli export cumulativi di Chronojump.
+
+Ogni export di un atleta contiene tutte le sessioni precedenti più le nuove: i salti nuovi sono
+aggiunti in fondo alla tabella salti (prima della sezione RJ) e i blocchi RJ nuovi in fondo al
+file. Per ogni atleta resta in memoria una filigrana dell'ultimo export indicizzato: l'impronta
+di ogni riga (pd.util.hash_pandas_object, sul testo delle celle come le chiavi di
+incrementale.py) e il suo IndiceSessioni.
+Al caricamento successivo le impronte del nuovo export sono allineate a quelle della filigrana.
+Se il nuovo export è il precedente con righe inserite in un punto e righe aggiunte in fondo,
+vengono convertite e raggruppate per data solo le righe nuove: righe, conteggi e colonne
+tipizzate delle sessioni già presenti sono ripresi dall'indice precedente (spostati delle righe
+inserite), e solo le date toccate dalle righe nuove vengono ricontate.
+In ogni altro caso (righe modificate o tolte, nuove intestazioni, colonne diverse) l'export è
+indicizzato da zero con sessioni.indicizza_sessioni: il risultato è sempre lo stesso indice.
+
+Le filigrane sono artefatti di un GovernatoreMemoria (pseudo-sessione SESSIONE_FILIGRANE), quindi
+rientrano nel suo budget e sono espulse per prime se non usate da tempo.
+"""
+import numpy as np
+import pandas as pd
+
+import intestazioni
+import salti
+import sessioni
+
+# Pseudo-sessione del governatore della memoria sotto cui sono registrate le filigrane
+SESSIONE_FILIGRANE = "filigrane"
+
+
+class Filigrana:
+    """Ultimo export indicizzato di un atleta: impronte delle righe, tipi delle colonne e indice."""
+
+    __slots__ = ("impronte", "tipi", "indice")
+
+    def __init__(self, impronte, tipi, indice):
+        self.impronte = impronte  # uint64 per riga (vedi impronte_righe)
+        self.tipi = tipi          # dtype delle colonne: un export csv e uno xlsx non sono confrontabili
+        self.indice = indice
+
+    @property
+    def nbytes(self):
+        """Stima per il governatore della memoria: impronte e array dell'indice."""
+        indice = self.indice
+        byte = self.impronte.nbytes
+        if indice.tabella_salti is not None:
+            byte += int(indice.tabella_salti.memory_usage(deep=True).sum())
+        if indice.colonne_rj is not None:
+            byte += indice.colonne_rj.nbytes
+        for per_data in (indice.righe_salti_per_data or {}, indice.righe_rj_per_data):
+            byte += sum(righe.nbytes for righe in per_data.values())
+        return byte
+
+
+def impronte_righe(df):
+    """Impronta a 64 bit di ogni riga dell'export (stesso testo delle celle, stessa impronta)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def tipi_colonne(df):
+    return tuple(str(t) for t in df.dtypes)
+
+
+def chiave_atleta(valori):
+    """
+    'ID nome' dell'atleta dalla riga sotto l'intestazione anagrafica, cercata sopra la tabella
+    salti; None se l'export non ha tabella salti o anagrafica.
+    """
+    trovate = intestazioni.riconosci(valori, ("anagrafica", "salti"))
+    riga_header, col_map = trovate.anagrafica
+    if riga_header == -1 or riga_header + 1 >= trovate.salti[0]:
+        return None
+    atleta = valori[riga_header + 1]
+    return f'{str(atleta[col_map["id"]]).strip()} {str(atleta[col_map["nome"]]).strip()}'
+
+
+def allinea(vecchie, nuove):
+    """
+    (inizio, inserite) se le impronte nuove sono le vecchie con 'inserite' righe aggiunte alla
+    posizione 'inizio' ed eventualmente altre in fondo; None altrimenti.
+    """
+    n_vecchie, n_nuove = len(vecchie), len(nuove)
+    if n_nuove < n_vecchie:
+        return None
+    diverse = np.flatnonzero(vecchie != nuove[:n_vecchie])
+    if not len(diverse):
+        return n_vecchie, n_nuove - n_vecchie
+    inizio = int(diverse[0])
+    coda = vecchie[inizio:]
+    # Le righe vecchie dopo 'inizio' ricompaiono tutte, spostate delle righe inserite
+    for spostamento in np.flatnonzero(nuove[inizio:inizio + n_nuove - n_vecchie + 1] == coda[0]):
+        if np.array_equal(nuove[inizio + spostamento:inizio + spostamento + len(coda)], coda):
+            return inizio, int(spostamento)
+    return None
+
+
+def _unisci(parti):
+    """Unione di più {data: posizioni}: posizioni della stessa data riunite in ordine."""
+    blocchi = {}
+    for parte in parti:
+        for d, righe in parte.items():
+            blocchi.setdefault(d, []).append(righe)
+    return {d: b[0] if len(b) == 1 else np.sort(np.concatenate(b)) for d, b in blocchi.items()}
+
+
+def aggiorna_indice(df, valori, filigrana, impronte):
+    """
+    IndiceSessioni di df ricavato dall'indice della filigrana, indicizzando solo le righe nuove.
+    None se df non è l'export della filigrana con righe aggiunte (va indicizzato da zero).
+    """
+    vecchio = filigrana.indice
+    if filigrana.tipi != tipi_colonne(df) or vecchio.tabella_salti is None:
+        return None
+    allineamento = allinea(filigrana.impronte, impronte)
+    if allineamento is None:
+        return None
+    inizio, inserite = allineamento
+    n_vecchie, n = vecchio.forma[0], len(df)
+    if inserite == 0 and n == n_vecchie:
+        return vecchio
+    # Prima riga della tabella salti: deve precedere le righe inserite (stessa intestazione)
+    inizio_tabella = n_vecchie - len(vecchio.tabella_salti)
+    if inizio_tabella > inizio:
+        return None
+
+    fine_spostate = n_vecchie + inserite
+    nuove = [(a, b) for a, b in ((inizio, inizio + inserite), (fine_spostate, n)) if b > a]
+    idx_tipo, idx_data = vecchio.intestazioni.rj
+    # Un'intestazione RJ tra le righe nuove cambierebbe le colonne lette (o la sezione stessa)
+    for a, b in nuove:
+        if (a < fine_spostate or idx_tipo == -1) and sessioni.trova_colonne_rj(valori[a:b])[0] != -1:
+            return None
+
+    def sposta(righe):
+        return np.where(righe < inizio, righe, righe + inserite)
+
+    # --- Tabella salti: tratti già tipizzati e righe nuove ---
+    _, col_map = vecchio.intestazioni.salti
+    taglio = inizio - inizio_tabella
+    tratti = [vecchio.tabella_salti.iloc[:taglio]]
+    if inserite:
+        tratti.append(salti.tabella_tipizzata(df.iloc[inizio:inizio + inserite], col_map))
+    tratti.append(vecchio.tabella_salti.iloc[taglio:])
+    if n > fine_spostate:
+        tratti.append(salti.tabella_tipizzata(df.iloc[fine_spostate:], col_map))
+    tabella = pd.concat([t.drop(columns="Tipo") for t in tratti])
+    # Categorie ricalcolate sull'intera colonna, come in tabella_tipizzata
+    tabella.insert(0, "Tipo", pd.concat([t["Tipo"].astype(str) for t in tratti]).astype("category"))
+    tabella.index = df.index[inizio_tabella:]
+
+    # --- Righe salti per data: solo le date delle righe nuove vengono ricontate ---
+    righe_salti_per_data, salti_per_data = None, dict(vecchio.salti_per_data)
+    if vecchio.righe_salti_per_data is not None:
+        parti_nuove = []
+        for a, b in nuove:
+            testi = df.iloc[a:b, col_map["data"]].astype(str).str.strip()
+            parti_nuove.append({d: righe + a for d, righe in sessioni.righe_per_data(testi).items()})
+        righe_salti_per_data = _unisci(
+            [{d: sposta(righe) for d, righe in vecchio.righe_salti_per_data.items()}] + parti_nuove
+        )
+        tipi = tabella["Tipo"].to_numpy(dtype=object)
+        altezze = tabella["Altezza"].to_numpy()
+        for d in {d for parte in parti_nuove for d in parte}:
+            conteggi = sessioni.conta_salti(tipi, altezze, righe_salti_per_data[d] - inizio_tabella)
+            if conteggi:
+                salti_per_data[d] = conteggi
+            else:
+                salti_per_data.pop(d, None)
+
+    # --- Righe RJ per data e colonne dei blocchi RJ ---
+    righe_rj_per_data = {d: sposta(righe) for d, righe in vecchio.righe_rj_per_data.items()}
+    rj_per_data = dict(vecchio.rj_per_data)
+    if idx_tipo != -1 and idx_data != -1:
+        parti_rj = []
+        for a, b in nuove:
+            righe_nuove, sessioni_nuove = sessioni.righe_rj_per_data(valori[a:b], idx_tipo, idx_data)
+            parti_rj.append({d: righe + a for d, righe in righe_nuove.items()})
+            for d, n_rj in sessioni_nuove.items():
+                rj_per_data[d] = rj_per_data.get(d, 0) + n_rj
+        righe_rj_per_data = _unisci([righe_rj_per_data] + parti_rj)
+    colonne_rj = None
+    if vecchio.colonne_rj is not None:
+        tratti_rj = [vecchio.colonne_rj.tratto(0, inizio)]
+        if inserite:
+            tratti_rj.append(salti.ColonneRJ.da_valori(valori[inizio:inizio + inserite]))
+        tratti_rj.append(vecchio.colonne_rj.tratto(inizio, n_vecchie))
+        if n > fine_spostate:
+            tratti_rj.append(salti.ColonneRJ.da_valori(valori[fine_spostate:]))
+        colonne_rj = salti.ColonneRJ.concatena(tratti_rj)
+
+    return sessioni.IndiceSessioni(df.shape, righe_salti_per_data, salti_per_data, righe_rj_per_data, rj_per_data,
+                                   tabella, colonne_rj, vecchio.intestazioni)
+
+
+def indicizza(df, governatore):
+    """
+    IndiceSessioni dell'export: incrementale rispetto all'ultimo export dello stesso atleta
+    registrato nel governatore, altrimenti da zero. La filigrana viene poi aggiornata.
+    """
+    valori = df.to_numpy(dtype=object)
+    chiave = chiave_atleta(valori)
+    if chiave is None:
+        return sessioni.indicizza_sessioni(df)
+    impronte = impronte_righe(df)
+    precedente = governatore.prendi(SESSIONE_FILIGRANE, chiave)
+    indice = aggiorna_indice(df, valori, precedente, impronte) if precedente is not None else None
+    if indice is None:
+        indice = sessioni.indicizza_sessioni(df)
+    governatore.registra(SESSIONE_FILIGRANE, chiave, Filigrana(impronte, tipi_colonne(df), indice), "sorgente")
+    return indice
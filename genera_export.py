@@ -0,0 +1,214 @@
+"""
+Generatore di export Chronojump sintetici (per test e benchmark).
+
+Ogni file contiene:
+- il blocco anagrafica (riga 'ID' / 'Nome' + riga atleta)
+- la tabella salti 'Tipo' / 'Altezza' con le serie standard (ABK, CMJ, SJ, slCMJ, DJa per caduta, SJl per carico)
+- i blocchi RJ con intestazione 'Tipo di salto', sigle, righe AVG/MAX/SD e dati numerati
+
+Esempio:
+    python genera_export.py --salti 10000 --date 20 --atleti 5 --formati xlsx csv-semicolon numbers
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+# Serie ripetute in ogni sessione: (tipo, caduta, peso)
+SERIE_SESSIONE = [
+    ("ABK", None, None),
+    ("CMJ", None, None),
+    ("ABK", None, None),
+    ("CMJ", None, None),
+    ("SJ", None, None),
+    ("slCMJleft", None, None),
+    ("slCMJright", None, None),
+    ("DJa", 30, None),
+    ("DJa", 45, None),
+    ("DJa", 60, None),
+    ("DJa", 75, None),
+    ("DJa", 90, None),
+    ("DJa", 105, None),
+    ("SJl", None, 20),
+    ("SJl", None, 40),
+    ("SJl", None, 60),
+    ("SJl", None, 80),
+]
+
+# Altezza media (cm) per tipo di salto
+ALTEZZA_MEDIA = {"ABK": 38.0, "CMJ": 34.0, "SJ": 30.0, "slCMJleft": 16.0, "slCMJright": 16.5, "DJa": 28.0, "SJl": 22.0}
+
+COGNOMI = ["Rossi", "Bianchi", "Ferrari", "Esposito", "Romano", "Colombo", "Ricci", "Marino", "Greco", "Bruno"]
+NOMI = ["Marco", "Luca", "Giulia", "Sara", "Andrea", "Chiara", "Matteo", "Elena", "Paolo", "Marta"]
+
+INTESTAZIONE_ATLETA = ["ID", "Nome", "Data di nascita", "Altezza", "Sesso", "Peso",
+                       "lunghezza gamba", "altezza dei fianchi durante flessione SJ"]
+INTESTAZIONE_SALTI = ["Data", "Tipo", "Altezza", "TC", "TV", "Caduta", "Peso Kg"]
+INTESTAZIONE_RJ = ["Data", "Tipo di salto", "Limite", "Salti", "Note"]
+SIGLE_RJ = ["N", "TC", "TV", "Altezza", "RSI"]
+
+# Formati supportati: estensione e separatore CSV
+FORMATI = {
+    "xlsx": (".xlsx", None),
+    "csv-comma": (".csv", ","),
+    "csv-semicolon": (".csv", ";"),
+    "csv-tab": (".csv", "\t"),
+    "numbers": (".numbers", None),
+}
+
+
+def date_sessioni(n_date, data_inizio):
+    """Date delle sessioni: una a settimana a partire da data_inizio."""
+    return [data_inizio + timedelta(days=7 * k) for k in range(n_date)]
+
+
+def genera_righe_export(n_salti, n_date=1, n_salti_rj=None, atleta=0, seed=0,
+                        data_inizio=datetime(2024, 1, 8, 9, 0)):
+    """
+    Restituisce le righe (liste di valori Python) di un export Chronojump sintetico.
+    - n_salti: salti totali della tabella 'Tipo' / 'Altezza', distribuiti sulle n_date sessioni
+    - n_salti_rj: salti RJ totali (default n_salti // 5), in blocchi da 10-20 salti per sessione
+    Le altezze sono float; la conversione in stringhe con virgola è compito dello scrittore.
+    """
+    rnd = random.Random(seed * 7919 + atleta)
+    if n_salti_rj is None:
+        n_salti_rj = n_salti // 5
+    date = date_sessioni(max(n_date, 1), data_inizio)
+    fattore_atleta = rnd.uniform(0.85, 1.15)
+
+    righe = [
+        INTESTAZIONE_ATLETA,
+        [1000 + atleta, f"{COGNOMI[atleta % len(COGNOMI)]} {NOMI[(atleta // len(COGNOMI)) % len(NOMI)]}",
+         f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/{rnd.randint(1990, 2008)}",
+         round(rnd.uniform(160, 200), 1), rnd.choice(["M", "F"]), round(rnd.uniform(55, 95), 1),
+         rnd.randint(85, 105), rnd.randint(50, 70)],
+        [],
+        INTESTAZIONE_SALTI,
+    ]
+
+    # --- Tabella salti ---
+    for d_idx, data in enumerate(date):
+        quota = n_salti // len(date) + (1 if d_idx < n_salti % len(date) else 0)
+        ora = data
+        k_serie = 0
+        while quota > 0:
+            tipo, caduta, peso = SERIE_SESSIONE[k_serie % len(SERIE_SESSIONE)]
+            n = min(rnd.randint(3, 5), quota)
+            media = ALTEZZA_MEDIA[tipo] * fattore_atleta * (1 - (peso or 0) / 250)
+            for _ in range(n):
+                altezza = round(max(rnd.gauss(media, 2.0), 1.0), 2)
+                tc = round(rnd.uniform(0.15, 0.30), 3) if tipo == "DJa" else None
+                tv = round((2 * altezza / 100 / 9.81) ** 0.5 * 2, 3)
+                righe.append([ora, tipo, altezza, tc, tv, caduta, peso])
+                ora += timedelta(seconds=30)
+            quota -= n
+            k_serie += 1
+
+    # --- Blocchi RJ ---
+    righe.append([])
+    righe.append(INTESTAZIONE_RJ)
+    for d_idx, data in enumerate(date):
+        quota = n_salti_rj // len(date) + (1 if d_idx < n_salti_rj % len(date) else 0)
+        while quota > 0:
+            n = min(rnd.randint(10, 20), quota)
+            salti = []
+            for _ in range(n):
+                tc = round(rnd.uniform(0.14, 0.25), 3)
+                altezza = round(max(rnd.gauss(30 * fattore_atleta, 3.0), 1.0), 2)
+                tv = round((2 * altezza / 100 / 9.81) ** 0.5 * 2, 3)
+                salti.append((tc, tv, altezza, round(altezza / 100 / tc, 3)))
+            righe.append([data, "RJ(unlimited)", "Unlimited", n, ""])
+            righe.append(SIGLE_RJ)
+            for etichetta, funz in (("AVG", lambda v: sum(v) / len(v)), ("MAX", max)):
+                righe.append([etichetta] + [round(funz([s[j] for s in salti]), 3) for j in range(4)])
+            righe.append(["SD", "", "", "", ""])
+            for k, s in enumerate(salti):
+                righe.append([k + 1, *s])
+            righe.append([])
+            quota -= n
+
+    return righe
+
+
+def _testo(val, decimale):
+    """Formatta un valore per CSV: virgola decimale se richiesta, date come testo."""
+    if val is None:
+        return ""
+    if isinstance(val, datetime):
+        return val.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(val, float) and decimale == ",":
+        return repr(val).replace(".", ",")
+    return str(val)
+
+
+def scrivi_export(righe, path, formato):
+    """Scrive le righe nel formato richiesto (vedi FORMATI). Le righe sono completate alla stessa larghezza."""
+    larghezza = max(len(r) for r in righe)
+    righe = [list(r) + [None] * (larghezza - len(r)) for r in righe]
+
+    if formato == "xlsx":
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Export")
+        for r in righe:
+            ws.append(r)
+        wb.save(path)
+
+    elif formato.startswith("csv"):
+        sep = FORMATI[formato][1]
+        # Con separatore virgola i decimali restano col punto (come l'export inglese)
+        decimale = "." if sep == "," else ","
+        with open(path, "w", newline="", encoding="latin1") as f:
+            writer = csv.writer(f, delimiter=sep)
+            for r in righe:
+                writer.writerow([_testo(v, decimale) for v in r])
+
+    elif formato == "numbers":
+        from numbers_parser import Document
+        doc = Document(num_header_rows=0, num_header_cols=0, num_rows=len(righe), num_cols=larghezza)
+        table = doc.sheets[0].tables[0]
+        for i, r in enumerate(righe):
+            for j, v in enumerate(r):
+                if v is not None and v != "":
+                    table.write(i, j, _testo(v, ",") if isinstance(v, (datetime, float)) else v)
+        doc.save(path)
+
+    else:
+        raise ValueError(f"Formato non supportato: {formato}")
+    return path
+
+
+def genera_file(cartella, n_salti, n_date=1, n_atleti=1, formati=("xlsx",), n_salti_rj=None, seed=0):
+    """Genera un file per atleta e per formato. Restituisce la lista dei path creati."""
+    os.makedirs(cartella, exist_ok=True)
+    creati = []
+    for atleta in range(n_atleti):
+        righe = genera_righe_export(n_salti, n_date, n_salti_rj, atleta=atleta, seed=seed)
+        for formato in formati:
+            estensione = FORMATI[formato][0]
+            nome = f"export_a{atleta:03d}_{n_salti}salti_{n_date}date_{formato}{estensione}"
+            creati.append(scrivi_export(righe, os.path.join(cartella, nome), formato))
+    return creati
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera export Chronojump sintetici.")
+    parser.add_argument("--salti", type=int, default=1000, help="Salti della tabella Tipo/Altezza per atleta (100 - 1.000.000)")
+    parser.add_argument("--salti-rj", type=int, default=None, help="Salti RJ totali per atleta (default: salti / 5)")
+    parser.add_argument("--date", type=int, default=1, help="Numero di sessioni (date) per atleta")
+    parser.add_argument("--atleti", type=int, default=1, help="Numero di atleti (un file per atleta)")
+    parser.add_argument("--formati", nargs="+", default=["xlsx"], choices=list(FORMATI))
+    parser.add_argument("--output-dir", default=None, help="Cartella di destinazione (default: cartella temporanea)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cartella = args.output_dir or tempfile.mkdtemp(prefix="chronojump_export_")
+    for path in genera_file(cartella, args.salti, args.date, args.atleti, args.formati, args.salti_rj, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
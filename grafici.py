@@ -0,0 +1,120 @@
+"""
+Grafici interattivi della pagina 'Report' (plotly).
+
+- figura_pre_post / figura_variazioni: PRIMA/DOPO e variazione % di ogni metrica del report appena
+  generato (un atleta, poche decine di barre)
+- figura_squadra: andamento di una metrica dello storico per tutti gli atleti. I dati vengono
+  ridotti lato server prima di arrivare al browser: la linea di tendenza (mediana e quartili per
+  data) è calcolata su tutti i valori, i punti del grafico a dispersione (WebGL) sono al massimo
+  MAX_PUNTI_DISPERSIONE, scelti in modo uniforme e deterministico per data.
+Le funzioni ricevono dati già pronti e restituiscono figure: la cache è di chi le chiama.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Punti massimi del grafico a dispersione della squadra (oltre: campione uniforme per data)
+MAX_PUNTI_DISPERSIONE = 4000
+
+COLORE_PRIMA = "#9DA5B4"
+COLORE_DOPO = "#1F77B4"
+COLORE_CALO = "#FF0000"       # stessi colori del report Excel
+COLORE_AUMENTO = "#00B050"
+
+
+def _layout(fig, titolo, altezza):
+    fig.update_layout(
+        title=titolo, height=altezza, margin=dict(l=10, r=10, t=50, b=10),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, x=0),
+    )
+    return fig
+
+
+def figura_pre_post(preview_data):
+    """Barre PRIMA/DOPO affiancate per ogni metrica del report (preview_data di genera_report_comparativo)."""
+    test = [r["Test"] for r in preview_data]
+    fig = go.Figure([
+        go.Bar(name="PRIMA", x=test, y=[r["PRIMA"] for r in preview_data], marker_color=COLORE_PRIMA),
+        go.Bar(name="DOPO", x=test, y=[r["DOPO"] for r in preview_data], marker_color=COLORE_DOPO),
+    ])
+    fig.update_layout(barmode="group", xaxis_tickangle=-45)
+    return _layout(fig, "Valori PRIMA / DOPO", 420)
+
+
+def figura_variazioni(preview_data):
+    """Variazione % per metrica (PercRaw), rossa se in calo e verde altrimenti; esclude le metriche senza PRE."""
+    righe = [r for r in preview_data if r["Diff %"] != ""]
+    perc = np.array([r["PercRaw"] for r in righe], dtype=float)
+    fig = go.Figure(go.Bar(
+        x=perc, y=[r["Test"] for r in righe], orientation="h",
+        marker_color=np.where(perc < 0, COLORE_CALO, COLORE_AUMENTO).tolist(),
+        text=[r["Diff %"] for r in righe], textposition="outside",
+        hovertemplate="%{y}: %{x:.1f}%<extra></extra>",
+    ))
+    fig.update_yaxes(autorange="reversed")
+    fig.update_xaxes(ticksuffix="%", zeroline=True)
+    return _layout(fig, "Variazione % (DOPO rispetto a PRIMA)", max(300, 24 * len(righe) + 80))
+
+
+def tendenza_per_data(serie):
+    """Mediana, quartili e numero di atleti per data di una serie (colonne data_test, valore)."""
+    gruppi = serie.groupby("data_test", sort=True)["valore"]
+    return pd.DataFrame({
+        "mediana": gruppi.median(),
+        "q1": gruppi.quantile(0.25),
+        "q3": gruppi.quantile(0.75),
+        "atleti": gruppi.size(),
+    }).reset_index()
+
+
+def riduci_punti(serie, max_punti=MAX_PUNTI_DISPERSIONE):
+    """
+    Al massimo max_punti righe della serie, con la stessa quota per ogni data (in proporzione ai
+    suoi valori) e scelte a passo costante: stesso risultato a ogni chiamata.
+    """
+    if len(serie) <= max_punti:
+        return serie
+    quota = max_punti / len(serie)
+    scelte = []
+    for _, gruppo in serie.groupby("data_test", sort=True):
+        n = max(1, int(round(len(gruppo) * quota)))
+        scelte.append(gruppo.iloc[np.linspace(0, len(gruppo) - 1, n).round().astype(np.int64)])
+    return pd.concat(scelte)
+
+
+def figura_squadra(serie, titolo, atleta_evidenziato=None, max_punti=MAX_PUNTI_DISPERSIONE):
+    """
+    Andamento di una metrica per la squadra (colonne atleta, data_test, valore): punti WebGL
+    (ridotti), fascia interquartile e mediana per data; l'atleta scelto come linea a parte.
+    """
+    serie = serie.dropna(subset=["valore"])
+    tendenza = tendenza_per_data(serie)
+    punti = riduci_punti(serie, max_punti)
+    date = pd.to_datetime(tendenza["data_test"])
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=date, y=tendenza["q3"], mode="lines", line=dict(width=0), hoverinfo="skip", showlegend=False,
+    ))
+    fig.add_trace(go.Scatter(
+        x=date, y=tendenza["q1"], mode="lines", line=dict(width=0), fill="tonexty",
+        fillcolor="rgba(31,119,180,0.15)", name="25°-75° percentile", hoverinfo="skip",
+    ))
+    fig.add_trace(go.Scattergl(
+        x=pd.to_datetime(punti["data_test"]), y=punti["valore"], mode="markers", name="Atleti",
+        marker=dict(size=6, color=COLORE_PRIMA, opacity=0.6), text=punti["atleta"],
+        hovertemplate="%{text}<br>%{x|%d/%m/%Y}: %{y:.2f}<extra></extra>",
+    ))
+    fig.add_trace(go.Scatter(
+        x=date, y=tendenza["mediana"], mode="lines+markers", name="Mediana", line=dict(color=COLORE_DOPO, width=3),
+        customdata=tendenza["atleti"], hovertemplate="%{x|%d/%m/%Y}: mediana %{y:.2f} (%{customdata} atleti)<extra></extra>",
+    ))
+    if atleta_evidenziato:
+        propri = serie[serie["atleta"] == atleta_evidenziato]
+        fig.add_trace(go.Scatter(
+            x=pd.to_datetime(propri["data_test"]), y=propri["valore"], mode="lines+markers", name=atleta_evidenziato,
+            line=dict(color=COLORE_CALO, width=2),
+        ))
+    if len(punti) < len(serie):
+        titolo += f" · {len(punti)} di {len(serie)} punti mostrati"
+    return _layout(fig, titolo, 460)
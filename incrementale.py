@@ -0,0 +1,223 @@
+"""
+Rielaborazione incrementale della pipeline 'Athletic Data'.
+
+I tre step leggono parti diverse dell'export e scrivono celle diverse del modello:
+- step 1: riga dell'atleta sotto l'intestazione 'ID' -> celle dell'anagrafica e data
+- step 2: righe della tabella salti della data -> celle dei salti (REGISTRO_SALTI)
+- step 3: blocchi RJ della data -> celle RJ
+Ogni step viene eseguito su un FoglioPatch, che registra le scritture invece di modificare il
+modello. Il risultato (patch delle celle, eventi, conteggi) è memorizzato con l'impronta degli
+input reali dello step. Alla richiesta successiva della sessione, se gli input di uno step sono
+gli stessi, il suo risultato viene riusato. Il modello già caricato resta in memoria e vengono
+riscritte solo le celle degli step il cui risultato è cambiato.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import sessioni
+
+STEP = ("anagrafica", "salti", "rj")
+
+# Risultati memorizzati per step (più date della stessa sessione restano disponibili)
+RISULTATI_PER_STEP = 16
+
+
+class CellaPatch:
+    """Cella registrata: value e number_format scritti dallo step (solo quelli assegnati)."""
+
+    __slots__ = ("attributi",)
+
+    def __init__(self, attributi):
+        object.__setattr__(self, "attributi", attributi)
+
+    def __setattr__(self, nome, valore):
+        if nome not in ("value", "number_format"):
+            raise AttributeError(f"Attributo di cella non supportato dalla patch: {nome}")
+        self.attributi[nome] = valore
+
+    def __getattr__(self, nome):
+        try:
+            return self.attributi[nome]
+        except KeyError:
+            raise AttributeError(nome)
+
+
+class FoglioPatch:
+    """Sostituto del worksheet per gli step: ws.cell(row=, column=) registra le scritture."""
+
+    def __init__(self):
+        self.patch = {}   # (riga, colonna) -> {"value": ..., "number_format": ...}
+
+    def cell(self, row, column):
+        return CellaPatch(self.patch.setdefault((row, column), {}))
+
+
+class RisultatoStep:
+    """Esito memorizzato di uno step: patch delle celle, eventi del registro e conteggi."""
+
+    __slots__ = ("chiave", "patch", "eventi", "conteggi")
+
+    def __init__(self, chiave, patch, eventi, conteggi):
+        self.chiave = chiave
+        self.patch = patch
+        self.eventi = eventi
+        self.conteggi = conteggi
+
+
+def _impronta_righe(valori, righe):
+    """Impronta delle righe indicate come le vedono gli step (testo di ogni cella)."""
+    h = hashlib.sha1()
+    for r in righe:
+        h.update(f"{r}\x1e".encode())
+        h.update("\x1f".join(str(v) for v in valori[r]).encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def firma_modello(modello):
+    """(firma, byte) del modello: contenuto per i buffer, path/data di modifica/dimensione per i file."""
+    if hasattr(modello, "getvalue"):
+        dati = modello.getvalue()
+        return hashlib.sha1(dati).hexdigest(), len(dati)
+    stato = os.stat(modello)
+    return (os.path.abspath(modello), stato.st_mtime_ns, stato.st_size), stato.st_size
+
+
+def _is_number(val):
+    try:
+        float(str(val).replace(',', '.').strip())
+        return True
+    except ValueError:
+        return False
+
+
+def chiave_anagrafica(valori, data, piano):
+    """Input dello step 1: intestazione 'ID' e riga dell'atleta."""
+    riga_header, _ = sessioni.trova_intestazione_anagrafica(valori)
+    righe = [] if riga_header == -1 else [r for r in (riga_header, riga_header + 1) if r < len(valori)]
+    return ("anagrafica", hash(piano), data, _impronta_righe(valori, righe))
+
+
+def chiave_salti(valori, data, piano, indice=None):
+    """Input dello step 2: intestazione della tabella salti e righe della data."""
+    riga_header, col_map = indice.intestazioni.salti if indice is not None else sessioni.trova_tabella_salti(valori)
+    if riga_header == -1:
+        righe = []
+    else:
+        righe = indice.righe_salti(data) if indice is not None else None
+        if righe is None:
+            if "data" in col_map:
+                # Stesso filtro dello step 2 (vedi sessioni.righe_per_data)
+                testi = pd.Series(valori[riga_header + 1:, col_map["data"]], dtype=object).astype(str).str.strip()
+                righe = np.asarray(sessioni.righe_per_data(testi).get(data, []), dtype=np.int64) + riga_header + 1
+            else:
+                righe = range(riga_header + 1, len(valori))
+        righe = [riga_header] + [int(r) for r in righe]
+    return ("salti", hash(piano), data, _impronta_righe(valori, righe))
+
+
+def chiave_rj(valori, data, piano, indice=None):
+    """Input dello step 3: righe RJ della data e blocchi che le seguono (sigle, SD, dati)."""
+    idx_tipo, idx_data = indice.intestazioni.rj if indice is not None else sessioni.trova_colonne_rj(valori)
+    righe = []
+    if idx_tipo != -1:
+        if indice is not None:
+            candidate = indice.righe_rj(data)
+        elif idx_data != -1:
+            candidate = [
+                r for r in sessioni.righe_rj_candidate(valori, idx_tipo)
+                if data in sessioni.date_riga_rj(valori[r, idx_data])
+            ]
+        else:
+            candidate = []
+        n = len(valori)
+        for i in candidate:
+            i = int(i)
+            fine = i + 5
+            while fine < n and _is_number(valori[fine, 0]):
+                fine += 1
+            righe.extend(range(i, min(fine, n)))
+    return ("rj", hash(piano), data, idx_tipo, idx_data, _impronta_righe(valori, sorted(set(righe))))
+
+
+class CacheStep:
+    """
+    Stato incrementale di una sessione: risultati memorizzati per step, modello già caricato
+    e patch attualmente applicate al suo primo foglio.
+    Un'elaborazione per volta (lock): gli step successivi riusano lo stesso workbook.
+    """
+
+    def __init__(self, per_step=RISULTATI_PER_STEP):
+        self.lock = threading.Lock()
+        self.per_step = per_step
+        self.risultati = {step: OrderedDict() for step in STEP}
+        self.wb = None
+        self.firma_modello = None
+        self.byte_modello = 0
+        self.originali = {}   # (riga, colonna) -> (value, number_format) del modello
+        self.applicati = {}   # step -> RisultatoStep applicato al workbook
+        self.immagini = []    # (immagine, bytes) dei fogli del modello
+
+    def cerca(self, step, chiave):
+        risultati = self.risultati[step]
+        risultato = risultati.get(chiave)
+        if risultato is not None:
+            risultati.move_to_end(chiave)
+        return risultato
+
+    def memorizza(self, step, risultato):
+        risultati = self.risultati[step]
+        risultati[risultato.chiave] = risultato
+        while len(risultati) > self.per_step:
+            risultati.popitem(last=False)
+
+    def imposta_modello(self, wb, firma, byte_modello=0):
+        """Nuovo modello: le patch andranno riapplicate tutte (i risultati restano validi)."""
+        self.wb = wb
+        self.firma_modello = firma
+        self.byte_modello = byte_modello
+        self.originali = {}
+        self.applicati = {}
+        # openpyxl chiude il file di ogni immagine quando salva: i dati restano qui per i salvataggi successivi
+        self.immagini = [(img, img._data()) for foglio in wb.worksheets for img in foglio._images]
+
+    def prepara_salvataggio(self):
+        """Immagini del modello di nuovo leggibili: il workbook in cache può essere salvato più volte."""
+        for img, dati in self.immagini:
+            img.ref = io.BytesIO(dati)
+
+    def applica(self, ws, risultati):
+        """
+        Porta il foglio allo stato 'modello + patch degli step in ordine' riscrivendo solo le
+        celle degli step cambiati rispetto all'ultima applicazione. Restituisce le celle scritte.
+        """
+        cambiati = [step for step in STEP if self.applicati.get(step) is not risultati[step]]
+        celle = set()
+        for step in cambiati:
+            celle.update(risultati[step].patch)
+            if step in self.applicati:
+                celle.update(self.applicati[step].patch)
+
+        for riga, colonna in sorted(celle):
+            cella = ws.cell(row=riga, column=colonna)
+            valore, formato = self.originali.setdefault((riga, colonna), (cella.value, cella.number_format))
+            for step in STEP:
+                scritti = risultati[step].patch.get((riga, colonna), {})
+                valore = scritti.get("value", valore)
+                formato = scritti.get("number_format", formato)
+            cella.value = valore
+            if cella.number_format != formato:
+                cella.number_format = formato
+
+        self.applicati = dict(risultati)
+        return len(celle)
+
+    @property
+    def nbytes(self):
+        """Stima per il governatore della memoria: il workbook caricato pesa circa 4 volte il file."""
+        return 4 * self.byte_modello
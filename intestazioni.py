@@ -0,0 +1,149 @@
+"""
+Intestazioni degli export Chronojump in italiano, inglese e spagnolo.
+
+ALIAS elenca per ogni campo letto dalla pipeline i testi di intestazione accettati, già
+normalizzati come le celle confrontate (strip e minuscole). La tabella è compilata una volta
+in un indice {testo: codice del campo}. Le celle non sono confrontate una per una: di ogni
+blocco di righe vengono normalizzati solo i valori distinti di tipo testo, tradotti in codici
+con una sola ricerca nell'indice; una riga è un'intestazione quando i suoi codici coprono i
+campi richiesti (vedi RICHIESTI). Le righe sono lette a blocchi crescenti e la lettura si ferma
+appena tutte le intestazioni cercate sono state trovate.
+
+La mappa delle colonne di un'intestazione ha come chiavi il testo delle sue celle e il nome
+italiano dei campi riconosciuti (es. 'Height' -> 'height' e 'altezza'): gli step leggono le
+chiavi italiane, le regole dell'anagrafica anche le proprie etichette e alias.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Campo (nome italiano, chiave della mappa delle colonne) -> intestazioni accettate
+ALIAS = {
+    # Anagrafica
+    "id": ("id",),
+    "nome": ("nome", "name", "nombre"),
+    "data di nascita": ("data di nascita", "date of birth", "birth date", "birthdate", "fecha de nacimiento"),
+    "sesso": ("sesso", "sex", "gender", "sexo", "género", "genero"),
+    "peso": ("peso", "weight"),
+    "lunghezza gamba": ("lunghezza gamba", "leg length", "longitud de pierna", "longitud pierna"),
+    "altezza dei fianchi durante flessione sj": (
+        "altezza dei fianchi durante flessione sj", "hips height on sj flexion", "hip height on sj flexion",
+        "hips height during sj flexion", "hip height during sj flexion", "altura de cadera en flexión sj",
+        "altura de cadera en flexion sj", "altura de la cadera en flexión sj", "altura de la cadera en flexion sj",
+    ),
+    "nome persona": ("nome persona", "person name", "nombre persona", "nombre de la persona"),
+    # Tabella salti (anche 'altezza' e 'peso')
+    "data": ("data", "date", "fecha"),
+    "tipo": ("tipo", "type"),
+    "altezza": ("altezza", "height", "altura"),
+    "tc": ("tc", "contact time", "tiempo de contacto"),
+    "caduta": ("caduta", "fall", "fall height", "caída", "caida", "altura de caída", "altura de caida"),
+    "peso kg": ("peso kg", "peso (kg)", "weight kg", "weight (kg)"),
+    # Sezione RJ
+    "tipo di salto": ("tipo di salto", "jump type", "tipo de salto"),
+}
+
+# Campi che identificano ogni intestazione (tutti presenti nella stessa riga)
+RICHIESTI = {
+    "anagrafica": ("id", "nome"),
+    "salti": ("tipo", "altezza"),
+    "rj": ("tipo di salto",),
+}
+
+# Controlli 'blandi' (testo contenuto nella cella): colonne della riga RJ e sigle dei blocchi
+PAROLE = {
+    "tipo di salto": ALIAS["tipo di salto"],
+    "data": ALIAS["data"],
+    "sigla tc": ("tc", "contact", "time", "contacto", "tiempo"),
+    "sigla altezza": ("altezza", "height", "h ", "altura"),
+    "sigla rsi": ("rsi", "reactive", "index", "reactivo", "índice", "indice"),
+}
+
+# Righe del primo blocco letto (i blocchi successivi raddoppiano)
+BLOCCO_RIGHE = 64
+
+CAMPI = tuple(ALIAS)
+_TESTI = pd.Index([testo for campo in CAMPI for testo in ALIAS[campo]])
+# Codice del campo di ogni testo (0 = nessun campo) e bit del campo nelle maschere di riga
+_CODICI = np.array([0] + [k + 1 for k, campo in enumerate(CAMPI) for _ in ALIAS[campo]], dtype=np.int64)
+_BIT = np.array([0] + [1 << k for k in range(len(CAMPI))], dtype=np.int64)
+_RICHIESTI = {nome: sum(1 << CAMPI.index(c) for c in campi) for nome, campi in RICHIESTI.items()}
+_PAROLE = {chiave: re.compile("|".join(map(re.escape, parole))) for chiave, parole in PAROLE.items()}
+
+
+def normalizza(valore):
+    return str(valore).strip().lower()
+
+
+def contiene(testo, chiave):
+    """True se il testo (normalizzato) contiene una delle PAROLE della chiave."""
+    return _PAROLE[chiave].search(testo) is not None
+
+
+def maschere_righe(valori):
+    """Bit dei campi presenti in ogni riga (array di oggetti)."""
+    posizioni, distinti = pd.factorize(valori.ravel())
+    # Solo i testi possono essere intestazioni: numeri e date non vengono convertiti
+    testi = [v.strip().lower() if isinstance(v, str) else "" for v in distinti]
+    # Un bit nullo in fondo per le celle vuote (posizione -1 di factorize)
+    bit = np.append(_BIT[_CODICI[_TESTI.get_indexer(testi) + 1]], 0)
+    return np.bitwise_or.reduce(bit[posizioni].reshape(valori.shape), axis=1)
+
+
+def prime_righe(valori, cercate=tuple(RICHIESTI)):
+    """{intestazione: prima riga che la contiene} per le intestazioni cercate; -1 se assente."""
+    trovate = {nome: -1 for nome in cercate}
+    inizio, blocco = 0, BLOCCO_RIGHE
+    while inizio < len(valori) and -1 in trovate.values():
+        maschere = maschere_righe(valori[inizio:inizio + blocco])
+        for nome, riga in trovate.items():
+            if riga == -1:
+                righe = np.flatnonzero((maschere & _RICHIESTI[nome]) == _RICHIESTI[nome])
+                if len(righe):
+                    trovate[nome] = inizio + int(righe[0])
+        inizio += blocco
+        blocco *= 2
+    return trovate
+
+
+def mappa_colonne(riga):
+    """Mappa delle colonne di una riga d'intestazione: testo delle celle e nomi italiani dei campi."""
+    testi = [normalizza(x) for x in riga]
+    mappa = {testo: idx for idx, testo in enumerate(testi)}
+    for idx, codice in enumerate(_CODICI[_TESTI.get_indexer(testi) + 1]):
+        if codice and CAMPI[codice - 1] not in testi:
+            mappa[CAMPI[codice - 1]] = idx
+    return mappa
+
+
+def colonne_rj(riga):
+    """(idx_tipo, idx_data) dell'intestazione RJ: ultime celle che contengono 'tipo di salto' e 'data'."""
+    idx_tipo = idx_data = -1
+    for idx, testo in enumerate(normalizza(x) for x in riga):
+        if contiene(testo, "tipo di salto"): idx_tipo = idx
+        if contiene(testo, "data"): idx_data = idx
+    return idx_tipo, idx_data
+
+
+class Intestazioni:
+    """Intestazioni riconosciute in un export: (riga, mappa) di anagrafica e salti, (idx_tipo, idx_data) RJ."""
+
+    __slots__ = ("anagrafica", "salti", "rj")
+
+    def __init__(self, anagrafica=(-1, {}), salti=(-1, {}), rj=(-1, -1)):
+        self.anagrafica = anagrafica
+        self.salti = salti
+        self.rj = rj
+
+
+def riconosci(valori, cercate=tuple(RICHIESTI)):
+    """Intestazioni dell'export (array di oggetti) in una sola lettura; quelle non cercate restano assenti."""
+    righe = prime_righe(valori, cercate)
+    intestazioni = Intestazioni()
+    for nome in ("anagrafica", "salti"):
+        if righe.get(nome, -1) != -1:
+            setattr(intestazioni, nome, (righe[nome], mappa_colonne(valori[righe[nome]])))
+    if righe.get("rj", -1) != -1:
+        intestazioni.rj = colonne_rj(valori[righe["rj"]])
+    return intestazioni
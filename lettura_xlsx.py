@@ -0,0 +1,199 @@
+"""
+Lettura in streaming del primo foglio di un file XLSX.
+
+pd.read_excel(header=None) apre il file con openpyxl in sola lettura, ma quando il foglio non
+dichiara le proprie dimensioni (come negli export Chronojump) openpyxl lo scorre una volta in
+più solo per calcolarle, e poi crea un oggetto cella con un dizionario di attributi per ogni
+valore. Qui l'XML del foglio viene letto una sola volta, riga per riga, e ogni riga diventa
+subito la lista dei suoi valori; la lettura si ferma alla fine di <sheetData>.
+
+Il DataFrame restituito è identico a quello di pd.read_excel(header=None): gli step indirizzano
+le celle per posizione, quindi restano le stesse posizioni, gli stessi valori (interi, float,
+testo, datetime, NaN per celle vuote ed errori) e la stessa inferenza dei tipi per colonna.
+Metadati del workbook (stringhe condivise, stili data, epoca 1900/1904) vengono da openpyxl,
+anche da sue parti interne (ExcelReader, wb._date_formats, valid_files): openpyxl è vincolato in
+requirements.txt e un XLSX che qui non si riesce a leggere va segnalato (vedi NonXlsx).
+"""
+import zipfile
+
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.styles.stylesheet import apply_stylesheet
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from openpyxl.cell.text import Text
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+_ROW = f"{{{SHEET_MAIN_NS}}}row"
+_SHEET_DATA = f"{{{SHEET_MAIN_NS}}}sheetData"
+_V = f"{{{SHEET_MAIN_NS}}}v"
+_IS = f"{{{SHEET_MAIN_NS}}}is"
+_T = f"{{{SHEET_MAIN_NS}}}t"
+
+_ERRORE = object()  # cella di tipo errore: diventa NaN come in read_excel
+
+
+class NonXlsx(ValueError):
+    """Il sorgente non è un archivio XLSX (CSV, .numbers, .xls...): non è un errore di lettura."""
+
+
+def _verifica_archivio(sorgente):
+    if not zipfile.is_zipfile(sorgente):
+        raise NonXlsx("Il file non è un archivio zip")
+    if hasattr(sorgente, "seek"):
+        sorgente.seek(0)
+    with zipfile.ZipFile(sorgente) as archivio:
+        if "[Content_Types].xml" not in archivio.namelist():
+            raise NonXlsx("Archivio zip senza [Content_Types].xml")
+    if hasattr(sorgente, "seek"):
+        sorgente.seek(0)
+
+
+class _Foglio:
+    """Primo foglio di lavoro e metadati del workbook necessari a decodificare le celle."""
+
+    def __init__(self, sorgente):
+        _verifica_archivio(sorgente)
+        lettore = ExcelReader(sorgente, read_only=True, data_only=True, keep_links=False)
+        lettore.read_manifest()
+        lettore.read_strings()
+        lettore.read_workbook()
+        apply_stylesheet(lettore.archive, lettore.wb)
+
+        self.archivio = lettore.archive
+        self.stringhe = lettore.shared_strings
+        self.epoca = lettore.wb.epoch
+        self.formati_data = lettore.wb._date_formats
+        self.formati_durata = lettore.wb._timedelta_formats
+        self.percorso = None
+        # Stesso foglio di read_excel(sheet_name=0): il primo worksheet (i chartsheet non contano)
+        for _, rel in lettore.parser.find_sheets():
+            if rel.target in lettore.valid_files and "chartsheet" not in rel.Type:
+                self.percorso = rel.target
+                break
+        if self.percorso is None:
+            raise ValueError("Nessun foglio di lavoro nel file")
+
+    def _testo(self, elemento_is):
+        figli = list(elemento_is)
+        if len(figli) == 1 and figli[0].tag == _T and figli[0].text is not None:
+            return figli[0].text
+        return Text.from_tree(elemento_is).content
+
+    def _valore(self, c):
+        """Valore di una cella come lo restituisce read_excel ('' = vuota, _ERRORE = errore)."""
+        tipo = c.get('t', 'n')
+        if tipo == 'inlineStr':
+            elemento_is = c.find(_IS)
+            return "" if elemento_is is None else self._testo(elemento_is)
+
+        v = c.findtext(_V)
+        if not v:
+            return ""
+        if tipo == 'n':
+            numero = float(v) if ('.' in v or 'E' in v or 'e' in v) else int(v)
+            stile = c.get('s')
+            if stile and int(stile) in self.formati_data:
+                try:
+                    return from_excel(numero, self.epoca, timedelta=int(stile) in self.formati_durata)
+                except (OverflowError, ValueError):
+                    return _ERRORE
+            # Numeri interi come int (es. 30.0 -> 30), gli altri come float
+            intero = int(numero)
+            return intero if intero == numero else float(numero)
+        if tipo == 's':
+            return self.stringhe[int(v)]
+        if tipo == 'b':
+            return bool(int(v))
+        if tipo == 'e':
+            return _ERRORE
+        if tipo == 'd':
+            return from_ISO8601(v)
+        return v  # 'str' (risultato testuale di una formula) e tipi non previsti
+
+    def righe(self):
+        """Righe del foglio come liste di valori (colonna A = indice 0), comprese quelle vuote."""
+        colonne = {}
+        contatore_righe = 0
+        with self.archivio.open(self.percorso) as src:
+            contenitore = None
+            for evento, elemento in iterparse(src, events=("start", "end")):
+                tag = elemento.tag
+                if evento == "start":
+                    if tag == _SHEET_DATA:
+                        contenitore = elemento
+                    continue
+                if tag == _SHEET_DATA:
+                    break
+                if tag != _ROW:
+                    continue
+                # Le righe già lette non restano appese all'albero XML
+                if contenitore is not None:
+                    contenitore.remove(elemento)
+
+                r = elemento.get('r')
+                indice = (int(float(r)) if r else contatore_righe + 1)
+                # Righe assenti nell'XML: vuote; righe fuori ordine: ignorate (come openpyxl)
+                while contatore_righe + 1 < indice:
+                    contatore_righe += 1
+                    yield []
+                if indice <= contatore_righe:
+                    continue
+                contatore_righe = indice
+
+                celle = []
+                colonna = 0
+                for c in elemento:
+                    coord = c.get('r')
+                    if coord:
+                        lettere = coord.rstrip("0123456789")
+                        colonna = colonne.get(lettere)
+                        if colonna is None:
+                            colonna = colonne[lettere] = column_index_from_string(lettere)
+                    else:
+                        colonna += 1
+                    celle.append((colonna, self._valore(c)))
+
+                if not celle:
+                    yield []
+                    continue
+                # La larghezza è data dall'ultima cella della riga
+                valori = [""] * celle[-1][0]
+                for colonna, valore in celle:
+                    if colonna <= len(valori):
+                        valori[colonna - 1] = valore
+                yield valori
+
+
+def leggi_primo_foglio(sorgente):
+    """
+    Legge il primo foglio di un XLSX (path o file-like) in un DataFrame senza intestazioni,
+    identico a pd.read_excel(sorgente, header=None). Solleva NonXlsx se il file non è un XLSX.
+    """
+    foglio = _Foglio(sorgente)
+    try:
+        dati = []
+        ultima_piena = -1
+        for valori in foglio.righe():
+            while valori and valori[-1] == "":
+                valori.pop()
+            if valori:
+                ultima_piena = len(dati)
+            dati.append([float("nan") if v is _ERRORE else v for v in valori]
+                        if _ERRORE in valori else valori)
+    finally:
+        foglio.archivio.close()
+
+    # Fine dei dati usati: via le righe vuote in coda, righe completate alla larghezza massima
+    dati = dati[:ultima_piena + 1]
+    if not dati:
+        return pd.DataFrame()
+    larghezza = max(len(riga) for riga in dati)
+    for riga in dati:
+        if len(riga) < larghezza:
+            riga.extend([""] * (larghezza - len(riga)))
+
+    # Stesso parser usato da read_excel: celle '' -> NaN e tipo di ogni colonna
+    return TextParser(dati, header=None, skip_blank_lines=False).read()
@@ -1,17 +1,38 @@
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Color
-from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
 import os
+import sys
 import warnings
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import io
+import contextlib
 import traceback
 import tempfile
 from numbers_parser import Document
 import plotly.express as px
 import plotly.graph_objects as go
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import anteprime
+import caricamento_report
+import filigrana
+import grafici
+import incrementale
+import intestazioni
+import lettura_xlsx
+import memoria
+import regole
+import salti
+import sessioni
+import storico
+import strumentazione
 
 # Ignora avvisi non critici
 warnings.filterwarnings("ignore")
@@ -20,104 +41,97 @@ warnings.filterwarnings("ignore")
 # Questi rimangono come default o fallback
 FILE_SORGENTE_DEFAULT = "Allenamento.xlsx"
 FILE_MODELLO_DEFAULT = "excel.xlsx"
-
-# --- CONFIGURAZIONE REGOLA SALTI ---
-CONFIG_ANAGRAFICA = [
-    # { "etichetta": "Data", "cella": "F2" }, # RIMOSSO: La data viene gestita esternamente
-    { "etichetta": "Data di nascita", "cella": "B2" },
-    { "etichetta": "Altezza", "cella": "C3" },
-    { "etichetta": "Sesso", "cella": "G2" },
-    { "etichetta": "Peso", "cella": "C4" },
-    { "etichetta": "lunghezza gamba", "cella": "E5" },
-    { "etichetta": "altezza dei fianchi durante flessione SJ", "cella": "E6" }
+FILE_REPORT_DEFAULT = "report.xlsx"
+
+# --- CONFIGURAZIONE ELABORAZIONE IN BACKGROUND ---
+# Numero di elaborazioni eseguibili in parallelo dal processo (condiviso tra tutte le sessioni)
+WORKER_ELABORAZIONE = int(os.environ.get("CHRONOJUMP_WORKER", "2"))
+
+# Stadi di avanzamento della pipeline (etichetta, frazione completata)
+STADI_PIPELINE = [
+    ("In coda", 0.0),
+    ("File caricato", 0.2),
+    ("Step 1 completato", 0.4),
+    ("Step 2 completato", 0.6),
+    ("Step 3 completato", 0.8),
+    ("File salvato", 1.0),
 ]
 
-REGISTRO_SALTI = [
-    # 1. PRIMA SERIE ABK
-    {
-        "tipo": "ABK", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["F9", "G9", "H9"]}]
-    },
-    # 2. PRIMA SERIE CMJ
-    {
-        "tipo": "CMJ", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["F10", "G10", "H10"]}]
-    },
-    # 3. SECONDA SERIE ABK (Se esiste)
-    {
-        "tipo": "ABK", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["F12", "G12", "H12"]}]
-    },
-    # 4. SECONDA SERIE CMJ (Se esiste)
-    {
-        "tipo": "CMJ", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["F13", "G13", "H13"]}]
-    },
-    # 5. SJ
-    {
-        "tipo": "SJ", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["S15", "T15", "U15"]}]
-    },
-    # 6. slCMJ Left
-    {
-        "tipo": "slCMJleft", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["F16", "G16", "H16"]}]
-    },
-    # 7. slCMJ Right
-    {
-        "tipo": "slCMJright", "discriminante": None,
-        "outputs": [{"dato": "Altezza", "celle": ["F15", "G15", "H15"]}]
-    },
-
-    # --- DJa (DROP JUMPS) ---
-    {
-        "tipo": "DJa", "discriminante": ("Caduta", 30),
-        "outputs": [{"dato": "Altezza", "celle": ["P4", "Q4", "R4"]}, {"dato": "TC", "celle": ["T4", "U4", "V4"]}]
-    },
-    {
-        "tipo": "DJa", "discriminante": ("Caduta", 45),
-        "outputs": [{"dato": "Altezza", "celle": ["P5", "Q5", "R5"]}, {"dato": "TC", "celle": ["T5", "U5", "V5"]}]
-    },
-    {
-        "tipo": "DJa", "discriminante": ("Caduta", 60),
-        "outputs": [{"dato": "Altezza", "celle": ["P6", "Q6", "R6"]}, {"dato": "TC", "celle": ["T6", "U6", "V6"]}]
-    },
-    {
-        "tipo": "DJa", "discriminante": ("Caduta", 75),
-        "outputs": [{"dato": "Altezza", "celle": ["P7", "Q7", "R7"]}, {"dato": "TC", "celle": ["T7", "U7", "V7"]}]
-    },
-    {
-        "tipo": "DJa", "discriminante": ("Caduta", 90),
-        "outputs": [{"dato": "Altezza", "celle": ["P8", "Q8", "R8"]}, {"dato": "TC", "celle": ["T8", "U8", "V8"]}]
-    },
-    {
-        "tipo": "DJa", "discriminante": ("Caduta", 105),
-        "outputs": [{"dato": "Altezza", "celle": ["P9", "Q9", "R9"]}, {"dato": "TC", "celle": ["T9", "U9", "V9"]}]
-    },
-
-    # --- SJl (SJI - SALTI CON CARICO) ---
-    # Logica dinamica: prende le serie SJl in ordine di comparsa nel file
-    {
-        "tipo": "SJl", "discriminante": None,
-        "weight_output": "R16",
-        "outputs": [{"dato": "Altezza", "celle": ["S16", "T16", "U16"]}]
-    },
-    {
-        "tipo": "SJl", "discriminante": None,
-        "weight_output": "R17",
-        "outputs": [{"dato": "Altezza", "celle": ["S17", "T17", "U17"]}]
-    },
-    {
-        "tipo": "SJl", "discriminante": None,
-        "weight_output": "R18",
-        "outputs": [{"dato": "Altezza", "celle": ["S18", "T18", "U18"]}]
-    },
-    {
-        "tipo": "SJl", "discriminante": None,
-        "weight_output": "R19",
-        "outputs": [{"dato": "Altezza", "celle": ["S19", "T19", "U19"]}]
-    }
-]
+# Livello minimo degli eventi registrati durante l'elaborazione (dettaglio, info, successo, avviso, errore)
+LIVELLO_LOG_DEFAULT = os.environ.get("CHRONOJUMP_LIVELLO_LOG", "dettaglio")
+
+# --- CONFIGURAZIONE REGOLE ---
+# Mappature delle celle (anagrafica, salti, RJ, report) in regole.json, compilate da regole.carica_piano()
+
+# --- REGISTRO EVENTI ---
+# Livelli in ordine crescente di importanza
+LIVELLI_EVENTI = {"dettaglio": 10, "info": 20, "successo": 25, "avviso": 30, "errore": 40}
+ICONE_EVENTI = {"dettaglio": "·", "info": "ℹ️", "successo": "✅", "avviso": "⚠️", "errore": "❌"}
+
+
+class RegistroEventi:
+    """
+    Log strutturato in memoria degli step di elaborazione.
+    Gli step registrano eventi (livello, step, messaggio) invece di scrivere direttamente con st.*:
+    la UI decide poi cosa mostrare, e le esecuzioni senza interfaccia non emettono nulla.
+    """
+
+    def __init__(self, livello_minimo="dettaglio", attivo=True):
+        self.soglia = LIVELLI_EVENTI[livello_minimo]
+        self.attivo = attivo
+        self.eventi = []
+
+    def registra(self, livello, messaggio, step=""):
+        if not self.attivo or LIVELLI_EVENTI[livello] < self.soglia:
+            return
+        self.eventi.append((livello, step, messaggio))
+
+    def dettaglio(self, messaggio, step=""): self.registra("dettaglio", messaggio, step)
+    def info(self, messaggio, step=""): self.registra("info", messaggio, step)
+    def successo(self, messaggio, step=""): self.registra("successo", messaggio, step)
+    def avviso(self, messaggio, step=""): self.registra("avviso", messaggio, step)
+    def errore(self, messaggio, step=""): self.registra("errore", messaggio, step)
+
+    def filtra(self, livello_minimo="dettaglio"):
+        soglia = LIVELLI_EVENTI[livello_minimo]
+        return [e for e in self.eventi if LIVELLI_EVENTI[e[0]] >= soglia]
+
+    def conteggi(self):
+        conteggi = {}
+        for livello, _, _ in self.eventi:
+            conteggi[livello] = conteggi.get(livello, 0) + 1
+        return conteggi
+
+    def testo(self, livello_minimo="dettaglio"):
+        righe = []
+        for livello, step, messaggio in self.filtra(livello_minimo):
+            prefisso = f"[{step}] " if step else ""
+            righe.append(f"{ICONE_EVENTI[livello]} {prefisso}{messaggio}")
+        return "\n".join(righe)
+
+
+# Registro disattivato usato quando il chiamante non ne fornisce uno (esecuzioni headless)
+REGISTRO_NULLO = RegistroEventi(attivo=False)
+
+
+def mostra_registro_eventi(registro, chiave="livello_log_athletic"):
+    """Riepilogo compatto del registro: errori in evidenza, dettaglio completo su richiesta."""
+    for _, step, messaggio in registro.filtra("errore"):
+        st.error(f"[{step}] {messaggio}" if step else messaggio)
+
+    riepilogo = [
+        f"- {ICONE_EVENTI[livello]} {messaggio}"
+        for livello, _, messaggio in registro.eventi if livello in ("info", "successo")
+    ]
+    n_avvisi = registro.conteggi().get("avviso", 0)
+    if n_avvisi:
+        riepilogo.append(f"- {ICONE_EVENTI['avviso']} {n_avvisi} avvisi (vedi log completo)")
+    if riepilogo:
+        st.markdown("\n".join(riepilogo))
+
+    with st.expander(f"📋 Log elaborazione ({len(registro.eventi)} eventi)", expanded=False):
+        livello = st.selectbox("Livello minimo", list(LIVELLI_EVENTI), index=0, key=chiave)
+        st.code(registro.testo(livello) or "Nessun evento.", language=None)
 
 
 def custom_round(val, decimals=0):
@@ -142,7 +156,53 @@ def custom_round(val, decimals=0):
         return val
 
 
-def carica_file_universale(uploaded_file):
+def arrotonda_colonna(valori, decimali=0):
+    """
+    Versione vettoriale di custom_round su array numpy / Series (stessa semantica):
+    - .5 arrotonda sempre per eccesso, troncando verso zero come int()
+    - decimali può essere un intero o un array (uno per valore)
+    - NaN e inf restano invariati
+    Restituisce un array float64.
+    """
+    moltiplicatore = 10.0 ** np.asarray(decimali, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.trunc(np.asarray(valori, dtype=float) * moltiplicatore + 0.5) / moltiplicatore
+
+
+def pulisci_colonna_numerica(valori):
+    """
+    Versione vettoriale della pulizia numerica del report: toglie testo e unità (kg, cm...),
+    converte la virgola in punto e restituisce un array float64. I valori non convertibili diventano 0.0.
+    """
+    # dtype object: le regex passano da re come nella versione per cella (\d include le cifre Unicode)
+    testo = pd.Series(valori, dtype=object).fillna("").astype(str).astype(object).str.strip()
+    testo = testo.str.replace(r'[^\d.,\-]', '', regex=True).str.replace(',', '.', regex=False)
+    # Dopo la pulizia restano solo cifre, punto e meno: valido solo un numero ben formato.
+    # astype(float) sulle stringhe passa da float() (pd.to_numeric può differire di 1 ulp)
+    valido = testo.str.fullmatch(r'-?(\d+\.?\d*|\.\d+)').to_numpy(dtype=bool)
+    numeri = np.zeros(len(testo))
+    numeri[valido] = testo[valido].astype(float).to_numpy()
+    return numeri
+
+
+def _leggi_excel(sorgente, registro=REGISTRO_NULLO):
+    """Primo foglio senza intestazioni: XLSX in streaming, altri formati Excel con pd.read_excel"""
+    try:
+        return lettura_xlsx.leggi_primo_foglio(sorgente)
+    except lettura_xlsx.NonXlsx as e:
+        registro.dettaglio(f"Non è un XLSX ({e}), provo pd.read_excel", "Caricamento")
+    except Exception as e:
+        # Un XLSX che il lettore in streaming non sa leggere: probabile openpyxl fuori dalla
+        # versione vincolata in requirements.txt. Segnalato anche nel log del server
+        messaggio = f"Lettura XLSX in streaming non riuscita ({type(e).__name__}: {e}), uso pd.read_excel"
+        registro.avviso(messaggio, "Caricamento")
+        print(messaggio, file=sys.stderr)
+    if hasattr(sorgente, "seek"):
+        sorgente.seek(0)
+    return pd.read_excel(sorgente, header=None)
+
+
+def carica_file_universale(uploaded_file, registro=REGISTRO_NULLO):
     """Carica file Excel o CSV da un oggetto file-like di Streamlit o path"""
     if uploaded_file is None:
         return None
@@ -150,9 +210,9 @@ def carica_file_universale(uploaded_file):
     # Se è una stringa (per retrocompatibilità o test locale), lo trattiamo come path
     if isinstance(uploaded_file, str):
         filepath = uploaded_file
-        print(f"Lettura file path: {filepath}")
+        registro.dettaglio(f"Lettura file path: {filepath}", "Caricamento")
         try:
-            return pd.read_excel(filepath, header=None)
+            return _leggi_excel(filepath, registro)
         except:
             pass
         for sep in [',', ';', '\t']:
@@ -165,11 +225,11 @@ def carica_file_universale(uploaded_file):
 
     # Altrimenti è un buffer di Streamlit
     filename = uploaded_file.name
-    print(f"Lettura buffer: {filename}")
+    registro.dettaglio(f"Lettura buffer: {filename}", "Caricamento")
 
     uploaded_file.seek(0)
     try:
-        df = pd.read_excel(uploaded_file, header=None)
+        df = _leggi_excel(uploaded_file, registro)
         uploaded_file.seek(0)
         return df
     except:
@@ -202,7 +262,7 @@ def carica_file_universale(uploaded_file):
                     os.remove(tmp_path)
                     
         except Exception as e:
-            print(f"Errore caricamento .numbers: {e}")
+            registro.avviso(f"Errore caricamento .numbers: {e}", "Caricamento")
 
     for sep in [',', ';', '\t']:
         try:
@@ -240,119 +300,75 @@ def trova_valore_cella(df, keywords):
     return ""
 
 
-def raggruppa_salti_per_serie(df_salti):
-    """Divide i salti in gruppi contigui."""
-    gruppi = []
-    if df_salti.empty: return gruppi
-
-    current_chunk = []
-    first_row = df_salti.iloc[0]
-    last_tipo = first_row['Tipo']
-    last_caduta = first_row['Caduta'] if 'Caduta' in df_salti.columns else -1
-    last_peso = first_row['Peso Kg'] if 'Peso Kg' in df_salti.columns else -1
-
-    for index, row in df_salti.iterrows():
-        curr_tipo = row['Tipo']
-        curr_caduta = row['Caduta'] if 'Caduta' in df_salti.columns else -1
-        curr_peso = row['Peso Kg'] if 'Peso Kg' in df_salti.columns else -1
-
-        cambio_serie = (curr_tipo != last_tipo) or \
-                       (abs(float(curr_caduta) - float(last_caduta)) > 0.1) or \
-                       (abs(float(curr_peso) - float(last_peso)) > 0.1)
-
-        if cambio_serie:
-            gruppi.append({
-                'tipo': last_tipo,
-                'caduta': last_caduta,
-                'peso': last_peso,
-                'data': pd.DataFrame(current_chunk)
-            })
-            current_chunk = []
-            last_tipo = curr_tipo
-            last_caduta = curr_caduta
-            last_peso = curr_peso
-
-        current_chunk.append(row)
-
-    if current_chunk:
-        gruppi.append({
-            'tipo': last_tipo,
-            'caduta': last_caduta,
-            'peso': last_peso,
-            'data': pd.DataFrame(current_chunk)
-        })
-
-    return gruppi
-
-
-def elabora_salti_cronologici(df, ws, data_selezionata):
-    """Elabora i salti e scrive nel worksheet."""
-    st.write("--- ESECUZIONE STEP 2 (ORDINE CRONOLOGICO) ---")
-
-    riga_header = -1
-    col_map = {}
-
-    for i, riga in df.iterrows():
-        riga_lista = [str(x).strip().lower() for x in riga.tolist()]
-        if "tipo" in riga_lista and "altezza" in riga_lista:
-            riga_header = i
-            for idx, val in enumerate(riga_lista): col_map[val] = idx
-            break
-
-    if riga_header == -1:
-        st.error("ERRORE: Tabella salti non trovata.")
-        return
-
-    df_data = df.iloc[riga_header + 1:].copy()
-
-    def get_col_values(nome_col):
-        if nome_col.lower() in col_map: return df_data.iloc[:, col_map[nome_col.lower()]]
+def estrai_id_atleta(df):
+    """Restituisce il valore della colonna 'ID' nella riga dell'atleta (o None)."""
+    riga_header, col_map = sessioni.trova_intestazione_anagrafica(df.to_numpy(dtype=object))
+    if riga_header == -1 or riga_header + 1 >= len(df):
         return None
+    val = str(df.iloc[riga_header + 1, col_map["id"]]).strip()
+    return val if val.lower() not in ["nan", "none", ""] else None
 
-    clean_df = pd.DataFrame()
-    clean_df['Tipo'] = get_col_values('Tipo').astype(str).str.strip()
-
-    raw_alt = get_col_values('Altezza')
-    clean_df['Altezza'] = pd.to_numeric(raw_alt.astype(str).str.replace(',', '.'), errors='coerce') if raw_alt is not None else 0.0
-
-    raw_tc = get_col_values('TC')
-    clean_df['TC'] = pd.to_numeric(raw_tc.astype(str).str.replace(',', '.'), errors='coerce') if raw_tc is not None else 0.0
 
-    raw_caduta = get_col_values('Caduta')
-    clean_df['Caduta'] = pd.to_numeric(raw_caduta.astype(str).str.replace(',', '.'), errors='coerce').fillna(-1) if raw_caduta is not None else -1
+def elabora_salti_cronologici(df, ws, data_selezionata, registro=REGISTRO_NULLO, indice=None):
+    """
+    Elabora i salti e scrive nel worksheet. Restituisce i conteggi di righe e gruppi.
+    Con un IndiceSessioni (vedi sessioni.py) le righe della data sono prese direttamente dall'indice.
+    """
+    STEP = "Step 2"
+    registro.dettaglio("--- ESECUZIONE STEP 2 (ORDINE CRONOLOGICO) ---", STEP)
 
-    raw_peso = get_col_values('Peso Kg')
-    if raw_peso is None: raw_peso = get_col_values('Peso')
-    clean_df['Peso Kg'] = pd.to_numeric(raw_peso.astype(str).str.replace(',', '.'), errors='coerce').fillna(-1) if raw_peso is not None else -1
+    # Intestazione già riconosciuta al caricamento (indice delle sessioni), altrimenti cercata ora
+    if indice is not None:
+        riga_header, col_map = indice.intestazioni.salti
+    else:
+        riga_header, col_map = sessioni.trova_tabella_salti(df.to_numpy(dtype=object))
 
-    # Filtraggio per data
-    raw_data = get_col_values('Data')
-    if raw_data is not None:
-        clean_df['Data_Originale'] = raw_data.astype(str).str.strip()
-        # Convertiamo la data selezionata in stringa per il confronto (formato YYYY-MM-DD)
-        # Il formato nel file potrebbe variare, proviamo a normalizzare
-        def confronta_date(data_file_str, data_selected):
-            try:
-                # Prova parsing standard
-                d_file = pd.to_datetime(data_file_str).date()
-                return d_file == data_selected
-            except:
-                # Fallback: confronto stringa parziale se fallisce il parsing
-                return str(data_selected) in data_file_str
+    if riga_header == -1:
+        registro.errore("ERRORE: Tabella salti non trovata.", STEP)
+        return {}
+
+    righe_data = indice.righe_salti(data_selezionata) if indice is not None else None
+    # Colonne già tipizzate al caricamento (indice delle sessioni), altrimenti convertite ora
+    clean_df = indice.salti_tipizzati(data_selezionata) if indice is not None else None
+    if clean_df is None:
+        if righe_data is not None:
+            # Solo le righe della sessione scelta, già note dall'indice
+            df_data = df.iloc[righe_data]
+        else:
+            df_data = df.iloc[riga_header + 1:]
+        clean_df = salti.tabella_tipizzata(df_data, col_map)
 
-        maschera_data = clean_df['Data_Originale'].apply(lambda x: confronta_date(x, data_selezionata))
-        clean_df = clean_df[maschera_data]
+    # Filtraggio per data (non serve se le righe arrivano dall'indice delle sessioni)
+    if "data" in col_map and righe_data is None:
+        # Parsing della data (fallback: confronto stringa parziale), una volta per valore distinto
+        raw_data = df.iloc[riga_header + 1:, col_map["data"]]
+        per_data = sessioni.righe_per_data(raw_data.astype(str).str.strip())
+        clean_df = clean_df.iloc[per_data.get(data_selezionata, [])]
 
     clean_df = clean_df.dropna(subset=['Altezza'])
 
-    gruppi_disponibili = raggruppa_salti_per_serie(clean_df)
-    st.info(f"Trovati {len(gruppi_disponibili)} gruppi di salti per la data {data_selezionata}.")
+    # Tabella compatta (array strutturato) e serie come intervalli di righe
+    tabella = salti.TabellaSalti.da_dataframe(clean_df)
+    del clean_df
+    gruppi_disponibili = salti.raggruppa_serie(tabella)
+    registro.info(f"Trovati {len(gruppi_disponibili)} gruppi di salti per la data {data_selezionata}.", STEP)
 
     gruppi_usati = [False] * len(gruppi_disponibili)
-
-    for regola in REGISTRO_SALTI:
-        tipo_req = regola['tipo']
-        discrim = regola['discriminante']
+    piano = regole.carica_piano()
+
+    # Arrotondamento half-up dell'intera colonna, una sola volta per (colonna, decimali)
+    colonne_arrotondate = {}
+    def colonna_arrotondata(nome_col, decimali):
+        if (nome_col, decimali) not in colonne_arrotondate:
+            valori = tabella.colonna(nome_col)
+            if decimali is not None:
+                valori = arrotonda_colonna(valori, decimali)
+            colonne_arrotondate[(nome_col, decimali)] = valori
+        return colonne_arrotondate[(nome_col, decimali)]
+
+    for regola in piano.salti:
+        tipo_req = regola.tipo
+        discrim = regola.discriminante
 
         gruppo_trovato = None
         idx_trovato = -1
@@ -360,69 +376,53 @@ def elabora_salti_cronologici(df, ws, data_selezionata):
         for i, gruppo in enumerate(gruppi_disponibili):
             if gruppi_usati[i]: continue
 
-            tipo_ok = (gruppo['tipo'].lower() == tipo_req.lower())
-            if tipo_req.lower() == "sji":
-                tipo_ok = tipo_ok or (gruppo['tipo'].lower() == "sjl")
-
-            if not tipo_ok: continue
+            # Tipo normalizzato (include gli alias, es. SJi -> SJl)
+            if gruppo.tipo.lower() not in regola.tipi_accettati: continue
 
             discrim_ok = True
             if discrim:
                 nome_d, val_d = discrim
-                val_gruppo = gruppo['caduta'] if nome_d == "Caduta" else gruppo['peso']
+                val_gruppo = gruppo.caduta if nome_d == "Caduta" else gruppo.peso
                 if abs(float(val_gruppo) - float(val_d)) > 0.1:
                     discrim_ok = False
 
             if discrim_ok:
-                gruppo_trovato = gruppo['data']
+                gruppo_trovato = gruppo
                 idx_trovato = i
                 break
 
         if gruppo_trovato is not None:
             gruppi_usati[idx_trovato] = True
-            # st.write(f" -> Regola {tipo_req} (Disc: {discrim}): USATO Gruppo {idx_trovato} ({len(gruppo_trovato)} salti)")
+            registro.dettaglio(f" -> Regola {tipo_req} (Disc: {discrim}): USATO Gruppo {idx_trovato} ({len(gruppo_trovato)} salti)", STEP)
             # --- SEZIONE AGGIORNATA ---
-            if "weight_output" in regola:
+            if regola.cella_peso is not None:
                 # Prende il peso dal gruppo corrente (Serie 1, Serie 2, ecc.)
-                peso_effettivo = gruppi_disponibili[idx_trovato]['peso']
+                peso_effettivo = gruppo_trovato.peso
                 # Scrive il peso nella cella R configurata arrotondato a 1 cifra
                 try: 
-                    peso_effettivo = custom_round(float(str(peso_effettivo).replace(',', '.')), 1)
+                    peso_effettivo = custom_round(float(str(peso_effettivo).replace(',', '.')), piano.decimali_peso)
                 except: 
                     pass
-                ws[regola["weight_output"]] = peso_effettivo
+                cella_peso = ws.cell(row=regola.cella_peso.riga, column=regola.cella_peso.colonna)
+                cella_peso.value = peso_effettivo
                 if isinstance(peso_effettivo, (int, float)):
-                    ws[regola["weight_output"]].number_format = '0.00'
-                print(f" -> Scritto peso {peso_effettivo} in {regola['weight_output']}")
+                    cella_peso.number_format = piano.formato_peso
+                registro.dettaglio(f" -> Scritto peso {peso_effettivo} in {regola.cella_peso.coord}", STEP)
             # --------------------------
 
-            # Prende i top 3 valori di Altezza
-            # 1. Trova i 3 con altezza maggiore
-            top_3_indices = gruppo_trovato.sort_values(by='Altezza', ascending=False).head(3).index 
-            # 2. Li ordina per indice (cronologico)
-            df_sorted_top = gruppo_trovato.loc[top_3_indices].sort_index()
+            # Prende i top 3 valori di Altezza, in ordine cronologico
+            top_3 = gruppo_trovato.migliori(3, "Altezza")
 
-            for out_conf in regola['outputs']:
-                col_dato = out_conf['dato']
-                celle = out_conf['celle']
+            for out_conf in regola.outputs:
+                col_dato = out_conf.dato
+                celle = out_conf.celle
                 
-                # Determina applicazione arrotondamento
+                # Determina applicazione arrotondamento (da regole.json)
                 # Richiesta: NO arrotondamento per DJa (solo dato TC), SI arrotondamento per altri
-                no_round_dja = (tipo_req == "DJa" and col_dato == "TC")
+                no_round_dja = out_conf.decimali is None
 
-                vals_raw = df_sorted_top[col_dato].tolist()
-                vals_processed = []
-                for v in vals_raw:
-                    try:
-                        val_float = float(str(v).replace(',', '.'))
-                        if no_round_dja:
-                            vals_processed.append(val_float)
-                        else:
-                            # Usa arrotondamento custom
-                            vals_processed.append(custom_round(val_float, 1))
-                    except:
-                        if v is not None and str(v).lower() != "nan":
-                            vals_processed.append(v)
+                # Valori già arrotondati sull'intera colonna della tabella compatta
+                vals_processed = colonna_arrotondata(col_dato, out_conf.decimali)[top_3].tolist()
                 
                 # NUOVA LOGICA: Gestione 1 o 2 dati per riempire 3 caselle
                 if len(vals_processed) == 1:
@@ -436,7 +436,7 @@ def elabora_salti_cronologici(df, ws, data_selezionata):
                         v2 = float(vals_processed[1])
                         media = (v1 + v2) / 2
                         if not no_round_dja:
-                            media = custom_round(media, 1)
+                            media = custom_round(media, out_conf.decimali)
                         vals_processed.append(media)
                     except:
                         pass
@@ -446,66 +446,50 @@ def elabora_salti_cronologici(df, ws, data_selezionata):
 
                 for k, cella in enumerate(celle):
                     val = vals_processed[k] if k < len(vals_processed) else ""
-                    ws[cella] = val
+                    c = ws.cell(row=cella.riga, column=cella.colonna)
+                    c.value = val
                     if isinstance(val, (int, float)):
-                        if no_round_dja:
-                            ws[cella].number_format = '0.000'
-                        else:
-                            ws[cella].number_format = '0.00'
+                        c.number_format = out_conf.formato
         else:
-            # st.warning(f" -> Regola {tipo_req} (Disc: {discrim}): NESSUN GRUPPO TROVATO (Lascio bianco)")
-            for out_conf in regola['outputs']:
-                for cella in out_conf['celle']:
-                    ws[cella] = ""
+            registro.dettaglio(f" -> Regola {tipo_req} (Disc: {discrim}): NESSUN GRUPPO TROVATO (Lascio bianco)", STEP)
+            for out_conf in regola.outputs:
+                for cella in out_conf.celle:
+                    ws.cell(row=cella.riga, column=cella.colonna).value = ""
+
+    return {
+        "righe_salti": len(tabella), "kb_salti": round(tabella.nbytes / 1024, 1),
+        "gruppi": len(gruppi_disponibili), "gruppi_usati": sum(gruppi_usati)
+    }
 
 
-def elabora_salti_rj(df, ws, data_selezionata):
+def elabora_salti_rj(df, ws, data_selezionata, registro=REGISTRO_NULLO, indice=None):
     """
     Elabora i salti reattivi (RJ) con LOGICA RIGOROSA A COORDINATE RELATIVE:
-    1. Cerca riga con 'RJ'/'RJ(unlimited)' nella colonna 'Tipo di salto'.
+    1. Cerca riga con 'RJ'/'RJ(unlimited)' nella colonna 'Tipo di salto' e la data scelta
+       (righe già note se è disponibile un IndiceSessioni).
     2. Riga+1: Verifica intestazioni colonne -> Col B (TC), Col D (Altezza), Col E (RSI).
     3. Riga+4: Verifica ancoraggio 'SD' in Col A.
     4. Riga+5: Inizio dati numerici. Legge finché Col A contiene numeri.
     5. Calcola Top 5 e scrive risultati.
+    Restituisce i conteggi di righe scansionate e sessioni valide.
     """
-    st.write("--- ESECUZIONE STEP 3 (RJ: COORDINATE RIGIDE) ---")
+    STEP = "Step 3"
+    registro.dettaglio("--- ESECUZIONE STEP 3 (RJ: COORDINATE RIGIDE) ---", STEP)
     
     from openpyxl.styles import Alignment
 
-    # 1. Trova Colonna "Tipo di salto"
-    idx_tipo = -1
-    idx_data = -1
-    
-    # Cerchiamo l'intestazione generale per capire dov'è la colonna Tipo
-    for i, riga in df.iterrows():
-        riga_lista = [str(x).strip().lower() for x in riga.tolist()]
-        if "tipo di salto" in riga_lista:
-            # Trovata riga header principale
-            for idx, val in enumerate(riga_lista):
-                if "tipo di salto" in val: idx_tipo = idx
-                if "data" in val: idx_data = idx
-            break
+    # Valori dell'export come array di oggetti: nessuna Series pandas per riga durante la scansione
+    valori = df.to_numpy(dtype=object)
+    n_rows = len(valori)
+
+    # 1. Trova Colonna "Tipo di salto" (intestazione generale)
+    idx_tipo, idx_data = indice.intestazioni.rj if indice is not None else sessioni.trova_colonne_rj(valori)
     
     if idx_tipo == -1:
-        st.warning("⚠️ Colonna 'Tipo di salto' non identificata nel file.")
-        return
+        registro.avviso("Colonna 'Tipo di salto' non identificata nel file.", STEP)
+        return {}
 
     # Helper functions
-    def to_float(val):
-        try:
-            return float(str(val).replace(',', '.').strip())
-        except:
-            return None
-
-    def check_date_match(val_cella, target):
-        try:
-            s = str(val_cella).strip()
-            if pd.to_datetime(s, dayfirst=True, errors='coerce').date() == target: return True
-            if str(target) in s: return True
-        except:
-            pass
-        return False
-
     def is_number(val):
         try:
             float(str(val).replace(',', '.').strip())
@@ -513,197 +497,140 @@ def elabora_salti_rj(df, ws, data_selezionata):
         except:
             return False
 
-    n_rows = len(df)
     sessions_found = []
-    
-    # Scansione per trovare righe RJ
-    i = 0
-    while i < n_rows:
-        row = df.iloc[i]
+    # Colonne A/B/D/E già convertite al caricamento (indice delle sessioni), se disponibili
+    colonne_rj = indice.colonne_rj if indice is not None else None
+
+    # Righe RJ della data scelta: dall'indice delle sessioni oppure cercandole ora
+    if indice is not None:
+        righe_rj = indice.righe_rj(data_selezionata)
+    elif idx_data != -1:
+        righe_rj = [
+            r for r in sessioni.righe_rj_candidate(valori, idx_tipo)
+            if data_selezionata in sessioni.date_riga_rj(valori[r, idx_data])
+        ]
+    else:
+        # Senza colonna data non possiamo attribuire le sessioni RJ alla data scelta
+        righe_rj = []
+
+    # Verifica struttura di ogni riga RJ; le righe dentro una sessione già letta sono saltate
+    prossima = 0
+    for i in righe_rj:
+        i = int(i)
+        if i < prossima: continue
+
+        registro.dettaglio(f"📍 Trovato potenziale RJ a riga {i+1}. Verifico struttura...", STEP)
         
-        # Check RJ
-        is_rj = False
-        try:
-            val_tipo = str(row.iloc[idx_tipo]).strip().lower()
-            if "rj" in val_tipo:
-                # Check Date
-                val_data = row.iloc[idx_data] if idx_data != -1 else None
-                if idx_data != -1 and check_date_match(val_data, data_selezionata):
-                    is_rj = True
-                elif idx_data == -1:
-                    # Se non abbiamo colonna data, controlliamo nella riga? 
-                    # Assumiamo che ci sia la colonna data se abbiamo trovato 'Tipo di salto'
-                    pass
-        except: pass
+        # --- VERIFICA COORDINATE RELATIVE ---
         
-        if is_rj:
-            st.info(f"📍 Trovato potenziale RJ a riga {i+1}. Verifico struttura...")
-            
-            # --- VERIFICA COORDINATE RELATIVE ---
-            
-            # 1. Riga + 1: Colonne B (TC), D (Altezza), E (RSI)
-            # Indici (0-based): B=1, D=3, E=4
-            r_sigle = i + 1
-            if r_sigle >= n_rows: break
+        # 1. Riga + 1: Colonne B (TC), D (Altezza), E (RSI)
+        # Indici (0-based): B=1, D=3, E=4
+        r_sigle = i + 1
+        if r_sigle >= n_rows: break
+        
+        row_sigle = valori[r_sigle]
+        
+        # Controllo "blando" sulle sigle per confermare che siamo nel posto giusto
+        try:
+            sigla_b = str(row_sigle[1]).strip().lower() # TC
+            sigla_d = str(row_sigle[3]).strip().lower() # Altezza
+            sigla_e = str(row_sigle[4]).strip().lower() # RSI
             
-            row_sigle = df.iloc[r_sigle]
+            # Keywords (italiano, inglese, spagnolo: vedi intestazioni.PAROLE)
+            ok_b = intestazioni.contiene(sigla_b, "sigla tc")
+            ok_d = intestazioni.contiene(sigla_d, "sigla altezza")
+            ok_e = intestazioni.contiene(sigla_e, "sigla rsi")
             
-            # Controllo "blando" sulle sigle per confermare che siamo nel posto giusto
-            try:
-                sigla_b = str(row_sigle.iloc[1]).strip().lower() # TC
-                sigla_d = str(row_sigle.iloc[3]).strip().lower() # Altezza
-                sigla_e = str(row_sigle.iloc[4]).strip().lower() # RSI
-                
-                # Keywords
-                ok_b = any(x in sigla_b for x in ['tc', 'contact', 'time'])
-                ok_d = any(x in sigla_d for x in ['altezza', 'height', 'h '])
-                ok_e = any(x in sigla_e for x in ['rsi', 'reactive', 'index'])
-                
-                if not (ok_b and ok_d): 
-                    st.warning(f"   Struttura colonne non corrispondente a riga {r_sigle+1} (D={sigla_d}, B={sigla_b})")
-                    i += 1
-                    continue
-            except:
-                i += 1
+            if not (ok_b and ok_d): 
+                registro.avviso(f"Struttura colonne non corrispondente a riga {r_sigle+1} (D={sigla_d}, B={sigla_b})", STEP)
                 continue
+        except:
+            continue
 
-            # 2. Riga + 4 (partendo da 'i+1' scendo di 3 -> i+1+3 = i+4): Ancoraggio 'SD' in Col A (0)
-            r_sd = i + 4
-            if r_sd >= n_rows: break
-            
-            row_sd = df.iloc[r_sd]
-            try:
-                sigla_sd = str(row_sd.iloc[0]).strip().lower()
-                if "sd" not in sigla_sd and "jump" not in sigla_sd:
-                     st.warning(f"   Manca 'SD' in colonna A alla riga {r_sd+1}")
-                     i += 1
-                     continue
-            except:
-                i += 1
-                continue
-                
-            # 3. Riga + 5: Inizio Dati
-            r_data = i + 5
-            collected_jumps = []
+        # 2. Riga + 4 (partendo da 'i+1' scendo di 3 -> i+1+3 = i+4): Ancoraggio 'SD' in Col A (0)
+        r_sd = i + 4
+        if r_sd >= n_rows: break
+        
+        row_sd = valori[r_sd]
+        try:
+            sigla_sd = str(row_sd[0]).strip().lower()
+            if "sd" not in sigla_sd and "jump" not in sigla_sd:
+                 registro.avviso(f"Manca 'SD' in colonna A alla riga {r_sd+1}", STEP)
+                 continue
+        except:
+            continue
             
+        # 3. Riga + 5: Inizio Dati. Legge finché la Colonna A (indice salto) contiene numeri
+        r_data = i + 5
+        if colonne_rj is not None:
+            k = colonne_rj.fine_blocco(r_data)
+            sessione = salti.SessioneRJ.da_numeri(
+                i, colonne_rj.tc[r_data:k], colonne_rj.altezza[r_data:k], colonne_rj.rsi[r_data:k]
+            )
+        else:
             k = r_data
-            while k < n_rows:
-                d_row = df.iloc[k]
-                
-                # Check Colonna A (Indice Salto)
-                val_a = d_row.iloc[0]
-                if not is_number(val_a):
-                     # Fine dati
-                     break
-                
-                # Estrazione Valori (B=1 TC, D=3 H, E=4 RSI)
-                try:
-                    val_tc = to_float(d_row.iloc[1])
-                    val_h  = to_float(d_row.iloc[3])
-                    val_rsi= to_float(d_row.iloc[4])
-                    
-                    if val_h is not None and val_h > 0:
-                        collected_jumps.append({
-                            'h': val_h,
-                            'tc': val_tc if val_tc else 0.0,
-                            'rsi': val_rsi if val_rsi else 0.0
-                        })
-                except:
-                    pass
-                
+            while k < n_rows and is_number(valori[k, 0]):
                 k += 1
-            
-            # --- CALCOLO STATISTICHE SESSIONE ---
-            if collected_jumps:
-                df_sess = pd.DataFrame(collected_jumps)
-                
-                # 1. Filtro Qualità: Scarta H <= 0 o NaN
-                df_sess = df_sess[df_sess['h'] > 0].copy()
-                
-                if not df_sess.empty:
-                    # 2. Seleziona Top 5 per Altezza
-                    if len(df_sess) > 5:
-                        top_5 = df_sess.sort_values(by='h', ascending=False).head(5)
-                    else:
-                        top_5 = df_sess
-                    
-                    # 3. Calcolo Medie Robuste (escludendo 0 nel conteggio per TC e RSI)
-                    # Helper per media non-zero
-                    def mean_exclude_zeros(series):
-                        valid_vals = series[series > 0]
-                        if valid_vals.empty: return 0.0
-                        return valid_vals.mean()
-
-                    avg_h = top_5['h'].mean()
-                    avg_tc = mean_exclude_zeros(top_5['tc'])
-                    avg_rsi = mean_exclude_zeros(top_5['rsi'])
-                    
-                    stats = {
-                        'avg_h': avg_h,
-                        'avg_tc': avg_tc,
-                        'avg_rsi': avg_rsi,
-                        'n_salti': len(df_sess), # Salti validi totali
-                        'start_row': i
-                    }
-                    sessions_found.append(stats)
-                    st.success(f"   ✅ Sessione valida estratta: {len(df_sess)} salti validi.")
-                
-            # Saltiamo k righe
-            i = k
-            continue
-            
-        i += 1
-        
+
+            # Estrazione Valori (B=1 TC, D=3 H, E=4 RSI) in array compatti, solo salti con H > 0
+            sessione = salti.SessioneRJ.da_colonne(i, valori[r_data:k, 1], valori[r_data:k, 3], valori[r_data:k, 4])
+
+        # --- CALCOLO STATISTICHE SESSIONE ---
+        # Top 5 per Altezza, medie robuste (TC e RSI escludendo gli 0)
+        stats = sessione.statistiche(5)
+        if stats is not None:
+            sessions_found.append(stats)
+            registro.dettaglio(f"Sessione valida estratta a riga {i+1}: {len(sessione)} salti validi.", STEP)
+
+        # Saltiamo k righe
+        prossima = k
+
     # --- SELEZIONE MIGLIORE E SCRITTURA ---
+    piano = regole.carica_piano()
     if not sessions_found:
-        st.warning(f"Nessuna sessione RJ valida trovata per la data {data_selezionata}.")
-        ws["F19"] = ""; ws["H19"] = ""; ws["I19"] = ""
-        return
+        registro.avviso(f"Nessuna sessione RJ valida trovata per la data {data_selezionata}.", STEP)
+        for out_rj in piano.rj:
+            ws.cell(row=out_rj.cella.riga, column=out_rj.cella.colonna).value = ""
+        return {"righe_scansionate": n_rows, "sessioni_rj": 0}
 
     # Migliore per Avg H
     best = max(sessions_found, key=lambda x: x['avg_h'])
     
-    st.markdown(f"**🏆 Sessione Vincente (Riga {best['start_row']+1}):** Avg H {best['avg_h']:.2f}")
+    registro.successo(f"🏆 Sessione RJ Vincente (Riga {best['start_row']+1}): Avg H {best['avg_h']:.2f} su {len(sessions_found)} sessioni valide", STEP)
+
+    # Scrittura (Altezza sempre, TC e RSI solo se > 0)
+    medie = {"Altezza": best['avg_h'], "TC": best['avg_tc'], "RSI": best['avg_rsi']}
+    arrotondate = arrotonda_colonna(
+        [medie[o.dato] for o in piano.rj], [o.decimali for o in piano.rj]
+    ).tolist()
+    for out_rj, valore in zip(piano.rj, arrotondate):
+        c = ws.cell(row=out_rj.cella.riga, column=out_rj.cella.colonna)
+        media = medie[out_rj.dato]
+        if out_rj.dato == "Altezza" or media > 0:
+            c.value = valore
+            c.number_format = out_rj.formato
+        else:
+            c.value = ""
+
+    return {"righe_scansionate": n_rows, "sessioni_rj": len(sessions_found)}
 
-    # Scrittura
-    ws["F19"] = custom_round(best['avg_h'], 2)
-    ws["F19"].number_format = '0.00'
-    
-    if best['avg_tc'] > 0:
-        ws["H19"] = custom_round(best['avg_tc'], 3)
-        ws["H19"].number_format = '0.000'
-    else:
-        ws["H19"] = ""
-    
-    if best['avg_rsi'] > 0:
-        ws["I19"] = custom_round(best['avg_rsi'], 3)
-        ws["I19"].number_format = '0.000'
-    else:
-        ws["I19"] = ""
 
+def elabora_step1_anagrafica(df, ws, data_selezionata, registro=REGISTRO_NULLO):
+    """Elabora l'anagrafica leggendo ESCLUSIVAMENTE la riga sotto 'ID'. Restituisce il numero di campi scritti."""
+    STEP = "Step 1"
+    registro.dettaglio("--- ESECUZIONE STEP 1 (ANAGRAFICA RIGIDA) ---", STEP)
 
-def elabora_step1_anagrafica(df, ws, data_selezionata):
-    """Elabora l'anagrafica leggendo ESCLUSIVAMENTE la riga sotto 'ID'"""
-    st.write("--- ESECUZIONE STEP 1 (ANAGRAFICA RIGIDA) ---")
+    piano = regole.carica_piano()
 
     # 1. Data Test (F2)
-    ws["F2"] = data_selezionata.strftime("%d/%m/%Y")
+    ws.cell(row=piano.cella_data.riga, column=piano.cella_data.colonna).value = data_selezionata.strftime("%d/%m/%Y")
 
     # 2. Trova la riga dell'intestazione (dove c'è scritto ID, Nome, Altezza...)
-    riga_header = -1
-    col_map = {}
-    for i, riga in df.iterrows():
-        riga_check = [str(x).strip().lower() for x in riga.tolist()]
-        # Cerchiamo la riga che contiene i metadati dell'atleta
-        if "id" in riga_check and "nome" in riga_check:
-            riga_header = i
-            for idx, col_name in enumerate(riga_check):
-                col_map[col_name] = idx
-            break
+    riga_header, col_map = sessioni.trova_intestazione_anagrafica(df.to_numpy(dtype=object))
 
     if riga_header == -1:
-        st.error("ERRORE: Riga 'ID' non trovata. Impossibile leggere l'altezza corretta.")
-        return
+        registro.errore("ERRORE: Riga 'ID' non trovata. Impossibile leggere l'altezza corretta.", STEP)
+        return {}
 
     # La riga dell'atleta è quella immediatamente sotto l'header ID
     riga_atleta = df.iloc[riga_header + 1]
@@ -726,25 +653,28 @@ def elabora_step1_anagrafica(df, ws, data_selezionata):
     
     if full_name:
         parti = full_name.split(" ", 1)
-        ws["C1"] = parti[0].strip().upper() if len(parti) > 0 else ""
-        ws["E1"] = parti[1].strip().upper() if len(parti) > 1 else ""
-        st.info(f" -> Splittato nome: {ws['C1'].value} (C1), {ws['E1'].value} (E1)")
+        cognome = parti[0].strip().upper() if len(parti) > 0 else ""
+        nome = parti[1].strip().upper() if len(parti) > 1 else ""
+        ws.cell(row=piano.cella_cognome.riga, column=piano.cella_cognome.colonna).value = cognome
+        ws.cell(row=piano.cella_nome.riga, column=piano.cella_nome.colonna).value = nome
+        registro.info(f"Atleta: {cognome} ({piano.cella_cognome.coord}), {nome} ({piano.cella_nome.coord})", STEP)
 
     # 4. Ciclo sui campi (Altezza, Peso, ecc.) usando SOLO la riga ID
-    for item in CONFIG_ANAGRAFICA:
-        etichetta = item['etichetta']
-        cella = item['cella']
-        
-        valore = prendi_solo_da_riga_id(etichetta)
+    for campo in piano.anagrafica:
+        etichetta = campo.etichetta
+        cella = campo.cella.coord
         
-        # Fallback per il Peso
-        if not valore and etichetta.lower() == "peso":
-            valore = prendi_solo_da_riga_id("peso kg")
-
-        # Conversione Sesso
-        if etichetta.lower() == "sesso":
-            if valore.upper() == "M": valore = "UOMO"
-            elif valore.upper() == "F": valore = "DONNA"
+        # Etichetta e poi eventuali alias (es. Peso -> "peso kg")
+        valore = ""
+        for chiave in campo.chiavi:
+            valore = prendi_solo_da_riga_id(chiave)
+            if valore: break
+
+        # Conversione valori (es. Sesso M/F -> UOMO/DONNA)
+        for sorgente, scritto in campo.valori:
+            if valore.upper() == sorgente:
+                valore = scritto
+                break
             
         
         # Arrotondamento anagrafica: RIMUOVERE LA VIRGOLA (Interi)
@@ -752,16 +682,839 @@ def elabora_step1_anagrafica(df, ws, data_selezionata):
         is_number = False
         try:
             val_num = float(str(valore).replace(',', '.'))
-            valore = custom_round(val_num, 0) # Arrotondamento all'intero
+            valore = custom_round(val_num, piano.decimali_anagrafica) # Arrotondamento all'intero
             is_number = True
         except:
             pass
 
-        ws[cella] = valore
+        c = ws.cell(row=campo.cella.riga, column=campo.cella.colonna)
+        c.value = valore
         if is_number:
-            ws[cella].number_format = '0' # Formato intero senza decimali
+            c.number_format = piano.formato_anagrafica # Formato intero senza decimali
+        
+        registro.dettaglio(f" -> {etichetta}: {valore} (scritto in {cella})", STEP)
+
+    return {"campi_anagrafica": len(piano.anagrafica)}
+
+
+def copia_upload(uploaded_file):
+    """
+    Copia in memoria un file caricato da Streamlit, mantenendo il nome.
+    Il worker in background non deve dipendere dal buffer della sessione.
+    """
+    buffer = io.BytesIO(uploaded_file.getvalue())
+    buffer.name = uploaded_file.name
+    return buffer
+
+
+def _esegui_step(passi, step, chiave, registro, funzione):
+    """
+    Risultato di uno step dalla cache della sessione (stessi input) oppure eseguendolo su un
+    FoglioPatch. Gli eventi dello step finiscono comunque nel registro. Restituisce (risultato, riusato).
+    """
+    risultato = passi.cerca(step, chiave)
+    riusato = risultato is not None
+    if not riusato:
+        registro_step = RegistroEventi(attivo=registro.attivo)
+        registro_step.soglia = registro.soglia
+        foglio = incrementale.FoglioPatch()
+        conteggi = funzione(foglio, registro_step)
+        risultato = incrementale.RisultatoStep(chiave, foglio.patch, registro_step.eventi, conteggi)
+        passi.memorizza(step, risultato)
+    registro.eventi.extend(risultato.eventi)
+    return risultato, riusato
+
+
+def esegui_elaborazione_atleta(sorgente, modello, data_test, avanzamento=None, registro=REGISTRO_NULLO, misura=None,
+                               indice=None, df_sorgente=None, passi=None):
+    """
+    Pipeline completa della pagina 'Athletic Data': caricamento, tre step, storico e salvataggio.
+    - sorgente: buffer con attributo .name oppure path
+    - modello: buffer oppure path del modello Excel
+    - avanzamento: callback opzionale chiamata con l'indice dello stadio in STADI_PIPELINE
+    - registro: RegistroEventi in cui raccogliere i messaggi degli step (default: nessun output)
+    - misura: MisurazioneStadi opzionale (tempi e memoria per stadio)
+    - indice: IndiceSessioni opzionale dello stesso file (righe della data già note)
+    - df_sorgente: DataFrame opzionale del sorgente già letto (non viene riletto)
+    - passi: incrementale.CacheStep opzionale della sessione: modello già caricato e step
+      memorizzati sui loro input (vengono rieseguiti solo quelli con input cambiati)
+    Restituisce un dizionario con i bytes del file elaborato, le metriche scritte (tuple di
+    storico.estrai_metriche_da_foglio) e alcune informazioni di riepilogo.
+    """
+    if misura is None:
+        misura = strumentazione.MisurazioneStadi("Athletic Data", getattr(sorgente, "name", str(sorgente)))
+
+    def segnala(stadio):
+        if avanzamento is not None:
+            avanzamento(stadio)
+
+    # A. Caricamento Dati
+    with misura.stadio("carica_file_universale") as conteggi:
+        if df_sorgente is not None:
+            df = df_sorgente
+            conteggi.update(da_cache=1)
+        else:
+            df = carica_file_universale(sorgente, registro)
+        if df is None:
+            raise ValueError("Errore lettura file sorgente. Verifica il formato.")
+        conteggi.update(righe=df.shape[0], colonne=df.shape[1])
+    if indice is not None and not indice.valido_per(df):
+        registro.avviso("Indice delle sessioni non corrispondente al file: filtro per data sull'intero export.", "Caricamento")
+        indice = None
+
+    # Il workbook della sessione è condiviso tra le elaborazioni: una per volta
+    with (passi.lock if passi is not None else contextlib.nullcontext()):
+        # B. Caricamento Modello (sempre il primo foglio disponibile)
+        with misura.stadio("load_workbook modello") as conteggi:
+            wb = None
+            if passi is not None:
+                firma, byte_modello = incrementale.firma_modello(modello)
+                if passi.wb is not None and passi.firma_modello == firma:
+                    wb = passi.wb
+                    conteggi.update(da_cache=1)
+            if wb is None:
+                wb = load_workbook(modello)
+                if passi is not None:
+                    passi.imposta_modello(wb, firma, byte_modello)
+            if len(wb.worksheets) == 0:
+                raise ValueError("Il file modello non contiene fogli di lavoro.")
+            ws = wb.worksheets[0]
+        registro.info(f"Foglio selezionato automaticamente: {ws.title}", "Caricamento")
+        segnala(1)
+
+        # C. Esecuzione Step
+        if passi is None:
+            with misura.stadio("elabora_step1_anagrafica") as conteggi:
+                conteggi.update(elabora_step1_anagrafica(df, ws, data_test, registro))
+            segnala(2)
+            with misura.stadio("elabora_salti_cronologici") as conteggi:
+                conteggi.update(elabora_salti_cronologici(df, ws, data_test, registro, indice))
+            segnala(3)
+            with misura.stadio("elabora_salti_rj") as conteggi:
+                conteggi.update(elabora_salti_rj(df, ws, data_test, registro, indice))
+            segnala(4)
+        else:
+            # Ogni step produce le sue patch; sul foglio vengono riscritte solo quelle cambiate
+            valori = df.to_numpy(dtype=object)
+            piano = regole.carica_piano()
+            step_pipeline = (
+                ("anagrafica", "elabora_step1_anagrafica", "Step 1",
+                 lambda: incrementale.chiave_anagrafica(valori, data_test, piano),
+                 lambda foglio, reg: elabora_step1_anagrafica(df, foglio, data_test, reg)),
+                ("salti", "elabora_salti_cronologici", "Step 2",
+                 lambda: incrementale.chiave_salti(valori, data_test, piano, indice),
+                 lambda foglio, reg: elabora_salti_cronologici(df, foglio, data_test, reg, indice)),
+                ("rj", "elabora_salti_rj", "Step 3",
+                 lambda: incrementale.chiave_rj(valori, data_test, piano, indice),
+                 lambda foglio, reg: elabora_salti_rj(df, foglio, data_test, reg, indice)),
+            )
+            risultati = {}
+            for n, (step, stadio, etichetta, chiave, funzione) in enumerate(step_pipeline, start=2):
+                with misura.stadio(stadio) as conteggi:
+                    risultato, riusato = _esegui_step(passi, step, chiave(), registro, funzione)
+                    conteggi.update(risultato.conteggi)
+                    if riusato:
+                        conteggi.update(da_cache=1)
+                        registro.dettaglio("Input invariati: risultato precedente riusato.", etichetta)
+                risultati[step] = risultato
+                segnala(n)
+            with misura.stadio("applica_patch") as conteggi:
+                conteggi.update(celle=passi.applica(ws, risultati))
+
+        # C2. Archiviazione metriche nello storico locale (SQLite), rilette una volta anche per l'anteprima
+        # (atleta: nome e ID con cui è stato salvato, None se lo storico non è stato aggiornato)
+        metriche, atleta = [], None
+        with misura.stadio("storico") as conteggi:
+            try:
+                piano = regole.carica_piano()
+                metriche = storico.estrai_metriche_da_foglio(ws, piano)
+                id_atleta = estrai_id_atleta(df)
+                n_metriche = storico.registra_elaborazione(
+                    ws, data_test, piano,
+                    id_atleta=id_atleta,
+                    file_sorgente=getattr(sorgente, "name", str(sorgente)),
+                    righe=metriche
+                )
+                atleta = (storico.nome_atleta(ws, piano), id_atleta)
+                conteggi.update(metriche=n_metriche)
+                registro.info(f"Storico aggiornato: {n_metriche} metriche salvate.", "Storico")
+            except Exception as e_db:
+                registro.avviso(f"Impossibile aggiornare lo storico: {e_db}", "Storico")
+
+        # D. Salvataggio in memoria
+        with misura.stadio("wb.save") as conteggi:
+            if passi is not None:
+                passi.prepara_salvataggio()
+            buffer = io.BytesIO()
+            wb.save(buffer)
+            conteggi.update(bytes=buffer.tell())
+        segnala(5)
+
+    try:
+        misura.accoda_jsonl()
+    except OSError as e_log:
+        registro.avviso(f"Impossibile salvare il record prestazioni: {e_log}", "Strumentazione")
+
+    return {
+        "output": buffer.getvalue(),
+        "foglio": ws.title,
+        "metriche": metriche,
+        "atleta": atleta,
+        "registro": registro,
+        "misura": misura,
+    }
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def figure_report(preview_data):
+    """Grafici dell'anteprima di un report: calcolati una volta per gli stessi dati."""
+    return grafici.figura_pre_post(preview_data), grafici.figura_variazioni(preview_data)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def metriche_storico(firma_db):
+    """Metriche numeriche dello storico; firma_db (storico.firma_storico) cambia a ogni nuova elaborazione."""
+    return storico.metriche_numeriche()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def figura_squadra_storico(sezione, metrica, dato, atleta, firma_db):
+    """Grafico della squadra per una metrica: query aggregata e riduzione dei punti una volta per versione dello storico."""
+    serie = storico.serie_squadra(sezione, metrica, dato)
+    titolo = f"{metrica} · {dato}" if sezione != "rj" else f"RJ · {dato}"
+    return grafici.figura_squadra(serie, titolo, atleta_evidenziato=atleta), sorted(serie["atleta"].unique())
+
+
+# Tabelle Arrow in cache_resource e non in cache_data: sono immutabili, quindi ogni rerun riceve
+# la stessa tabella invece di una copia deserializzata
+@st.cache_resource(max_entries=16, show_spinner=False)
+def tabella_storico_atleta(atleta, id_atleta, firma_db):
+    """Tutte le date di un atleta nello storico (tabella di anteprima), una volta per versione dello storico."""
+    return anteprime.tabella_storico(storico.storico_atleta(atleta, id_atleta=id_atleta))
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def atleti_storico(firma_db):
+    """Atleti e date dello storico; firma_db (storico.firma_storico) cambia a ogni nuova elaborazione."""
+    return storico.elenco_atleti()
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def tabella_confronto_storico(atleta, id_atleta, data_pre, data_post, firma_db):
+    """Confronto PRE/POST di un atleta dallo storico (tabella di anteprima), una volta per versione dello storico."""
+    return anteprime.tabella_confronto(storico.confronto_pre_post(atleta, data_pre, data_post, id_atleta=id_atleta))
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def tabella_squadra_storico(sezione, metrica, dato, firma_db):
+    """Valori della squadra per una metrica (tabella di anteprima), una volta per versione dello storico."""
+    return anteprime.tabella_squadra(storico.serie_squadra(sezione, metrica, dato))
+
+
+def tabella_paginata(tabella, chiave):
+    """Una pagina di una tabella di anteprima (anteprime.py), formattata solo in visualizzazione."""
+    n_pagine = anteprime.numero_pagine(tabella)
+    numero = 1
+    if n_pagine > 1:
+        chiave_pagina = f"pagina_{chiave}"
+        # La stessa chiave passa alla tabella successiva (nuova elaborazione, altra metrica), anche più corta
+        if st.session_state.get(chiave_pagina, 1) > n_pagine:
+            st.session_state[chiave_pagina] = 1
+        numero = st.number_input(f"Pagina (di {n_pagine})", min_value=1, max_value=n_pagine, step=1,
+                                 key=chiave_pagina)
+    configurazione = {
+        nome: st.column_config.DateColumn(format=formato) if tipo == "data" else st.column_config.NumberColumn(format=formato)
+        for nome, tipo, formato in anteprime.formati(tabella)
+    }
+    st.dataframe(anteprime.pagina(tabella, numero), column_config=configurazione, hide_index=True, width="stretch")
+    if n_pagine > 1:
+        inizio = (numero - 1) * anteprime.RIGHE_PAGINA
+        st.caption(f"Righe {inizio + 1}–{min(inizio + anteprime.RIGHE_PAGINA, tabella.num_rows)} di {tabella.num_rows}")
+
+
+@st.fragment
+def mostra_tabella_paginata(tabella, chiave):
+    """tabella_paginata in un fragment: cambiando pagina viene rieseguita e inviata solo la tabella."""
+    tabella_paginata(tabella, chiave)
+
+
+def mostra_grafici_report(preview_data):
+    """Barre PRIMA/DOPO e variazioni % del report appena generato."""
+    fig_valori, fig_variazioni = figure_report(preview_data)
+    tab_valori, tab_variazioni = st.tabs(["PRIMA / DOPO", "Variazione %"])
+    with tab_valori:
+        st.plotly_chart(fig_valori, width="stretch")
+    with tab_variazioni:
+        st.plotly_chart(fig_variazioni, width="stretch")
+
+
+@st.fragment
+def mostra_andamento_squadra():
+    """Andamento di una metrica per tutti gli atleti dello storico (i widget rieseguono solo questo pannello)."""
+    with st.expander("📈 Andamento squadra (storico elaborazioni)", expanded=False):
+        firma_db = storico.firma_storico()
+        metriche = metriche_storico(firma_db)
+        if metriche.empty:
+            st.caption("Nessuna metrica numerica nello storico: avvia almeno un'elaborazione nella pagina Athletic Data.")
+            return
+        scelte = list(metriche.itertuples(index=False))
+        scelta = st.selectbox(
+            "Metrica", scelte,
+            format_func=lambda m: f"{m.sezione} · {m.metrica} · {m.dato} ({m.atleti} atleti, {m.date} date)",
+            key="metrica_squadra",
+        )
+        _, atleti = figura_squadra_storico(scelta.sezione, scelta.metrica, scelta.dato, None, firma_db)
+        atleta = st.selectbox("Evidenzia atleta", [None] + atleti, format_func=lambda a: a or "—",
+                              key="atleta_squadra")
+        fig, _ = figura_squadra_storico(scelta.sezione, scelta.metrica, scelta.dato, atleta, firma_db)
+        tab_grafico, tab_tabella = st.tabs(["Grafico", "Tabella"])
+        with tab_grafico:
+            st.plotly_chart(fig, width="stretch")
+        with tab_tabella:
+            tabella_paginata(tabella_squadra_storico(scelta.sezione, scelta.metrica, scelta.dato, firma_db), "squadra")
+
+
+@st.fragment
+def mostra_confronto_storico():
+    """Confronto PRE/POST di un atleta letto dallo storico, senza ricaricare i file elaborati."""
+    with st.expander("🗂️ Confronto PRE/POST dallo storico", expanded=False):
+        firma_db = storico.firma_storico()
+        elenco = atleti_storico(firma_db)
+        if elenco.empty:
+            st.caption("Nessuna elaborazione nello storico: avvia almeno un'elaborazione nella pagina Athletic Data.")
+            return
+        date_per_atleta = {}
+        for riga in elenco.itertuples(index=False):
+            id_atleta = None if pd.isna(riga.id_atleta) else riga.id_atleta
+            date_per_atleta.setdefault((riga.atleta, id_atleta), []).append(riga.data_test)
+        atleta = st.selectbox(
+            "Atleta", list(date_per_atleta),
+            format_func=lambda a: f"{a[0]} (ID {a[1]})" if a[1] is not None else a[0],
+            key="atleta_confronto",
+        )
+        date = date_per_atleta[atleta]
+        formato_data = lambda d: pd.Timestamp(d).strftime("%d/%m/%Y")
+        col_pre, col_post = st.columns(2)
+        with col_pre:
+            data_pre = st.selectbox("Data PRE", date, index=0, format_func=formato_data,
+                                    key="data_pre_confronto")
+        with col_post:
+            data_post = st.selectbox("Data POST", date, index=len(date) - 1, format_func=formato_data,
+                                     key="data_post_confronto")
+        tabella_paginata(tabella_confronto_storico(*atleta, data_pre, data_post, firma_db), "confronto")
+
+
+def mostra_anteprima_athletic(anteprima, atleta):
+    """Metriche scritte sul modello dall'ultima elaborazione e tutte le date dell'atleta nello storico."""
+    with st.expander("📋 Anteprima metriche scritte", expanded=False):
+        tab_sessione, tab_storico = st.tabs(["Questa sessione", "Tutte le date (storico)"])
+        with tab_sessione:
+            if anteprima is None:
+                st.caption("Anteprima rimossa dalla memoria del server: avvia di nuovo l'elaborazione per vederla.")
+            else:
+                mostra_tabella_paginata(anteprima, "athletic")
+        with tab_storico:
+            if atleta is None:
+                st.caption("Storico non aggiornato da questa elaborazione.")
+            else:
+                mostra_tabella_paginata(tabella_storico_atleta(*atleta, storico.firma_storico()), "storico_atleta")
+
+
+def mostra_misurazioni(misura):
+    """Pannello espandibile con tempi, CPU e memoria per stadio."""
+    record = misura.record()
+    with st.expander(f"⏱️ Prestazioni elaborazione ({record['totale_wall_s']:.2f}s)", expanded=False):
+        st.dataframe(pd.DataFrame(misura.tabella()), hide_index=True, width="stretch")
+        st.caption(f"CPU totale: {record['totale_cpu_s']:.2f}s")
+
+
+class LavoroElaborazione:
+    """Handle di un'elaborazione inviata al pool in background (salvato in st.session_state)."""
+
+    def __init__(self, future, nome_output, data_test):
+        self.future = future
+        self.nome_output = nome_output
+        self.data_test = data_test
+        self.stadio = 0
+        self.inviato_il = time.time()
+
+    def aggiorna(self, stadio):
+        self.stadio = stadio
+
+    @property
+    def etichetta(self):
+        return STADI_PIPELINE[self.stadio][0]
+
+    @property
+    def frazione(self):
+        return STADI_PIPELINE[self.stadio][1]
+
+
+@st.cache_resource
+def get_executor_elaborazioni():
+    """Pool di thread condiviso da tutte le sessioni: le richieste in eccesso restano in coda."""
+    return ThreadPoolExecutor(max_workers=WORKER_ELABORAZIONE, thread_name_prefix="elaborazione")
+
+
+@st.cache_resource(validate=lambda pool: pool is None or not pool._broken)
+def get_pool_report():
+    """Pool di processi per caricare PRE e POST del report in parallelo (None: in sequenza, vedi caricamento_report.py)."""
+    return caricamento_report.crea_pool()
+
+
+@st.cache_resource
+def get_governatore_memoria():
+    """Cache degli artefatti di tutte le sessioni, con budget ed espulsione LRU (vedi memoria.py)."""
+    return memoria.GovernatoreMemoria()
+
+
+def id_sessione():
+    """Identificativo della sessione Streamlit corrente ('locale' fuori da Streamlit)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "locale"
+
+
+def _esegui_lavoro(sorgente, modello, data_test, avanzamento, registro, profila, indice=None, df_sorgente=None,
+                   passi=None):
+    """Corpo del lavoro in background: la profilazione avvolge la pipeline solo se richiesta."""
+    if not profila:
+        return esegui_elaborazione_atleta(
+            sorgente, modello, data_test, avanzamento, registro, indice=indice, df_sorgente=df_sorgente, passi=passi
+        )
+    risultato, profilo = strumentazione.esegui_profilato(
+        esegui_elaborazione_atleta, sorgente, modello, data_test, avanzamento, registro, indice=indice,
+        df_sorgente=df_sorgente, passi=passi
+    )
+    risultato["profilo"] = profilo
+    return risultato
+
+
+def invia_elaborazione(sorgente, modello, data_test, nome_output, profila=False, indice=None, df_sorgente=None,
+                       passi=None):
+    """Invia la pipeline al pool e restituisce il relativo LavoroElaborazione."""
+    lavoro = LavoroElaborazione(None, nome_output, data_test)
+    lavoro.future = get_executor_elaborazioni().submit(
+        _esegui_lavoro, sorgente, modello, data_test, lavoro.aggiorna, RegistroEventi(LIVELLO_LOG_DEFAULT), profila,
+        indice, df_sorgente, passi
+    )
+    return lavoro
+
+
+def mostra_report_generato(nome_output):
+    """Mostra l'ultimo report generato nella sessione (ricostruito ad ogni rerun)."""
+    report = st.session_state.get('report_generato')
+    if report is None:
+        return
+    output = get_governatore_memoria().prendi(id_sessione(), "output_report", firma=id(report))
+
+    mostra_registro_eventi(report['registro'], chiave="livello_log_report")
+
+    # --- ANTEPRIMA ---
+    preview_data = report['preview_data']
+    if preview_data:
+        st.write("### 📂 Anteprima Report Generato")
+        mostra_tabella_paginata(anteprime.tabella_report(preview_data), "report")
+        mostra_grafici_report(preview_data)
+
+    st.success("Report Generato con Successo!")
+    if output is None:
+        st.warning("Il report è stato rimosso dalla memoria del server per fare spazio ad altre sessioni. "
+                   "Generalo di nuovo per scaricarlo.")
+    else:
+        st.download_button(
+            label="📥 Scarica Report Comparativo",
+            data=output,
+            file_name=nome_output,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+    mostra_misurazioni(report['misura'])
+    if report['profilo'] is not None:
+        mostra_profilo(report['profilo'], nome_output)
+
+
+def mostra_lavoro_athletic():
+    """Mostra avanzamento o risultato dell'ultimo lavoro della sessione (ricontrollato ad ogni rerun)."""
+    lavoro = st.session_state.get('lavoro_athletic')
+    if lavoro is None:
+        return
+
+    if not lavoro.future.done():
+        @st.fragment(run_every=1.0)
+        def stato_in_corso():
+            if lavoro.future.done():
+                st.rerun()
+            st.progress(lavoro.frazione, text=f"⏳ {lavoro.etichetta} ({time.time() - lavoro.inviato_il:.0f}s)")
+        stato_in_corso()
+        return
+
+    try:
+        risultato = lavoro.future.result()
+    except Exception as e:
+        st.error(f"Errore durante l'elaborazione: {e}")
+        st.text("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+        return
+
+    # Il file generato passa al governatore della memoria: se espulso resta solo il riepilogo
+    governatore, sessione = get_governatore_memoria(), id_sessione()
+    if 'output' in risultato:
+        governatore.registra(sessione, "output_athletic", risultato.pop('output'), "output", firma=id(lavoro))
+    output = governatore.prendi(sessione, "output_athletic", firma=id(lavoro))
+    if 'metriche' in risultato:
+        governatore.registra(sessione, "anteprima_athletic", anteprime.tabella_metriche(risultato.pop('metriche')),
+                             "output", firma=id(lavoro))
+    anteprima = governatore.prendi(sessione, "anteprima_athletic", firma=id(lavoro))
+    # Dimensione aggiornata degli step memorizzati (il modello caricato può essere cambiato)
+    passi = governatore.prendi(sessione, "passi_athletic")
+    if passi is not None:
+        governatore.registra(sessione, "passi_athletic", passi, "modello")
+
+    mostra_registro_eventi(risultato['registro'])
+    mostra_misurazioni(risultato['misura'])
+    if risultato.get('profilo') is not None:
+        mostra_profilo(risultato['profilo'], lavoro.nome_output)
+
+    st.success(f"Elaborazione Completata con Successo! ✅ (Data test: {lavoro.data_test.strftime('%d/%m/%Y')})")
+    mostra_anteprima_athletic(anteprima, risultato.get('atleta'))
+    if output is None:
+        st.warning("Il file elaborato è stato rimosso dalla memoria del server per fare spazio ad altre sessioni. "
+                   "Avvia di nuovo l'elaborazione per scaricarlo.")
+        return
+    st.download_button(
+        label="📥 Scarica File Elaborato",
+        data=output,
+        file_name=lavoro.nome_output,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+
+def mostra_memoria_sessioni(governatore, sessione):
+    """Vista di amministrazione: memoria degli artefatti in cache di tutte le sessioni del processo."""
+    riepilogo = governatore.riepilogo()
+    mb_usati = riepilogo["byte_totali"] / (1024 * 1024)
+    mb_budget = riepilogo["budget_byte"] / (1024 * 1024)
+    with st.sidebar.expander(f"🧠 Memoria sessioni ({mb_usati:.1f} / {mb_budget:.0f} MB)", expanded=False):
+        st.progress(min(mb_usati / mb_budget, 1.0) if mb_budget else 1.0)
+        st.caption(f"{riepilogo['artefatti']} artefatti in {riepilogo['sessioni']} sessioni · "
+                   f"{riepilogo['espulsi']} espulsi dall'avvio")
+        righe = governatore.tabella(sessione)
+        if righe:
+            st.dataframe(pd.DataFrame(righe), hide_index=True, width="stretch")
+        if st.button("Svuota la cache di questa sessione", key="svuota_memoria_sessione"):
+            governatore.rimuovi_sessione(sessione)
+            st.rerun()
+
+
+def mostra_profilo(profilo, nome_output):
+    """Pannello con il profilo cProfile scaricabile e le allocazioni principali (tracemalloc)."""
+    base = os.path.splitext(nome_output)[0]
+    picco = f"picco allocazioni {profilo.picco_mb:.1f} MB{' del processo' if profilo.picco_processo else ''}"
+    with st.expander(f"🔬 Profilo elaborazione ({picco})", expanded=False):
+        st.download_button(
+            label="📥 Scarica profilo .prof",
+            data=profilo.prof_bytes(),
+            file_name=f"{base}.prof",
+            mime="application/octet-stream",
+            key=f"download_profilo_{base}"
+        )
+        st.code(profilo.testo_statistiche(), language=None)
+        st.dataframe(pd.DataFrame(profilo.top_allocazioni), hide_index=True, width="stretch")
+
+
+def load_excel_robust(file_upl, nome_log, registro=REGISTRO_NULLO):
+    """
+    Carica WB DataOnly (per valori) e WB Formule (per check).
+    Cerca foglio 'ATLETA' (case insensitive).
+    Restituisce (ws_val, ws_form, error_msg)
+    """
+    nome_file = getattr(file_upl, "name", str(file_upl))
+    if not nome_file.lower().endswith('.xlsx'):
+        return None, None, "Not XLSX"
+
+    try:
+        # WB Valori (Data Only = True)
+        if hasattr(file_upl, "seek"): file_upl.seek(0)
+        wb_val = load_workbook(file_upl, data_only=True)
+        
+        # WB Formule (Data Only = False)
+        if hasattr(file_upl, "seek"): file_upl.seek(0)
+        wb_form = load_workbook(file_upl, data_only=False)
+
+        # Ricerca Foglio
+        sheet_name = None
+        for s in wb_val.sheetnames:
+            if "atleta" in s.lower().strip():
+                sheet_name = s
+                break
         
-        st.info(f" -> {etichetta}: {valore} (scritto in {cella})")
+        if not sheet_name:
+            sheet_name = wb_val.sheetnames[0]
+            registro.avviso(f"Nel file {nome_log} non ho trovato il foglio 'ATLETA'. Uso il primo foglio: '{sheet_name}'", "Report")
+        else:
+            registro.info(f"File {nome_log}: trovato foglio target '{sheet_name}'", "Report")
+
+        return wb_val[sheet_name], wb_form[sheet_name], None
+
+    except Exception as e:
+        return None, None, str(e)
+
+
+def estrai_valori_mappati(ws_valori, df, righe, colonne):
+    """
+    Valori grezzi delle celle sorgente del mapping (righe/colonne 1-based, array di interi):
+    dal foglio Excel (valori calcolati) se disponibile, altrimenti dal DataFrame.
+    Le celle fuori dal DataFrame valgono 0.
+    """
+    if ws_valori: # Uso Excel OpenPyXL
+        return [ws_valori.cell(row=int(r), column=int(c)).value for r, c in zip(righe, colonne)]
+    grezzi = np.zeros(len(righe), dtype=object)
+    if df is None:
+        return grezzi
+    dentro = (righe >= 1) & (righe <= df.shape[0]) & (colonne >= 1) & (colonne <= df.shape[1])
+    grezzi[dentro] = df.to_numpy(dtype=object)[righe[dentro] - 1, colonne[dentro] - 1]
+    return grezzi
+
+
+def calcola_confronto(valori_pre, valori_post):
+    """
+    Confronto PRE/POST di tutte le metriche in blocco (array float della stessa lunghezza):
+    differenza, variazione percentuale (solo dove PRE è diverso da 0) e maschere di segno.
+    """
+    pre = np.asarray(valori_pre, dtype=float)
+    post = np.asarray(valori_post, dtype=float)
+    diff = post - pre
+    con_perc = pre != 0
+    perc = np.zeros(len(pre))
+    np.divide(diff, pre, out=perc, where=con_perc)
+    return {
+        "pre": pre,
+        "post": post,
+        "diff": diff,
+        "perc": perc,
+        "con_perc": con_perc,
+        "diff_negativa": diff < 0,
+        "perc_negativa": con_perc & (perc < 0),
+    }
+
+
+class StiliCondivisi:
+    """
+    Indici di font e formati numerici di un workbook, risolti una volta per oggetto.
+    Assegnare cella.font / cella.number_format cerca ogni volta lo stile nelle collezioni del
+    workbook; qui la ricerca avviene alla prima richiesta e le celle ricevono solo l'indice.
+    Usa le collezioni interne del workbook (_fonts, _number_formats): openpyxl è vincolato in
+    requirements.txt alla serie verificata da tests/test_stili.py.
+    """
+
+    def __init__(self, wb):
+        self.wb = wb
+        self._font = {}
+        self._formati = {}
+
+    def font(self, font):
+        if id(font) not in self._font:
+            self._font[id(font)] = (font, self.wb._fonts.add(font))
+        return self._font[id(font)][1]
+
+    def formato(self, formato):
+        if formato not in self._formati:
+            if formato in BUILTIN_FORMATS_REVERSE:
+                self._formati[formato] = BUILTIN_FORMATS_REVERSE[formato]
+            else:
+                self._formati[formato] = self.wb._number_formats.add(formato) + BUILTIN_FORMATS_MAX_SIZE
+        return self._formati[formato]
+
+
+def scrivi_celle_stilizzate(ws, celle, stili=None):
+    """
+    Scrittura in blocco di celle con stile condiviso.
+    - celle: iterabile di (riga, colonna, valore, font, formato); font/formato None = invariato
+    Gli altri attributi di stile della cella (bordi, riempimento, allineamento) restano quelli del
+    foglio. Restituisce il numero di celle scritte.
+    """
+    if stili is None:
+        stili = StiliCondivisi(ws.parent)
+    n = 0
+    for riga, colonna, valore, font, formato in celle:
+        cella = ws.cell(row=riga, column=colonna)
+        cella.value = valore
+        if font is not None or formato is not None:
+            # Le celle nuove di openpyxl non hanno ancora un array di stile (_style è None): un
+            # StyleArray esistente non è mai vuoto, quindi il confronto è solo con None
+            if cella._style is None:
+                cella._style = StyleArray()
+            if font is not None:
+                cella._style.fontId = stili.font(font)
+            if formato is not None:
+                cella._style.numFmtId = stili.formato(formato)
+        n += 1
+    return n
+
+
+def genera_report_comparativo(file_pre, file_post, file_template=None, registro=REGISTRO_NULLO, misura=None,
+                              pool=None):
+    """
+    Report comparativo PRE/POST (pagina 'Report').
+    - file_pre, file_post: buffer con attributo .name oppure path (xlsx elaborati, csv o numbers)
+    - file_template: buffer/path del template report (default: report.xlsx se presente)
+    - pool: ProcessPoolExecutor opzionale (caricamento_report.crea_pool) in cui caricare PRE e POST
+      mentre qui si carica il template; senza pool i caricamenti sono in sequenza
+    Restituisce un dizionario con i bytes del report, i dati di anteprima e le misurazioni.
+    """
+    if misura is None:
+        misura = strumentazione.MisurazioneStadi("Report", getattr(file_post, "name", str(file_post)))
+
+    with misura.stadio("caricamento PRE/POST/template") as conteggi:
+        # A. PRE e POST (DataFrame e valori del foglio ATLETA), nel pool se disponibile
+        argomenti = [
+            (caricamento_report.copia_sorgente(file), etichetta, registro.soglia, registro.attivo)
+            for file, etichetta in ((file_pre, "PRE"), (file_post, "POST"))
+        ]
+        avviso_pool = "Pool di caricamento non disponibile: caricamento PRE/POST in sequenza."
+        futures = []
+        if pool is not None:
+            try:
+                futures = [pool.submit(caricamento_report.carica_sorgente, *a) for a in argomenti]
+            except BrokenProcessPool:
+                registro.avviso(avviso_pool, "Report")
+
+        # B. Caricamento Template (intanto, in questo processo: è il workbook che verrà scritto)
+        wb_report = None
+        if file_template:
+            wb_report = load_workbook(file_template)
+        elif os.path.exists(FILE_REPORT_DEFAULT):
+            wb_report = load_workbook(FILE_REPORT_DEFAULT)
+        else:
+            registro.avviso(f"Template '{FILE_REPORT_DEFAULT}' non trovato. Creazione nuovo file vuoto.", "Report")
+            from openpyxl import Workbook
+            wb_report = Workbook()
+
+        # Unico punto di attesa dei caricamenti
+        try:
+            sorgenti = [f.result() for f in futures]
+            conteggi.update(processi=len(futures))
+        except BrokenProcessPool:
+            registro.avviso(avviso_pool, "Report")
+            sorgenti = []
+        if not sorgenti:
+            sorgenti = [caricamento_report.carica_sorgente(*a) for a in argomenti]
+        for sorgente in sorgenti:
+            registro.eventi.extend(sorgente["eventi"])
+        pre, post = sorgenti
+        df_pre, df_post = pre["df"], post["df"]
+        if df_pre is None or df_post is None:
+            raise ValueError("Errore nella lettura dei file. Verifica il formato.")
+        conteggi.update(righe_pre=len(df_pre), righe_post=len(df_post))
+        # Valori dei fogli ATLETA (None se non XLSX: si usano i DataFrame)
+        ws_pre_val, ws_post_val = pre["foglio"], post["foglio"]
+
+    ws_report = wb_report.active
+
+    # C. LOGICA ESTRAZIONE & SCRITTURA (mapping e formati da regole.json)
+    piano = regole.carica_piano()
+    
+    # --- ESTRAZIONE NOME ATLETA PER FILE ---
+    nome_atleta = "Atleta_Anonimo"
+    try:
+        # Cerchiamo prima nel POST, poi nel PRE
+        target_ws = ws_post_val if ws_post_val else ws_pre_val
+        if target_ws:
+            cella_c, cella_n = piano.cella_cognome, piano.cella_nome
+            cognome = str(target_ws.cell(row=cella_c.riga, column=cella_c.colonna).value or "").strip()
+            nome = str(target_ws.cell(row=cella_n.riga, column=cella_n.colonna).value or "").strip()
+            
+            if cognome or nome:
+                # Unisci e pulisci spazi/caratteri strani
+                full = f"{cognome}_{nome}".strip('_')
+                # Rimuovi char non validi per filename
+                nome_atleta = re.sub(r'[^\w\-]', '', full.replace(' ', '_'))
+    except Exception as e_name:
+        registro.avviso(f"Errore estrazione nome: {e_name}", "Report")
+
+    # Se non sono XLSX, avremo df_pre e df_post (già caricati sopra con carica_file_universale)
+    # Ma per coerenza usiamo logica dedicata
+    
+    # Font Colors
+    RED_FONT = Font(color="FF0000", bold=True)
+    GREEN_FONT = Font(color="00B050", bold=True) # Verde Excel standard
+    
+    # Intestazioni Colonne Report
+    ws_report["B1"] = "PRIMA"
+    ws_report["C1"] = "DOPO"
+    ws_report["D1"] = "RISULTATI"
+    ws_report["E1"] = "RISULTATI %"
+
+    with misura.stadio("confronto mapping report") as conteggi:
+        # --- 4a. Estrazione valori grezzi PRE/POST ---
+        righe_sorgente = np.array([voce.sorgente.riga for voce in piano.report], dtype=np.int64)
+        colonne_sorgente = np.array([voce.sorgente.colonna for voce in piano.report], dtype=np.int64)
+        grezzi_pre = estrai_valori_mappati(ws_pre_val, df_pre, righe_sorgente, colonne_sorgente)
+        grezzi_post = estrai_valori_mappati(ws_post_val, df_post, righe_sorgente, colonne_sorgente)
+
+        # --- 4b. Pulizia numerica in blocco (testo, unità, virgola decimale) ---
+        confronto = calcola_confronto(pulisci_colonna_numerica(grezzi_pre), pulisci_colonna_numerica(grezzi_post))
+
+        # --- 4c. Scrittura in blocco (valori, formati e colori risolti una volta) ---
+        righe = [voce.riga for voce in piano.report]
+        etichette = [voce.etichetta for voce in piano.report]
+        valori_pre = confronto["pre"].tolist()
+        valori_post = confronto["post"].tolist()
+        diffs = confronto["diff"].tolist()
+        percs = confronto["perc"].tolist()
+        con_perc = confronto["con_perc"].tolist()
+        font_diff = [RED_FONT if negativa else GREEN_FONT for negativa in confronto["diff_negativa"].tolist()]
+        font_perc = [RED_FONT if negativa else GREEN_FONT for negativa in confronto["perc_negativa"].tolist()]
+        formato_valori = piano.formato_valori_report
+        formato_perc = piano.formato_percentuale_report
+
+        celle = []
+        for i, r_idx in enumerate(righe):
+            # Etichetta Report (solo se il template non ne ha già una)
+            if not ws_report.cell(row=r_idx, column=1).value:
+                celle.append((r_idx, 1, etichette[i], None, None))
+            # Colonne B (PRIMA), C (DOPO), D (RISULTATI) e E (RISULTATI %: (Post - Pre) / Pre)
+            celle.append((r_idx, 2, valori_pre[i], None, formato_valori))
+            celle.append((r_idx, 3, valori_post[i], None, formato_valori))
+            celle.append((r_idx, 4, diffs[i], font_diff[i], formato_valori))
+            if con_perc[i]:
+                celle.append((r_idx, 5, percs[i], font_perc[i], formato_perc))
+            else:
+                celle.append((r_idx, 5, "", None, None))
+        scrivi_celle_stilizzate(ws_report, celle)
+
+        # Righe per l'anteprima (PercRaw come numero, es. 10.5, per i grafici)
+        preview_data = [
+            {
+                "Test": etichette[i],
+                "PRIMA": valori_pre[i],
+                "DOPO": valori_post[i],
+                "Diff": diffs[i],
+                "Diff %": f"{percs[i]:.2%}" if con_perc[i] else "",
+                "PercRaw": percs[i] * 100,
+            }
+            for i in range(len(righe))
+        ]
+
+        conteggi.update(metriche=len(preview_data))
+
+    # D. Salvataggio
+    with misura.stadio("wb.save") as conteggi:
+        buffer = io.BytesIO()
+        wb_report.save(buffer)
+        conteggi.update(bytes=buffer.tell())
+
+    try:
+        misura.accoda_jsonl()
+    except OSError as e_log:
+        registro.avviso(f"Impossibile salvare il record prestazioni: {e_log}", "Strumentazione")
+
+    return {
+        "output": buffer.getvalue(),
+        "preview_data": preview_data,
+        "nome_atleta": nome_atleta,
+        "registro": registro,
+        "misura": misura,
+    }
 
 
 def main():
@@ -771,6 +1524,17 @@ def main():
     st.sidebar.title("Menu Navigazione")
     pagina = st.sidebar.radio("Vai a:", ["Athletic Data", "Report"])
 
+    # Profilazione: sempre attiva con CHRONOJUMP_PROFILA=1, oppure toggle visibile solo con ?profilo=1
+    profila = strumentazione.PROFILAZIONE_ATTIVA
+    if st.query_params.get("profilo") == "1":
+        profila = st.sidebar.checkbox("🔬 Profila elaborazione (cProfile + tracemalloc)", value=profila)
+
+    governatore, sessione = get_governatore_memoria(), id_sessione()
+
+    # Vista di amministrazione della memoria: visibile solo con ?admin=1
+    if st.query_params.get("admin") == "1":
+        mostra_memoria_sessioni(governatore, sessione)
+
     if pagina == "Athletic Data":
         # --- Pagina Principale (Codice Esistente) ---
         st.title("🚀 Athletic Data Excel Sync 📈")
@@ -787,6 +1551,7 @@ def main():
         uso_modello_locale = False
 
         if not uploaded_file_modello:
+            governatore.rimuovi(sessione, "modello_athletic")
             if os.path.exists(path_modello_locale):
                 st.info(f"Nessun modello caricato. Verrà usato '{path_modello_locale}' se presente nella cartella.")
                 uso_modello_locale = True
@@ -796,16 +1561,8 @@ def main():
         # --- GESTIONE NOME FILE OUTPUT AUTOMATICO ---
         def estrai_cognome_da_sorgente(df):
             if df is None: return None
-            riga_header = -1
-            col_map = {}
-            for i, riga in df.iterrows():
-                riga_check = [str(x).strip().lower() for x in riga.tolist()]
-                if "id" in riga_check and "nome" in riga_check:
-                    riga_header = i
-                    for idx, col_name in enumerate(riga_check):
-                        col_map[col_name] = idx
-                    break
-            
+            riga_header, col_map = sessioni.trova_intestazione_anagrafica(df.to_numpy(dtype=object))
+
             if riga_header != -1 and riga_header + 1 < len(df):
                 riga_atleta = df.iloc[riga_header + 1]
                 full_name = ""
@@ -838,15 +1595,35 @@ def main():
                     st.session_state['athletic_file_name_val'] = f"Risultati_{cognome_estr}"
                 else:
                     st.session_state['athletic_file_name_val'] = "Risultati_Atleta"
+                # Indice delle sessioni: una sola scansione per file caricato, e per un export
+                # cumulativo dello stesso atleta solo delle righe nuove (vedi filigrana.py)
+                st.session_state['indice_sessioni_athletic'] = (
+                    filigrana.indicizza(df_temp, governatore) if df_temp is not None else None
+                )
+                # Sorgente già letto: l'elaborazione lo riusa finché resta in cache
+                if df_temp is not None:
+                    governatore.registra(sessione, "sorgente_athletic", df_temp, "sorgente", firma=file_sorgente_signature)
         else:
             if st.session_state['last_sorgente_file_sig'] is not None:
                 st.session_state['last_sorgente_file_sig'] = None
                 st.session_state['athletic_file_name_val'] = "Risultati_Atleta"
+                st.session_state['indice_sessioni_athletic'] = None
+                governatore.rimuovi(sessione, "sorgente_athletic")
 
-        # 3. Data dei Dati
+        indice_sessioni = st.session_state.get('indice_sessioni_athletic') if uploaded_file_sorgente else None
+        date_sessioni = indice_sessioni.date if indice_sessioni is not None else []
+
+        # 3. Data dei Dati (sessioni trovate nel file, altrimenti data libera)
         col1, col2 = st.columns(2)
         with col1:
-            data_test = st.date_input("📅 Seleziona Data Test", value=pd.Timestamp.now().date(), format="DD/MM/YYYY")
+            if date_sessioni:
+                data_test = st.selectbox(
+                    "📅 Seleziona Sessione", date_sessioni, index=len(date_sessioni) - 1,
+                    format_func=indice_sessioni.etichetta
+                )
+            else:
+                indice_sessioni = None
+                data_test = st.date_input("📅 Seleziona Data Test", value=pd.Timestamp.now().date(), format="DD/MM/YYYY")
         
         # 4. Nome Output (sincronizzato con lo stato)
         with col2:
@@ -854,8 +1631,16 @@ def main():
             if not athletic_output_name.endswith(".xlsx"):
                 athletic_output_name += ".xlsx"
 
-        # 5. Pulsante elaborazione
-        if st.button("Avvia Elaborazione", type="primary"):
+        if date_sessioni:
+            with st.expander(f"🗓️ Sessioni nel file ({len(date_sessioni)})", expanded=False):
+                st.dataframe(pd.DataFrame(indice_sessioni.tabella()), hide_index=True, width="stretch")
+
+        # 5. Pulsante elaborazione: disattivato finché il lavoro precedente della sessione è in corso,
+        # altrimenti il nuovo lavoro ne prenderebbe il posto lasciandolo orfano sul pool
+        lavoro_precedente = st.session_state.get('lavoro_athletic')
+        in_corso = lavoro_precedente is not None and not lavoro_precedente.future.done()
+        if st.button("Avvia Elaborazione", type="primary", disabled=in_corso,
+                     help="Elaborazione in corso: attendi che finisca" if in_corso else None):
             if not uploaded_file_sorgente:
                 st.error("Per favore carica il file sorgente 'Allenamento'.")
                 return
@@ -870,47 +1655,35 @@ def main():
                 st.error("Manca il file Modello! Caricalo.")
                 return
 
-            with st.spinner("Elaborazione in corso..."):
-                try:
-                    # A. Caricamento Dati
-                    df = carica_file_universale(uploaded_file_sorgente)
-                    if df is None:
-                        st.error("Errore lettura file sorgente. Verifica il formato.")
-                        return
-
-                    # B. Caricamento Modello e Processamento
-                    wb = load_workbook(modello_da_usare)
-                    # Seleziona sempre il primo foglio disponibile
-                    if len(wb.worksheets) > 0:
-                        ws = wb.worksheets[0]
-                        st.info(f"Foglio selezionato automaticamente: {ws.title}")
-                    else:
-                        st.error("Il file modello non contiene fogli di lavoro.")
-                        return
-
-                    # C. Esecuzione Step
-                    elabora_step1_anagrafica(df, ws, data_test)
-                    elabora_salti_cronologici(df, ws, data_test)
-                    elabora_salti_rj(df, ws, data_test)
-
-                    # D. Salvataggio in memoria (BytesIO)
-                    buffer = io.BytesIO()
-                    wb.save(buffer)
-                    buffer.seek(0)
-
-                    st.success("Elaborazione Completata con Successo! ✅")
-
-                    # E. Bottone Download
-                    st.download_button(
-                        label="📥 Scarica File Elaborato",
-                        data=buffer,
-                        file_name=athletic_output_name,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-                except Exception as e:
-                    st.error(f"Errore durante l'elaborazione: {e}")
-                    st.text(traceback.format_exc())
+            # Copie in memoria: il lavoro sopravvive ai rerun e alle interazioni con i widget.
+            # Il modello è copiato una volta per file e tenuto in cache per le elaborazioni successive
+            if not isinstance(modello_da_usare, str):
+                firma_modello = f"{modello_da_usare.name}_{modello_da_usare.size}"
+                dati_modello = governatore.prendi(sessione, "modello_athletic", firma=firma_modello)
+                if dati_modello is None:
+                    dati_modello = modello_da_usare.getvalue()
+                    governatore.registra(sessione, "modello_athletic", dati_modello, "modello", firma=firma_modello)
+                modello_da_usare = io.BytesIO(dati_modello)
+                modello_da_usare.name = uploaded_file_modello.name
+            governatore.rimuovi(sessione, "output_athletic")
+            governatore.rimuovi(sessione, "anteprima_athletic")
+            # Step memorizzati della sessione: dopo un cambio di data o di modello si ricalcola solo il necessario
+            passi = governatore.prendi(sessione, "passi_athletic")
+            if passi is None:
+                passi = incrementale.CacheStep()
+                governatore.registra(sessione, "passi_athletic", passi, "modello")
+            st.session_state['lavoro_athletic'] = invia_elaborazione(
+                copia_upload(uploaded_file_sorgente), modello_da_usare, data_test, athletic_output_name, profila,
+                indice_sessioni,
+                df_sorgente=governatore.prendi(sessione, "sorgente_athletic", firma=file_sorgente_signature),
+                passi=passi
+            )
+            # Subito un nuovo run: il pulsante è ridisegnato disattivato (durante il lavoro si
+            # ripete solo il frammento dell'avanzamento)
+            st.rerun()
+
+        # 6. Stato dell'ultima elaborazione (in corso o completata)
+        mostra_lavoro_athletic()
 
     elif pagina == "Report":
         
@@ -970,269 +1743,43 @@ def main():
         if not report_output_name.endswith(".xlsx"):
             report_output_name += ".xlsx"
 
-        # 2. Bottone Generazione
+        # 2. Bottone Generazione: il report resta nella sessione e viene mostrato ad ogni rerun
+        # (livello del log, pagina dell'anteprima...), come il lavoro della pagina Athletic Data
         if st.button("Genera Report Comparativo", type="primary"):
+            st.session_state.pop('report_generato', None)
+            governatore.rimuovi(sessione, "output_report")
             if not file_pre or not file_post:
                 st.error("⚠️ Per favore carica entrambi i file PRE e POST.")
             else:
                 with st.spinner("⏳ Generazione Report in corso..."):
                     try:
-                        # A. Caricamento DataFrames
-                        df_pre = carica_file_universale(file_pre)
-                        df_post = carica_file_universale(file_post)
-                        
-                        if df_pre is None or df_post is None:
-                            st.error("Errore nella lettura dei file. Verifica il formato.")
-                            st.stop()
-
-                        # B. Caricamento Template
-                        wb_report = None
-                        if file_template:
-                            wb_report = load_workbook(file_template)
-                        elif os.path.exists("report.xlsx"):
-                            wb_report = load_workbook("report.xlsx")
+                        registro = RegistroEventi(LIVELLO_LOG_DEFAULT)
+                        profilo = None
+                        if profila:
+                            risultato, profilo = strumentazione.esegui_profilato(
+                                genera_report_comparativo, file_pre, file_post, file_template, registro,
+                                pool=get_pool_report()
+                            )
                         else:
-                            st.warning("⚠️ Template 'report.xlsx' non trovato. Creazione nuovo file vuoto.")
-                            from openpyxl import Workbook
-                            wb_report = Workbook()
-                        
-                        ws_report = wb_report.active
-
-                        # C. LOGICA ESTRAZIONE & SCRITTURA
-                        
-                        MAPPING_CONFIG = [
-                            {"label": "PESO", "row_report": 2, "cell_source": "C4"},
-                            {"label": "COSCIA DX", "row_report": 3, "cell_source": "G5"},
-                            {"label": "COSCIA SX", "row_report": 4, "cell_source": "H5"},
-                            {"label": "CMJ OPEN SQUAT NA [ABK]", "row_report": 5, "cell_source": "J9"},
-                            {"label": "CMJ HALF SQUAT NA [CMJ]", "row_report": 6, "cell_source": "J10"},
-                            {"label": "CMJ OPEN SQUAT BL [ABK]", "row_report": 7, "cell_source": "J12"},
-                            {"label": "CMJ HALF SQUAT BL [CMJ]", "row_report": 8, "cell_source": "J13"},
-                            {"label": "SL CMJ DX BL", "row_report": 9, "cell_source": "I15"},
-                            {"label": "SL CMJ SX BL", "row_report": 10, "cell_source": "I16"},
-                            {"label": "RJ [Unlimited]", "row_report": 11, "cell_source": "F19"},
-                            {"label": "Vertec - SAM", "row_report": 12, "cell_source": "E26"},
-                            {"label": "Vertec - SDA", "row_report": 13, "cell_source": "E27"},
-                            {"label": "DJa 30cm", "row_report": 14, "cell_source": "S4"},
-                            {"label": "DJa 45cm", "row_report": 15, "cell_source": "S5"},
-                            {"label": "DJa 60cm", "row_report": 16, "cell_source": "S6"},
-                            {"label": "DJa 75cm", "row_report": 17, "cell_source": "S7"},
-                            {"label": "DJa 90cm", "row_report": 18, "cell_source": "S8"},
-                            {"label": "DJa 105cm", "row_report": 19, "cell_source": "S9"},
-                            {"label": "SJ", "row_report": 20, "cell_source": "W15"},
-                            {"label": "SJi 25%", "row_report": 21, "cell_source": "W16"},
-                            {"label": "SJi 50%", "row_report": 22, "cell_source": "W17"},
-                            {"label": "SJi 75%", "row_report": 23, "cell_source": "W18"},
-                            {"label": "SJi 100%", "row_report": 24, "cell_source": "W19"},
-                            {"label": "1RM", "row_report": 25, "cell_source": "U28"},
-                        ]
-
-                        # --- 1. Funzione di Pulizia Avanzata ---
-                        def clean_numeric_value(val):
-                            """
-                            Pulisce il valore da testo (kg, cm, etc), converte virgola in punto
-                            e restituisce float. Se fallisce restituisce 0.0.
-                            """
-                            if val is None: return 0.0
-                            s = str(val).strip()
-                            if s == "": return 0.0
-                            
-                            # Rimuove tutto tranne numeri, punto, virgola, segno meno
-                            s_clean = re.sub(r'[^\d.,\-]', '', s)
-                            if not s_clean: return 0.0
-                            
-                            # Sostituisce virgola con punto
-                            s_clean = s_clean.replace(',', '.')
-                            
-                            try:
-                                return float(s_clean)
-                            except:
-                                return 0.0
-
-                        # --- 2. Helper Caricamento Excel Robusto ---
-                        def load_excel_robust(file_upl, nome_log):
-                            """
-                            Carica WB DataOnly (per valori) e WB Formule (per check).
-                            Cerca foglio 'ATLETA' (case insensitive).
-                            Restituisce (ws_val, ws_form, error_msg)
-                            """
-                            if not file_upl.name.lower().endswith('.xlsx'):
-                                return None, None, "Not XLSX"
-
-                            try:
-                                # WB Valori (Data Only = True)
-                                file_upl.seek(0)
-                                wb_val = load_workbook(file_upl, data_only=True)
-                                
-                                # WB Formule (Data Only = False)
-                                file_upl.seek(0)
-                                wb_form = load_workbook(file_upl, data_only=False)
-
-                                # Ricerca Foglio
-                                sheet_name = None
-                                for s in wb_val.sheetnames:
-                                    if "atleta" in s.lower().strip():
-                                        sheet_name = s
-                                        break
-                                
-                                if not sheet_name:
-                                    sheet_name = wb_val.sheetnames[0]
-                                    st.warning(f"⚠️ Nel file {nome_log} non ho trovato il foglio 'ATLETA'. Uso il primo foglio: '{sheet_name}'")
-                                else:
-                                    st.info(f"✅ File {nome_log}: trovato foglio target '{sheet_name}'")
-
-                                return wb_val[sheet_name], wb_form[sheet_name], None
-
-                            except Exception as e:
-                                return None, None, str(e)
-
-                        # --- 3. Caricamento Workbooks (Una volta sola) ---
-                        ws_pre_val, ws_pre_form, err_pre = load_excel_robust(file_pre, "PRE")
-                        ws_post_val, ws_post_form, err_post = load_excel_robust(file_post, "POST")
-                        
-                        # --- ESTRAZIONE NOME ATLETA PER FILE ---
-                        nome_atleta = "Atleta_Anonimo"
-                        try:
-                            # Cerchiamo prima nel POST, poi nel PRE
-                            target_ws = ws_post_val if ws_post_val else ws_pre_val
-                            if target_ws:
-                                cognome = str(target_ws["C1"].value or "").strip()
-                                nome = str(target_ws["E1"].value or "").strip()
-                                
-                                if cognome or nome:
-                                    # Unisci e pulisci spazi/caratteri strani
-                                    full = f"{cognome}_{nome}".strip('_')
-                                    # Rimuovi char non validi per filename
-                                    nome_atleta = re.sub(r'[^\w\-]', '', full.replace(' ', '_'))
-                        except Exception as e_name:
-                            print(f"Errore estrazione nome: {e_name}")
-
-                        # Se non sono XLSX, avremo df_pre e df_post (già caricati sopra con carica_file_universale)
-                        # Ma per coerenza usiamo logica dedicata
-                        
-                        # Font Colors
-                        RED_FONT = Font(color="FF0000", bold=True)
-                        GREEN_FONT = Font(color="00B050", bold=True) # Verde Excel standard
-                        
-                        # Intestazioni Colonne Report
-                        ws_report["B1"] = "PRIMA"
-                        ws_report["C1"] = "DOPO"
-                        ws_report["D1"] = "RISULTATI"
-                        ws_report["E1"] = "RISULTATI %"
-
-                        # --- LISTA PER ANTEPRIMA ---
-                        preview_data = []
-
-                        # --- 4. Iterazione Mapping ---
-                        for mappa in MAPPING_CONFIG:
-                            r_idx = mappa["row_report"]
-                            label = mappa.get("label", "")
-                            coord = mappa["cell_source"]
-                            
-                            # Etichetta Report
-                            cell_label = ws_report.cell(row=r_idx, column=1)
-                            if not cell_label.value:
-                                cell_label.value = label
-
-                            # --- Estrazione PRE ---
-                            raw_pre = None
-                            if ws_pre_val: # Uso Excel OpenPyXL
-                                cell_v = ws_pre_val[coord]
-                                raw_pre = cell_v.value
-                            else: # Uso DataFrame
-                                try:
-                                    r, c = coordinate_to_tuple(coord)
-                                    raw_pre = df_pre.iloc[r-1, c-1] if df_pre is not None else 0
-                                except: raw_pre = 0
-
-                            val_pre = clean_numeric_value(raw_pre)
-
-                            # --- Estrazione POST ---
-                            raw_post = None
-                            if ws_post_val: # Uso Excel OpenPyXL
-                                cell_v = ws_post_val[coord]
-                                raw_post = cell_v.value
-                            else:
-                                try:
-                                    r, c = coordinate_to_tuple(coord)
-                                    raw_post = df_post.iloc[r-1, c-1] if df_post is not None else 0
-                                except: raw_post = 0
-
-                            val_post = clean_numeric_value(raw_post)
-                            
-                            # 1. Scrittura Colonna B (PRIMA) e C (DOPO)
-                            cell_prima = ws_report.cell(row=r_idx, column=2)
-                            cell_dopo = ws_report.cell(row=r_idx, column=3)
-                            
-                            cell_prima.value = val_pre
-                            cell_dopo.value = val_post
-                            
-                            cell_prima.number_format = '0.00'
-                            cell_dopo.number_format = '0.00'
-
-                            # 2. Calcolo Differenza (Colonna D = 4)
-                            diff = val_post - val_pre
-                            cell_diff = ws_report.cell(row=r_idx, column=4)
-                            cell_diff.value = diff
-                            cell_diff.number_format = '0.00'
-                            
-                            if diff < 0:
-                                cell_diff.font = RED_FONT
-                            else:
-                                cell_diff.font = GREEN_FONT
-
-                            # 3. Calcolo % (Colonna E = 5)
-                            # (Post - Pre) / Pre
-                            cell_perc = ws_report.cell(row=r_idx, column=5)
-                            perc_val = 0.0
-                            if val_pre != 0:
-                                perc = (diff / val_pre) # Decimale
-                                perc_val = perc
-                                cell_perc.value = perc
-                                cell_perc.number_format = '0.00%'
-                                
-                                if perc < 0:
-                                    cell_perc.font = RED_FONT
-                                else:
-                                    cell_perc.font = GREEN_FONT
-                            else:
-                                cell_perc.value = ""
-                            
-                            # Aggiungi riga ai dati per anteprima
-                            preview_data.append({
-                                "Test": label,
-                                "PRIMA": val_pre,
-                                "DOPO": val_post,
-                                "Diff": diff,
-                                "Diff %": f"{perc_val:.2%}" if val_pre != 0 else "",
-                                "PercRaw": perc_val * 100 # Salviamo come numero (es. 10.5) per i grafici
-                            })
-                        
-                        # --- ANTEPRIMA ---
-                        if preview_data:
-                            st.write("### 📂 Anteprima Report Generato")
-                            df_dashboard = pd.DataFrame(preview_data)
-                            
-                            # Mostra Tabella (senza colonna PercRaw che è tecnica)
-                            st.dataframe(df_dashboard.drop(columns=["PercRaw"]), width="stretch")
-
-
-                        # D. Salvataggio
-                        buffer = io.BytesIO()
-                        wb_report.save(buffer)
-                        buffer.seek(0)
-                        
-                        st.success("Report Generato con Successo!")
-                        st.download_button(
-                            label="📥 Scarica Report Comparativo",
-                            data=buffer,
-                            file_name=report_output_name,
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
+                            risultato = genera_report_comparativo(
+                                file_pre, file_post, file_template, registro, pool=get_pool_report()
+                            )
+                        report = {
+                            'registro': registro, 'preview_data': risultato['preview_data'],
+                            'misura': risultato['misura'], 'profilo': profilo,
+                        }
+                        governatore.registra(sessione, "output_report", risultato['output'], "output", firma=id(report))
+                        st.session_state['report_generato'] = report
 
                     except Exception as e:
                         st.error(f"Errore durante l'elaborazione del report: {e}")
                         st.write(traceback.format_exc())
 
+        mostra_report_generato(report_output_name)
+
+        # 3. Confronto e andamento della squadra dallo storico
+        mostra_confronto_storico()
+        mostra_andamento_squadra()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+"""
+Governatore della memoria per gli artefatti tenuti in cache dalle sessioni Streamlit.
+
+Le sessioni tengono in memoria il sorgente già letto (DataFrame), il modello caricato e i file
+generati. Il governatore è unico per processo e condiviso da tutte le sessioni. Registra ogni
+artefatto con una stima della sua dimensione. Quando il totale supera il budget rimuove gli
+artefatti usati meno di recente, di qualunque sessione.
+Rimuovere un artefatto significa solo lasciarne il riferimento: chi lo sta già usando (es.
+un'elaborazione in corso) continua ad averlo, la memoria si libera quando ha finito.
+"""
+import io
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURAZIONE MEMORIA ---
+# Budget complessivo (MB) degli artefatti in cache di tutte le sessioni del processo
+BUDGET_MEMORIA_MB = float(os.environ.get("CHRONOJUMP_BUDGET_MEMORIA_MB", "512"))
+
+# Categorie di artefatti tracciati
+CATEGORIE = ("sorgente", "modello", "output")
+
+
+def stima_byte(valore):
+    """Stima della memoria occupata da un artefatto (bytes, buffer, DataFrame, array, contenitori)."""
+    if valore is None:
+        return 0
+    if isinstance(valore, (bytes, bytearray)):
+        return len(valore)
+    if isinstance(valore, io.BytesIO):
+        return valore.getbuffer().nbytes
+    if isinstance(valore, (pd.DataFrame, pd.Series)):
+        utilizzo = valore.memory_usage(deep=True)
+        return int(utilizzo.sum() if isinstance(utilizzo, pd.Series) else utilizzo)
+    if isinstance(valore, np.ndarray):
+        return valore.nbytes
+    if isinstance(valore, dict):
+        return sys.getsizeof(valore) + sum(stima_byte(v) for v in valore.values())
+    if isinstance(valore, (list, tuple)):
+        return sys.getsizeof(valore) + sum(stima_byte(v) for v in valore)
+    if hasattr(valore, "nbytes"):
+        # Oggetti che stimano da sé la propria dimensione (es. incrementale.CacheStep)
+        return int(valore.nbytes)
+    return sys.getsizeof(valore)
+
+
+class Artefatto:
+    """Valore in cache di una sessione, con dimensione stimata e istante dell'ultimo uso."""
+
+    __slots__ = ("sessione", "chiave", "categoria", "valore", "byte", "firma", "usato_il")
+
+    def __init__(self, sessione, chiave, categoria, valore, firma=None):
+        self.sessione = sessione
+        self.chiave = chiave
+        self.categoria = categoria
+        self.valore = valore
+        self.byte = stima_byte(valore)
+        self.firma = firma          # es. nome e dimensione del file da cui deriva
+        self.usato_il = time.time()
+
+
+class GovernatoreMemoria:
+    """
+    Artefatti in cache di tutte le sessioni, in ordine di ultimo uso (LRU).
+    I metodi sono thread-safe: le sessioni Streamlit girano in thread diversi.
+    """
+
+    def __init__(self, budget_mb=BUDGET_MEMORIA_MB):
+        self.budget_byte = int(budget_mb * 1024 * 1024)
+        self.artefatti = OrderedDict()    # (sessione, chiave) -> Artefatto, dal meno recente
+        self.byte_totali = 0
+        self.espulsi = 0
+        self._lock = threading.Lock()
+
+    def registra(self, sessione, chiave, valore, categoria, firma=None):
+        """
+        Mette in cache un artefatto (sostituendo quello con la stessa chiave) e, se il budget è
+        superato, espelle gli artefatti meno recenti. L'artefatto appena registrato resta
+        anche se da solo supera il budget. Restituisce le chiavi (sessione, chiave) espulse.
+        """
+        if categoria not in CATEGORIE:
+            raise ValueError(f"Categoria '{categoria}' non valida {CATEGORIE}")
+        nuovo = Artefatto(sessione, chiave, categoria, valore, firma)
+        with self._lock:
+            self._togli((sessione, chiave))
+            self.artefatti[(sessione, chiave)] = nuovo
+            self.byte_totali += nuovo.byte
+            espulsi = []
+            while self.byte_totali > self.budget_byte and len(self.artefatti) > 1:
+                chiave_lru = next(iter(self.artefatti))
+                self._togli(chiave_lru)
+                self.espulsi += 1
+                espulsi.append(chiave_lru)
+            return espulsi
+
+    def prendi(self, sessione, chiave, firma=None):
+        """Valore in cache (segnato come appena usato); None se assente, espulso o con firma diversa."""
+        with self._lock:
+            artefatto = self.artefatti.get((sessione, chiave))
+            if artefatto is None or (firma is not None and artefatto.firma != firma):
+                return None
+            artefatto.usato_il = time.time()
+            self.artefatti.move_to_end((sessione, chiave))
+            return artefatto.valore
+
+    def rimuovi(self, sessione, chiave):
+        with self._lock:
+            self._togli((sessione, chiave))
+
+    def rimuovi_sessione(self, sessione):
+        with self._lock:
+            for chiave in [k for k in self.artefatti if k[0] == sessione]:
+                self._togli(chiave)
+
+    def _togli(self, chiave):
+        artefatto = self.artefatti.pop(chiave, None)
+        if artefatto is not None:
+            self.byte_totali -= artefatto.byte
+
+    def riepilogo(self):
+        """Totali per la vista di amministrazione."""
+        with self._lock:
+            return {
+                "byte_totali": self.byte_totali,
+                "budget_byte": self.budget_byte,
+                "artefatti": len(self.artefatti),
+                "sessioni": len({k[0] for k in self.artefatti}),
+                "espulsi": self.espulsi,
+            }
+
+    def tabella(self, sessione_corrente=None):
+        """Righe per st.dataframe: un artefatto per riga, dal più recente."""
+        adesso = time.time()
+        with self._lock:
+            artefatti = list(reversed(self.artefatti.values()))
+        righe = []
+        for a in artefatti:
+            nome_sessione = str(a.sessione)[:8]
+            if a.sessione == sessione_corrente:
+                nome_sessione += " (questa)"
+            righe.append({
+                "Sessione": nome_sessione,
+                "Categoria": a.categoria,
+                "Artefatto": a.chiave,
+                "MB": round(a.byte / (1024 * 1024), 2),
+                "Inattivo da (s)": int(adesso - a.usato_il),
+            })
+        return righe
@@ -0,0 +1,233 @@
+"""
+Elaborazione automatica degli export copiati in una cartella (es. condivisa con il PC Chronojump).
+
+La cartella viene controllata a intervalli regolari. Un export (xlsx, csv, numbers) è preso in
+carico solo quando dimensione e data di modifica restano invariate per --stabilita secondi, così
+i file ancora in copia non vengono letti a metà. Ogni contenuto è elaborato una volta sola:
+l'impronta SHA-256 dei file già elaborati è salvata nella cartella (FILE_REGISTRO), quindi
+copie identiche o riavvii dell'osservatore non rielaborano nulla, mentre un export cumulativo
+sovrascritto con nuove sessioni viene rielaborato.
+L'elaborazione (anagrafica, salti, RJ sull'ultima sessione del file, modello excel.xlsx) gira
+in un pool di --worker processi, gli stessi del servizio HTTP (vedi servizio.elabora_export);
+il risultato 'Risultati_<nome>.xlsx' viene scritto accanto all'export.
+
+Esempio:
+    python osservatore.py /percorso/cartella_condivisa --worker 2 --intervallo 2 --stabilita 3
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+
+import servizio
+
+# --- CONFIGURAZIONE OSSERVATORE ---
+INTERVALLO_S_DEFAULT = float(os.environ.get("CHRONOJUMP_OSSERVATORE_INTERVALLO", "2"))
+# Secondi senza modifiche prima di considerare completo un file copiato
+STABILITA_S_DEFAULT = float(os.environ.get("CHRONOJUMP_OSSERVATORE_STABILITA", "3"))
+WORKER_DEFAULT = int(os.environ.get("CHRONOJUMP_OSSERVATORE_WORKER", "2"))
+
+ESTENSIONI = (".xlsx", ".csv", ".numbers")
+PREFISSO_RISULTATI = "Risultati_"
+# Impronte dei contenuti già elaborati, nella cartella osservata
+FILE_REGISTRO = ".chronojump_elaborati.json"
+
+
+def _da_considerare(nome):
+    """Export candidati: niente file nascosti o temporanei di Office, niente risultati già scritti."""
+    return (
+        nome.lower().endswith(ESTENSIONI)
+        and not nome.startswith((".", "~$", PREFISSO_RISULTATI))
+    )
+
+
+def _scrivi_atomico(percorso, dati):
+    """Scrive in un file nascosto accanto e poi lo rinomina: mai un risultato scritto a metà."""
+    cartella, nome = os.path.split(percorso)
+    temporaneo = os.path.join(cartella, f".{nome}.tmp")
+    with open(temporaneo, "wb") as f:
+        f.write(dati)
+    os.replace(temporaneo, percorso)
+
+
+class Osservatore:
+    """Stato dell'osservazione di una cartella: file in attesa di stabilità, lavori in corso, registro."""
+
+    def __init__(self, cartella, worker=WORKER_DEFAULT, stabilita_s=STABILITA_S_DEFAULT, dati_modello=None):
+        self.cartella = os.path.abspath(cartella)
+        self.worker = worker
+        self.stabilita_s = stabilita_s
+        self.dati_modello = dati_modello
+        self.in_attesa = {}    # nome -> ((dimensione, mtime_ns), stabile dal)
+        self.in_corso = {}     # future -> (nome, impronta)
+        self.registro = self._leggi_registro()
+        self._pool = None
+
+    @property
+    def pool(self):
+        """Pool dei worker, creato alla prima elaborazione e ricreato se un processo termina male."""
+        if self._pool is None:
+            # 'spawn' come il servizio: ogni processo carica una volta regole e modello di default
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.worker, mp_context=get_context("spawn"), initializer=servizio._inizializza_worker
+            )
+        return self._pool
+
+    # --- Registro delle impronte ---
+
+    @property
+    def path_registro(self):
+        return os.path.join(self.cartella, FILE_REGISTRO)
+
+    def _leggi_registro(self):
+        try:
+            with open(self.path_registro, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Registro {FILE_REGISTRO} illeggibile ({e}): riparto da vuoto")
+            return {}
+
+    def _salva_registro(self):
+        _scrivi_atomico(self.path_registro, json.dumps(self.registro, indent=1, ensure_ascii=False).encode("utf-8"))
+
+    # --- Ciclo ---
+
+    def scansiona(self, adesso=None):
+        """
+        Un passaggio sulla cartella: aggiorna i file in attesa e restituisce i nomi stabili da
+        almeno stabilita_s secondi (e non già in elaborazione).
+        """
+        adesso = time.monotonic() if adesso is None else adesso
+        presenti = {}
+        with os.scandir(self.cartella) as voci:
+            for voce in voci:
+                if voce.is_file() and _da_considerare(voce.name):
+                    stato = voce.stat()
+                    presenti[voce.name] = (stato.st_size, stato.st_mtime_ns)
+
+        in_elaborazione = {nome for nome, _ in self.in_corso.values()}
+        stabili = []
+        for nome, firma in presenti.items():
+            precedente = self.in_attesa.get(nome)
+            if precedente is None or precedente[0] != firma:
+                # Nuovo o ancora in scrittura: il conteggio della stabilità riparte
+                self.in_attesa[nome] = (firma, adesso)
+            elif adesso - precedente[1] >= self.stabilita_s and nome not in in_elaborazione:
+                stabili.append(nome)
+        for nome in set(self.in_attesa) - set(presenti):
+            del self.in_attesa[nome]
+        return sorted(stabili)
+
+    def invia(self, nome):
+        """Legge un file stabile e lo mette in elaborazione se il suo contenuto è nuovo. True se inviato."""
+        path = os.path.join(self.cartella, nome)
+        try:
+            with open(path, "rb") as f:
+                dati = f.read()
+        except OSError as e:
+            print(f"{nome}: impossibile leggere ({e}), riprovo al prossimo controllo")
+            return False
+        firma = self.in_attesa[nome][0]
+        impronta = hashlib.sha256(dati).hexdigest()
+        # Il file resta in attesa solo finché non cambia di nuovo
+        self.in_attesa[nome] = (firma, float("inf"))
+        # Contenuto già elaborato o in elaborazione (es. la stessa copia con un altro nome)
+        if impronta in self.registro or any(impronta == i for _, i in self.in_corso.values()):
+            return False
+        future = self.pool.submit(servizio.elabora_export, nome, dati, None, self.dati_modello)
+        self.in_corso[future] = (nome, impronta)
+        print(f"{nome}: in elaborazione")
+        return True
+
+    def raccogli(self, attendi=False):
+        """Scrive i risultati dei lavori terminati e li registra. Restituisce il numero di lavori chiusi."""
+        chiusi = 0
+        for future in list(self.in_corso):
+            if not attendi and not future.done():
+                continue
+            nome, impronta = self.in_corso.pop(future)
+            voce = {"file": nome, "elaborato_il": datetime.now().isoformat(timespec="seconds")}
+            try:
+                risultato = future.result()
+                output = os.path.join(self.cartella, risultato["nome"])
+                _scrivi_atomico(output, risultato["output"])
+                voce.update(output=risultato["nome"], data_test=risultato["data_test"])
+                print(f"{nome}: sessione {risultato['data_test']} -> {risultato['nome']}")
+                if risultato["avvisi"]:
+                    print(risultato["avvisi"])
+            except BrokenProcessPool:
+                # Worker terminato (es. memoria esaurita): non è colpa del file, verrà ritentato
+                print(f"{nome}: worker terminato inaspettatamente, riprovo al prossimo controllo")
+                self.in_attesa.pop(nome, None)
+                self._pool = None
+                continue
+            except Exception as e:
+                # Registrato comunque: lo stesso contenuto non viene ritentato, una nuova copia sì
+                voce["errore"] = str(e)
+                print(f"{nome}: errore durante l'elaborazione: {e}")
+            self.registro[impronta] = voce
+            chiusi += 1
+        if chiusi:
+            self._salva_registro()
+        return chiusi
+
+    def passo(self):
+        """Raccolta dei risultati e invio dei nuovi file stabili, senza superare i worker disponibili."""
+        self.raccogli()
+        for nome in self.scansiona():
+            if len(self.in_corso) >= self.worker:
+                break  # gli altri restano stabili e partono ai controlli successivi
+            self.invia(nome)
+
+    def osserva(self, intervallo_s=INTERVALLO_S_DEFAULT, una_volta=False):
+        """
+        Controlla la cartella ogni intervallo_s secondi. Con una_volta si ferma quando tutti i file
+        presenti sono stati elaborati (o scartati perché già noti).
+        """
+        while True:
+            self.passo()
+            if una_volta and not self.in_corso and all(t == float("inf") for _, t in self.in_attesa.values()):
+                return
+            time.sleep(intervallo_s)
+
+    def chiudi(self):
+        self.raccogli(attendi=True)
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def main_osservatore():
+    parser = argparse.ArgumentParser(description="Elabora automaticamente gli export Chronojump copiati in una cartella.")
+    parser.add_argument("cartella", help="Cartella da osservare (i risultati vengono scritti qui)")
+    parser.add_argument("--intervallo", type=float, default=INTERVALLO_S_DEFAULT, help="Secondi tra due controlli")
+    parser.add_argument("--stabilita", type=float, default=STABILITA_S_DEFAULT,
+                        help="Secondi senza modifiche prima di elaborare un file")
+    parser.add_argument("--worker", type=int, default=WORKER_DEFAULT, help="Processi di elaborazione")
+    parser.add_argument("--modello", default=None, help="Modello Excel (default: excel.xlsx del progetto)")
+    parser.add_argument("--una-volta", action="store_true", help="Elabora i file presenti ed esci")
+    args = parser.parse_args()
+
+    dati_modello = None
+    if args.modello:
+        with open(args.modello, "rb") as f:
+            dati_modello = f.read()
+
+    osservatore = Osservatore(args.cartella, args.worker, args.stabilita, dati_modello)
+    print(f"Osservo {osservatore.cartella} ogni {args.intervallo:g}s ({args.worker} worker)")
+    try:
+        osservatore.osserva(args.intervallo, args.una_volta)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        osservatore.chiudi()
+
+
+if __name__ == "__main__":
+    main_osservatore()
@@ -0,0 +1,216 @@
+"""
+Piano delle regole di scrittura (anagrafica, salti, RJ, mapping del report).
+
+Le regole vivono in un file versionato (regole.json, oppure YAML se PyYAML è installato),
+vengono validate una sola volta e compilate in un piano immutabile con coordinate già
+risolte in (riga, colonna), tipi di salto normalizzati e formati numerici espliciti.
+Il piano è in cache per tutta la vita del processo.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from openpyxl.utils.cell import coordinate_to_tuple
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# --- CONFIGURAZIONE ---
+FILE_REGOLE_DEFAULT = os.environ.get(
+    "CHRONOJUMP_REGOLE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "regole.json")
+)
+VERSIONI_SUPPORTATE = (1,)
+
+# Tipi di salto equivalenti: una regola "SJi" accetta anche le serie "SJl"
+ALIAS_TIPI = {"sji": ("sjl",)}
+DISCRIMINANTI = ("Caduta", "Peso")
+
+
+class Cella(NamedTuple):
+    coord: str
+    riga: int
+    colonna: int
+
+
+class CampoAnagrafica(NamedTuple):
+    etichetta: str
+    chiavi: tuple          # intestazioni accettate, normalizzate (etichetta + alias)
+    cella: Cella
+    valori: tuple          # coppie (valore sorgente maiuscolo, valore scritto), es. ("M", "UOMO")
+
+
+class OutputSalto(NamedTuple):
+    dato: str
+    celle: tuple           # tuple di Cella
+    decimali: Optional[int]  # None = nessun arrotondamento
+    formato: str
+
+
+class RegolaSalto(NamedTuple):
+    tipo: str
+    tipi_accettati: frozenset
+    discriminante: Optional[tuple]  # (colonna, valore) oppure None
+    cella_peso: Optional[Cella]
+    outputs: tuple
+    metrica: str           # nome univoco della regola (es. "ABK #2", "DJa Caduta 30 #1")
+
+
+class OutputRJ(NamedTuple):
+    dato: str
+    cella: Cella
+    decimali: int
+    formato: str
+
+
+class VoceReport(NamedTuple):
+    etichetta: str
+    riga: int
+    sorgente: Cella
+
+
+class PianoRegole(NamedTuple):
+    versione: int
+    cella_data: Cella
+    cella_cognome: Cella
+    cella_nome: Cella
+    decimali_anagrafica: int
+    formato_anagrafica: str
+    anagrafica: tuple
+    decimali_peso: int
+    formato_peso: str
+    salti: tuple
+    rj: tuple
+    formato_valori_report: str
+    formato_percentuale_report: str
+    report: tuple
+
+
+def _cella(coord, contesto):
+    if not isinstance(coord, str):
+        raise ValueError(f"{contesto}: coordinata non valida {coord!r}")
+    try:
+        riga, colonna = coordinate_to_tuple(coord.strip().upper())
+    except Exception:
+        raise ValueError(f"{contesto}: coordinata non valida {coord!r}")
+    return Cella(coord.strip().upper(), riga, colonna)
+
+
+def _richiesto(diz, chiave, contesto):
+    if chiave not in diz:
+        raise ValueError(f"{contesto}: manca il campo '{chiave}'")
+    return diz[chiave]
+
+
+def compila_piano(config):
+    """Valida il dizionario di configurazione e lo compila in un PianoRegole immutabile."""
+    versione = _richiesto(config, "versione", "regole")
+    if versione not in VERSIONI_SUPPORTATE:
+        raise ValueError(f"regole: versione {versione!r} non supportata (supportate: {VERSIONI_SUPPORTATE})")
+
+    # --- Anagrafica ---
+    anag = _richiesto(config, "anagrafica", "regole")
+    campi = []
+    for k, campo in enumerate(_richiesto(anag, "campi", "anagrafica")):
+        contesto = f"anagrafica.campi[{k}]"
+        etichetta = _richiesto(campo, "etichetta", contesto)
+        chiavi = tuple(c.strip().lower() for c in [etichetta] + list(campo.get("alias", [])))
+        valori = tuple((str(s).strip().upper(), d) for s, d in campo.get("valori", {}).items())
+        campi.append(CampoAnagrafica(etichetta, chiavi, _cella(_richiesto(campo, "cella", contesto), contesto), valori))
+
+    # --- Salti ---
+    salti_conf = _richiesto(config, "salti", "regole")
+    decimali_salti = salti_conf.get("decimali", 1)
+    formato_salti = salti_conf.get("formato", "0.00")
+    regole_salti = []
+    occorrenze = {}
+    for k, regola in enumerate(_richiesto(salti_conf, "regole", "salti")):
+        contesto = f"salti.regole[{k}]"
+        tipo = str(_richiesto(regola, "tipo", contesto)).strip()
+        tipo_norm = tipo.lower()
+
+        discriminante = None
+        if regola.get("discriminante"):
+            d = regola["discriminante"]
+            colonna = _richiesto(d, "colonna", contesto)
+            if colonna not in DISCRIMINANTI:
+                raise ValueError(f"{contesto}: discriminante '{colonna}' non supportato {DISCRIMINANTI}")
+            discriminante = (colonna, float(_richiesto(d, "valore", contesto)))
+
+        outputs = []
+        for j, out in enumerate(_richiesto(regola, "outputs", contesto)):
+            contesto_out = f"{contesto}.outputs[{j}]"
+            celle = tuple(_cella(c, contesto_out) for c in _richiesto(out, "celle", contesto_out))
+            if not celle:
+                raise ValueError(f"{contesto_out}: nessuna cella")
+            outputs.append(OutputSalto(
+                _richiesto(out, "dato", contesto_out), celle,
+                out.get("decimali", decimali_salti), out.get("formato", formato_salti)
+            ))
+
+        nome = tipo if discriminante is None else f"{tipo} {discriminante[0]} {discriminante[1]:g}"
+        occorrenze[nome] = occorrenze.get(nome, 0) + 1
+        cella_peso = _cella(regola["cella_peso"], contesto) if regola.get("cella_peso") else None
+        regole_salti.append(RegolaSalto(
+            tipo, frozenset((tipo_norm,) + ALIAS_TIPI.get(tipo_norm, ())), discriminante,
+            cella_peso, tuple(outputs), f"{nome} #{occorrenze[nome]}"
+        ))
+
+    # --- RJ ---
+    rj = []
+    for k, out in enumerate(_richiesto(config, "rj", "regole")):
+        contesto = f"rj[{k}]"
+        rj.append(OutputRJ(
+            _richiesto(out, "dato", contesto), _cella(_richiesto(out, "cella", contesto), contesto),
+            int(_richiesto(out, "decimali", contesto)), _richiesto(out, "formato", contesto)
+        ))
+
+    # --- Report ---
+    formati_report = config.get("formati_report", {})
+    report = []
+    righe_viste = set()
+    for k, voce in enumerate(_richiesto(config, "report", "regole")):
+        contesto = f"report[{k}]"
+        riga = int(_richiesto(voce, "riga", contesto))
+        if riga in righe_viste:
+            raise ValueError(f"{contesto}: riga {riga} del report già usata")
+        righe_viste.add(riga)
+        report.append(VoceReport(
+            _richiesto(voce, "etichetta", contesto), riga,
+            _cella(_richiesto(voce, "cella_sorgente", contesto), contesto)
+        ))
+
+    return PianoRegole(
+        versione=versione,
+        cella_data=_cella(anag.get("cella_data", "F2"), "anagrafica"),
+        cella_cognome=_cella(anag.get("cella_cognome", "C1"), "anagrafica"),
+        cella_nome=_cella(anag.get("cella_nome", "E1"), "anagrafica"),
+        decimali_anagrafica=anag.get("decimali", 0),
+        formato_anagrafica=anag.get("formato", "0"),
+        anagrafica=tuple(campi),
+        decimali_peso=salti_conf.get("decimali_peso", 1),
+        formato_peso=salti_conf.get("formato_peso", "0.00"),
+        salti=tuple(regole_salti),
+        rj=tuple(rj),
+        formato_valori_report=formati_report.get("valori", "0.00"),
+        formato_percentuale_report=formati_report.get("percentuale", "0.00%"),
+        report=tuple(report),
+    )
+
+
+def leggi_config(path):
+    """Legge il file delle regole (JSON, oppure YAML con estensione .yaml/.yml)."""
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError(f"Per leggere '{path}' serve PyYAML (pip install pyyaml)")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def carica_piano(path=FILE_REGOLE_DEFAULT):
+    """Piano compilato per il file indicato, validato una volta e condiviso per tutto il processo."""
+    return compila_piano(leggi_config(path))
@@ -0,0 +1,285 @@
+"""
+Rappresentazione compatta dei salti condivisa dagli step 2 e 3.
+
+- TabellaSalti: tabella 'Tipo' / 'Altezza' come array numpy strutturato (una riga per salto)
+  con il tipo di salto codificato come categoria (codice intero + elenco dei nomi)
+- GruppoSalti: serie contigua di salti, come intervallo [inizio, fine) della tabella
+- SessioneRJ: salti di una sessione RJ come array (altezza, TC, RSI)
+- tabella_tipizzata / ColonneRJ: colonne dell'export convertite una volta sola (anche al
+  caricamento, vedi sessioni.indicizza_sessioni), così gli step non riconvertono testo in numeri
+Nessun oggetto Python per salto: le righe occupano pochi byte ciascuna.
+
+Le metriche restano float64 come i valori letti dall'export: in float32 l'arrotondamento
+half-up di custom_round cambierebbe risultato sui valori al limite (es. 30.15, 0.245).
+"""
+import numpy as np
+import pandas as pd
+
+# Campi metrici della tabella salti (stessi nomi delle colonne usate in regole.json)
+CAMPI_SALTO = ("Altezza", "TC", "Caduta", "Peso Kg")
+DTYPE_SALTO = np.dtype([("tipo", np.int32)] + [(campo, np.float64) for campo in CAMPI_SALTO])
+
+# Scostamento di caduta / peso oltre il quale inizia una nuova serie
+TOLLERANZA_SERIE = 0.1
+
+
+def converti_float(valori):
+    """float(str(v).replace(',', '.').strip()) per ogni valore, NaN dove la conversione fallisce."""
+    risultato = np.full(len(valori), np.nan)
+    for i, v in enumerate(valori):
+        try:
+            risultato[i] = float(str(v).replace(',', '.').strip())
+        except ValueError:
+            pass
+    return risultato
+
+
+def converti_float_colonna(valori):
+    """
+    converti_float per un'intera colonna: ogni testo distinto è convertito una sola volta.
+    Restituisce (numeri, convertibili): 'convertibili' è False dove float() fallisce
+    (un testo 'nan' è convertibile ma resta NaN).
+    """
+    codici, distinti = pd.factorize(np.array([str(v) for v in valori], dtype=object))
+    numeri = np.full(len(distinti), np.nan)
+    convertibili = np.zeros(len(distinti), dtype=bool)
+    for j, testo in enumerate(distinti):
+        try:
+            numeri[j] = float(testo.replace(',', '.').strip())
+            convertibili[j] = True
+        except ValueError:
+            pass
+    return numeri[codici], convertibili[codici]
+
+
+def _numerica(valori):
+    """Colonna testuale con virgola decimale -> float64 (NaN dove non numerica)."""
+    return pd.to_numeric(valori.astype(str).str.replace(',', '.'), errors='coerce').astype(np.float64)
+
+
+def tabella_tipizzata(df_tabella, col_map):
+    """
+    Righe della tabella salti (sotto l'intestazione) con le colonne usate dallo step 2 già tipizzate:
+    Tipo categoriale (testo ripulito, 'nan' se mancante), Altezza e TC float64 (TC 0 se la colonna
+    manca), Caduta e Peso Kg float64 (-1 se mancanti). L'indice resta quello delle righe dell'export.
+    """
+    def colonna(*nomi):
+        for nome in nomi:
+            if nome in col_map:
+                return df_tabella.iloc[:, col_map[nome]]
+        return None
+
+    tabella = pd.DataFrame(index=df_tabella.index)
+    tabella['Tipo'] = colonna('tipo').astype(str).str.strip().fillna("nan").astype("category")
+    tabella['Altezza'] = _numerica(colonna('altezza'))
+    raw_tc = colonna('tc')
+    tabella['TC'] = _numerica(raw_tc) if raw_tc is not None else 0.0
+    raw_caduta = colonna('caduta')
+    tabella['Caduta'] = _numerica(raw_caduta).fillna(-1) if raw_caduta is not None else -1.0
+    raw_peso = colonna('peso kg', 'peso')
+    tabella['Peso Kg'] = _numerica(raw_peso).fillna(-1) if raw_peso is not None else -1.0
+    return tabella
+
+
+class TabellaSalti:
+    """Salti della tabella 'Tipo' / 'Altezza' in un array strutturato DTYPE_SALTO."""
+
+    __slots__ = ("tipi", "salti")
+
+    def __init__(self, tipi, salti):
+        self.tipi = tipi      # nomi dei tipi, indicizzati dal campo 'tipo'
+        self.salti = salti
+
+    @classmethod
+    def da_dataframe(cls, df):
+        """Converte il DataFrame dei salti puliti (Tipo, Altezza, TC, Caduta, Peso Kg, vedi tabella_tipizzata)."""
+        if isinstance(df['Tipo'].dtype, pd.CategoricalDtype):
+            # Tabella già tipizzata: solo i tipi presenti in queste righe (stesso ordine dei nomi)
+            categorie = df['Tipo'].cat.remove_unused_categories().array
+        else:
+            # Tipo mancante come testo 'nan' (nessuna regola lo accetta) invece del codice -1
+            categorie = pd.Categorical(df['Tipo'].fillna("nan"))
+        salti = np.empty(len(df), dtype=DTYPE_SALTO)
+        salti["tipo"] = categorie.codes
+        for campo in CAMPI_SALTO:
+            salti[campo] = df[campo].to_numpy(dtype=float)
+        return cls(tuple(str(t) for t in categorie.categories), salti)
+
+    def __len__(self):
+        return len(self.salti)
+
+    @property
+    def nbytes(self):
+        return self.salti.nbytes
+
+    def colonna(self, campo):
+        """Vista (senza copia) di un campo metrico su tutti i salti."""
+        return self.salti[campo]
+
+
+class GruppoSalti:
+    """Serie contigua di salti dello stesso tipo, caduta e peso: righe [inizio, fine) della tabella."""
+
+    __slots__ = ("tabella", "inizio", "fine")
+
+    def __init__(self, tabella, inizio, fine):
+        self.tabella = tabella
+        self.inizio = inizio
+        self.fine = fine
+
+    def __len__(self):
+        return self.fine - self.inizio
+
+    @property
+    def tipo(self):
+        return self.tabella.tipi[self.tabella.salti["tipo"][self.inizio]]
+
+    @property
+    def caduta(self):
+        return float(self.tabella.salti["Caduta"][self.inizio])
+
+    @property
+    def peso(self):
+        return float(self.tabella.salti["Peso Kg"][self.inizio])
+
+    def migliori(self, n=3, campo="Altezza"):
+        """Posizioni nella tabella degli n salti con 'campo' maggiore, in ordine cronologico."""
+        valori = pd.Series(self.tabella.salti[campo][self.inizio:self.fine])
+        # Stesso ordinamento (e stessa scelta tra pari merito) di DataFrame.sort_values
+        scelti = valori.sort_values(ascending=False).head(n).index.to_numpy()
+        return np.sort(scelti) + self.inizio
+
+
+def raggruppa_serie(tabella):
+    """
+    Divide i salti in serie contigue: una nuova serie inizia quando cambia il tipo o quando
+    caduta / peso si scostano di oltre TOLLERANZA_SERIE dal primo salto della serie corrente.
+    """
+    s = tabella.salti
+    if len(s) == 0:
+        return []
+
+    # Solo le righe diverse dalla precedente possono aprire una nuova serie
+    candidati = np.flatnonzero(
+        (s["tipo"][1:] != s["tipo"][:-1])
+        | (s["Caduta"][1:] != s["Caduta"][:-1])
+        | (s["Peso Kg"][1:] != s["Peso Kg"][:-1])
+    ) + 1
+
+    inizi = [0]
+    for k in candidati:
+        primo = s[inizi[-1]]
+        if (s["tipo"][k] != primo["tipo"]
+                or abs(s["Caduta"][k] - primo["Caduta"]) > TOLLERANZA_SERIE
+                or abs(s["Peso Kg"][k] - primo["Peso Kg"]) > TOLLERANZA_SERIE):
+            inizi.append(int(k))
+
+    fini = inizi[1:] + [len(s)]
+    return [GruppoSalti(tabella, a, b) for a, b in zip(inizi, fini)]
+
+
+class SessioneRJ:
+    """Salti di una sessione RJ (dalla riga 'riga_inizio' dell'export) come array float64."""
+
+    __slots__ = ("riga_inizio", "altezza", "tc", "rsi")
+
+    def __init__(self, riga_inizio, altezza, tc, rsi):
+        self.riga_inizio = riga_inizio
+        self.altezza = altezza
+        self.tc = tc
+        self.rsi = rsi
+
+    @classmethod
+    def da_colonne(cls, riga_inizio, tc, altezza, rsi):
+        """Converte i valori grezzi delle colonne TC, Altezza e RSI; tiene solo i salti con altezza > 0."""
+        return cls.da_numeri(riga_inizio, converti_float(tc), converti_float(altezza), converti_float(rsi))
+
+    @classmethod
+    def da_numeri(cls, riga_inizio, tc, altezza, rsi):
+        """Come da_colonne, con le colonne già convertite in float64 (vedi ColonneRJ)."""
+        validi = altezza > 0
+        # TC / RSI non numerici restano NaN: come gli zeri, sono esclusi dalle medie
+        return cls(riga_inizio, altezza[validi], tc[validi], rsi[validi])
+
+    def __len__(self):
+        return len(self.altezza)
+
+    def statistiche(self, n_migliori=5):
+        """Medie dei migliori n salti per altezza (TC e RSI escludendo gli zeri). None se vuota."""
+        if len(self.altezza) == 0:
+            return None
+        if len(self.altezza) > n_migliori:
+            scelti = pd.Series(self.altezza).sort_values(ascending=False).head(n_migliori).index.to_numpy()
+        else:
+            scelti = np.arange(len(self.altezza))
+
+        def media_senza_zeri(valori):
+            validi = valori[valori > 0]
+            return validi.mean() if len(validi) else 0.0
+
+        return {
+            'avg_h': self.altezza[scelti].mean(),
+            'avg_tc': media_senza_zeri(self.tc[scelti]),
+            'avg_rsi': media_senza_zeri(self.rsi[scelti]),
+            'n_salti': len(self.altezza),
+            'start_row': self.riga_inizio,
+        }
+
+
+class ColonneRJ:
+    """
+    Colonne dei blocchi RJ dell'intero export già convertite (regola di converti_float):
+    B = TC, D = Altezza, E = RSI; dalla colonna A (indice del salto) solo dove finisce ogni blocco.
+    """
+
+    __slots__ = ("fine", "tc", "altezza", "rsi")
+
+    def __init__(self, fine, tc, altezza, rsi):
+        self.fine = fine          # fine[k]: prima riga >= k con colonna A non numerica
+        self.tc = tc
+        self.altezza = altezza
+        self.rsi = rsi
+
+    @classmethod
+    def da_valori(cls, valori):
+        """Da un array di oggetti dell'export (almeno 5 colonne)."""
+        _, numerica = converti_float_colonna(valori[:, 0])
+        tc, _ = converti_float_colonna(valori[:, 1])
+        altezza, _ = converti_float_colonna(valori[:, 3])
+        rsi, _ = converti_float_colonna(valori[:, 4])
+        return cls.da_colonne(numerica, tc, altezza, rsi)
+
+    @classmethod
+    def da_colonne(cls, numerica, tc, altezza, rsi):
+        """Da colonne già convertite; numerica: colonna A convertibile in numero."""
+        n = len(numerica)
+        non_numeriche = np.where(numerica, n, np.arange(n))
+        fine = np.minimum.accumulate(non_numeriche[::-1])[::-1]
+        return cls(fine, tc, altezza, rsi)
+
+    @classmethod
+    def concatena(cls, parti):
+        """Colonne di tratti consecutivi dell'export riunite: 'fine' è ricalcolata sull'insieme."""
+        return cls.da_colonne(*(
+            np.concatenate([getattr(parte, campo) for parte in parti])
+            for campo in ("numerica", "tc", "altezza", "rsi")
+        ))
+
+    def tratto(self, inizio, fine):
+        """Colonne delle sole righe [inizio, fine)."""
+        return ColonneRJ.da_colonne(
+            self.numerica[inizio:fine], self.tc[inizio:fine], self.altezza[inizio:fine], self.rsi[inizio:fine]
+        )
+
+    @property
+    def numerica(self):
+        """Righe con la colonna A numerica: le sole che non chiudono un blocco."""
+        return self.fine != np.arange(len(self.fine))
+
+    def fine_blocco(self, inizio):
+        """Prima riga da 'inizio' in poi con la colonna A non numerica (o la fine dell'export)."""
+        return int(self.fine[inizio]) if inizio < len(self.fine) else inizio
+
+    @property
+    def nbytes(self):
+        return self.fine.nbytes + self.tc.nbytes + self.altezza.nbytes + self.rsi.nbytes
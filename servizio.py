@@ -0,0 +1,392 @@
+"""
+Servizio HTTP locale per elaborare export e report senza passare dall'interfaccia Streamlit.
+
+Le richieste arrivano a un ThreadingHTTPServer in ascolto solo su 127.0.0.1 e vengono eseguite
+da un pool di processi sempre caldo. Ogni processo carica una volta il piano delle regole e i
+modelli di default (excel.xlsx, report.xlsx). Oltre i worker occupati le richieste restano in
+coda fino a --coda; oltre quella il servizio risponde 503.
+I risultati sono in cache (memoria.GovernatoreMemoria, budget --cache-mb). Input identici (stessi
+file, stessa data) ricevono il risultato già calcolato, anche se la prima richiesta è ancora
+in corso.
+
+Endpoint (corpo multipart/form-data):
+    POST /elabora   sorgente=<export>, data=AAAA-MM-GG (opzionale: ultima sessione del file),
+                    modello=<xlsx> (opzionale: excel.xlsx)
+    POST /report    pre=<xlsx>, post=<xlsx>, template=<xlsx> (opzionale: report.xlsx)
+    GET  /salute    stato del pool, della coda e della cache (JSON)
+
+Esempio:
+    python servizio.py --porta 8765 --worker 2
+    curl -F sorgente=@export.xlsx -F data=2024-03-05 http://127.0.0.1:8765/elabora -o risultato.xlsx
+"""
+import argparse
+import email.policy
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as TimeoutFuture
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import quote, urlsplit
+
+import filigrana
+import main
+import memoria
+import regole
+
+# --- CONFIGURAZIONE SERVIZIO ---
+HOST = "127.0.0.1"  # solo connessioni locali
+PORTA_DEFAULT = int(os.environ.get("CHRONOJUMP_API_PORTA", "8765"))
+WORKER_DEFAULT = int(os.environ.get("CHRONOJUMP_API_WORKER", "2"))
+# Richieste in attesa oltre a quelle in esecuzione
+CODA_DEFAULT = int(os.environ.get("CHRONOJUMP_API_CODA", "8"))
+CACHE_MB_DEFAULT = float(os.environ.get("CHRONOJUMP_API_CACHE_MB", "256"))
+# Filigrane degli export già indicizzati, per processo di lavoro (vedi filigrana.py)
+FILIGRANE_MB = float(os.environ.get("CHRONOJUMP_API_FILIGRANE_MB", "64"))
+# Attesa massima di una richiesta (coda + elaborazione) prima di rispondere 504
+TIMEOUT_S = float(os.environ.get("CHRONOJUMP_API_TIMEOUT", "300"))
+DIMENSIONE_MASSIMA_MB = float(os.environ.get("CHRONOJUMP_API_MAX_MB", "100"))
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class CodaPiena(Exception):
+    """Worker occupati e coda al completo."""
+
+
+# --- LATO WORKER (eseguito nei processi del pool) ---
+
+# Modelli di default letti una volta per processo: {"athletic": bytes, "report": bytes}
+_MODELLI = {}
+# Ultimo export indicizzato di ogni atleta: un export cumulativo è indicizzato solo nelle righe nuove
+_FILIGRANE = memoria.GovernatoreMemoria(FILIGRANE_MB)
+
+
+def _inizializza_worker():
+    """Carica nel processo il piano delle regole e i modelli di default."""
+    regole.carica_piano()
+    for chiave, nome in (("athletic", main.FILE_MODELLO_DEFAULT), ("report", main.FILE_REPORT_DEFAULT)):
+        path = os.path.join(CARTELLA_PROGETTO, nome)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                _MODELLI[chiave] = f.read()
+
+
+def _pronto():
+    return os.getpid()
+
+
+def _buffer(dati, nome):
+    """Buffer in memoria con attributo .name, come un file caricato da Streamlit."""
+    buffer = io.BytesIO(dati)
+    buffer.name = nome
+    return buffer
+
+
+def _modello(dati, chiave):
+    if dati is None:
+        dati = _MODELLI.get(chiave)
+        if dati is None:
+            raise ValueError(f"Nessun modello '{chiave}' di default: inviarlo nella richiesta")
+    return _buffer(dati, f"{chiave}.xlsx")
+
+
+def elabora_export(nome, dati, data_test=None, dati_modello=None):
+    """Pipeline 'Athletic Data' su un export; data_test None = ultima sessione del file."""
+    registro = main.RegistroEventi("avviso")
+    sorgente = _buffer(dati, nome)
+    df = main.carica_file_universale(sorgente, registro)
+    if df is None:
+        raise ValueError("Errore lettura file sorgente. Verifica il formato.")
+    indice = filigrana.indicizza(df, _FILIGRANE)
+    if data_test is None:
+        if not indice.date:
+            raise ValueError("Nessuna sessione trovata nel file: indicare il campo 'data'")
+        data_test = indice.date[-1]
+    risultato = main.esegui_elaborazione_atleta(
+        sorgente, _modello(dati_modello, "athletic"), data_test, registro=registro, indice=indice, df_sorgente=df
+    )
+    return {
+        "output": risultato["output"],
+        "nome": f"Risultati_{os.path.splitext(nome)[0]}.xlsx",
+        "data_test": data_test.isoformat(),
+        "avvisi": registro.testo("avviso"),
+    }
+
+
+def genera_report(nome_pre, dati_pre, nome_post, dati_post, dati_template=None):
+    """Report comparativo PRE/POST."""
+    registro = main.RegistroEventi("avviso")
+    risultato = main.genera_report_comparativo(
+        _buffer(dati_pre, nome_pre), _buffer(dati_post, nome_post), _modello(dati_template, "report"), registro
+    )
+    return {
+        "output": risultato["output"],
+        "nome": f"Report_{risultato['nome_atleta'] or 'Atleta'}.xlsx",
+        "data_test": None,
+        "avvisi": registro.testo("avviso"),
+    }
+
+
+# --- LATO SERVER ---
+
+class ServizioElaborazione:
+    """Pool di processi, coda limitata, cache dei risultati e condivisione delle richieste identiche."""
+
+    def __init__(self, worker=WORKER_DEFAULT, coda=CODA_DEFAULT, cache_mb=CACHE_MB_DEFAULT):
+        self.worker = worker
+        self.coda = coda
+        self.pool = self._crea_pool()
+        self.posti = threading.BoundedSemaphore(worker + coda)
+        self.cache = memoria.GovernatoreMemoria(cache_mb)
+        self.in_corso = {}   # chiave -> Future della prima richiesta con quegli input
+        self.contatori = {"richieste": 0, "da_cache": 0, "condivise": 0, "calcolate": 0, "rifiutate": 0,
+                          "pool_ricreati": 0}
+        self._lock = threading.RLock()
+
+    def _crea_pool(self):
+        # 'spawn': i processi non ereditano i thread del server
+        return ProcessPoolExecutor(
+            max_workers=self.worker, mp_context=get_context("spawn"), initializer=_inizializza_worker
+        )
+
+    def _ricrea_pool(self, rotto):
+        """
+        Sostituisce il pool se è ancora quello rotto (un worker è terminato, es. memoria esaurita):
+        i lavori in corso su quel pool falliscono, le richieste successive vanno sul nuovo.
+        """
+        with self._lock:
+            if self.pool is rotto:
+                rotto.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._crea_pool()
+                self.contatori["pool_ricreati"] += 1
+
+    def _invia(self, funzione, *args):
+        """Invia al pool; un pool già rotto viene ricreato e l'invio ripetuto una volta."""
+        pool = self.pool
+        try:
+            return pool, pool.submit(funzione, *args)
+        except BrokenProcessPool:
+            self._ricrea_pool(pool)
+            pool = self.pool
+            return pool, pool.submit(funzione, *args)
+
+    def riscalda(self):
+        """Avvia subito tutti i worker (modelli e regole caricati prima della prima richiesta)."""
+        for _, future in [self._invia(_pronto) for _ in range(self.worker)]:
+            future.result()
+
+    def esegui(self, chiave, funzione, *args):
+        """
+        Risultato di funzione(*args), dalla cache se già calcolato per la stessa chiave.
+        Restituisce (esito, risultato) con esito 'cache', 'condiviso' o 'calcolato'.
+        Solleva CodaPiena se non c'è posto e TimeoutFuture oltre TIMEOUT_S.
+        """
+        with self._lock:
+            self.contatori["richieste"] += 1
+            risultato = self.cache.prendi("api", chiave)
+            if risultato is not None:
+                self.contatori["da_cache"] += 1
+                return "cache", risultato
+            future = self.in_corso.get(chiave)
+            if future is not None:
+                esito = "condiviso"
+                self.contatori["condivise"] += 1
+            else:
+                if not self.posti.acquire(blocking=False):
+                    self.contatori["rifiutate"] += 1
+                    raise CodaPiena()
+                esito = "calcolato"
+                self.contatori["calcolate"] += 1
+                try:
+                    pool, future = self._invia(funzione, *args)
+                except BaseException:
+                    self.posti.release()
+                    raise
+                self.in_corso[chiave] = future
+                future.add_done_callback(lambda f: self._concluso(chiave, f, pool))
+        return esito, future.result(timeout=TIMEOUT_S)
+
+    def _concluso(self, chiave, future, pool):
+        with self._lock:
+            self.posti.release()
+            errore = None if future.cancelled() else future.exception()
+            if not future.cancelled() and errore is None:
+                self.cache.registra("api", chiave, future.result(), "output")
+            self.in_corso.pop(chiave, None)
+        if isinstance(errore, BrokenProcessPool):
+            self._ricrea_pool(pool)
+
+    def stato(self):
+        with self._lock:
+            return {
+                "worker": self.worker,
+                "coda_massima": self.coda,
+                "in_corso": len(self.in_corso),
+                "contatori": dict(self.contatori),
+                "cache": self.cache.riepilogo(),
+            }
+
+    def chiudi(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def leggi_multipart(content_type, corpo):
+    """{campo: (nome file o None, bytes)} da un corpo multipart/form-data."""
+    if not content_type.lower().startswith("multipart/form-data"):
+        raise ValueError("Corpo atteso: multipart/form-data")
+    messaggio = BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + corpo
+    )
+    if not messaggio.is_multipart():
+        raise ValueError("Corpo multipart non valido")
+    campi = {}
+    for parte in messaggio.iter_parts():
+        nome = parte.get_param("name", header="content-disposition")
+        if nome:
+            campi[nome] = (parte.get_filename(), parte.get_payload(decode=True) or b"")
+    return campi
+
+
+def _file(campi, nome, obbligatorio=True):
+    if nome not in campi or not campi[nome][1]:
+        if obbligatorio:
+            raise ValueError(f"Manca il file '{nome}'")
+        return None, None
+    nome_file, dati = campi[nome]
+    return os.path.basename(nome_file or f"{nome}.xlsx"), dati
+
+
+def _impronta(*parti):
+    """Chiave di cache: hash di endpoint, nomi file, contenuti e parametri."""
+    h = hashlib.sha256()
+    for parte in parti:
+        dati = parte if isinstance(parte, bytes) else str(parte).encode("utf-8")
+        h.update(hashlib.sha256(dati).digest())
+    return h.hexdigest()
+
+
+def richiesta_elabora(campi):
+    """(chiave, funzione, argomenti) per POST /elabora."""
+    nome, dati = _file(campi, "sorgente")
+    _, dati_modello = _file(campi, "modello", obbligatorio=False)
+    data_test = None
+    if campi.get("data") and campi["data"][1].strip():
+        testo = campi["data"][1].decode("utf-8").strip()
+        try:
+            data_test = date.fromisoformat(testo)
+        except ValueError:
+            raise ValueError(f"Data non valida '{testo}' (formato AAAA-MM-GG)")
+    chiave = _impronta("elabora", nome, dati, data_test, dati_modello or b"")
+    return chiave, elabora_export, (nome, dati, data_test, dati_modello)
+
+
+def richiesta_report(campi):
+    """(chiave, funzione, argomenti) per POST /report."""
+    nome_pre, dati_pre = _file(campi, "pre")
+    nome_post, dati_post = _file(campi, "post")
+    _, dati_template = _file(campi, "template", obbligatorio=False)
+    chiave = _impronta("report", nome_pre, dati_pre, nome_post, dati_post, dati_template or b"")
+    return chiave, genera_report, (nome_pre, dati_pre, nome_post, dati_post, dati_template)
+
+
+ENDPOINT = {"/elabora": richiesta_elabora, "/report": richiesta_report}
+
+
+class GestoreRichieste(BaseHTTPRequestHandler):
+    server_version = "ChronojumpServizio/1"
+
+    def _rispondi_json(self, stato, contenuto):
+        corpo = json.dumps(contenuto, ensure_ascii=False).encode("utf-8")
+        self.send_response(stato)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/salute":
+            self._rispondi_json(200, self.server.servizio.stato())
+        else:
+            self._rispondi_json(404, {"errore": "Endpoint non trovato"})
+
+    def do_POST(self):
+        prepara = ENDPOINT.get(urlsplit(self.path).path)
+        if prepara is None:
+            self._rispondi_json(404, {"errore": "Endpoint non trovato"})
+            return
+        lunghezza = int(self.headers.get("Content-Length") or 0)
+        if lunghezza > DIMENSIONE_MASSIMA_MB * 1024 * 1024:
+            self._rispondi_json(413, {"errore": f"Richiesta oltre {DIMENSIONE_MASSIMA_MB:g} MB"})
+            return
+        corpo = self.rfile.read(lunghezza)
+
+        try:
+            chiave, funzione, argomenti = prepara(leggi_multipart(self.headers.get("Content-Type", ""), corpo))
+            esito, risultato = self.server.servizio.esegui(chiave, funzione, *argomenti)
+        except CodaPiena:
+            self._rispondi_json(503, {"errore": "Servizio occupato: coda piena, riprovare più tardi"})
+            return
+        except TimeoutFuture:
+            self._rispondi_json(504, {"errore": f"Elaborazione oltre {TIMEOUT_S:g}s"})
+            return
+        except BrokenProcessPool:
+            # Il pool è già stato ricreato (vedi ServizioElaborazione._ricrea_pool)
+            self._rispondi_json(503, {"errore": "Worker terminato inaspettatamente, riprovare"})
+            return
+        except ValueError as e:
+            self._rispondi_json(422, {"errore": str(e)})
+            return
+        except Exception as e:
+            self._rispondi_json(500, {"errore": f"{type(e).__name__}: {e}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", MIME_XLSX)
+        self.send_header("Content-Length", str(len(risultato["output"])))
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(risultato['nome'])}")
+        self.send_header("X-Cache", esito)
+        if risultato["data_test"]:
+            self.send_header("X-Data-Test", risultato["data_test"])
+        self.send_header("X-Avvisi", str(len(risultato["avvisi"].splitlines())))
+        self.end_headers()
+        self.wfile.write(risultato["output"])
+
+
+def crea_server(porta=PORTA_DEFAULT, servizio=None):
+    """ThreadingHTTPServer su 127.0.0.1 collegato al servizio (porta 0 = porta libera qualsiasi)."""
+    server = ThreadingHTTPServer((HOST, porta), GestoreRichieste)
+    server.daemon_threads = True
+    server.servizio = servizio or ServizioElaborazione()
+    return server
+
+
+def main_servizio():
+    parser = argparse.ArgumentParser(description="Servizio HTTP locale di elaborazione Chronojump.")
+    parser.add_argument("--porta", type=int, default=PORTA_DEFAULT)
+    parser.add_argument("--worker", type=int, default=WORKER_DEFAULT, help="Processi di elaborazione")
+    parser.add_argument("--coda", type=int, default=CODA_DEFAULT, help="Richieste in attesa oltre i worker")
+    parser.add_argument("--cache-mb", type=float, default=CACHE_MB_DEFAULT, help="Budget della cache dei risultati")
+    args = parser.parse_args()
+
+    servizio = ServizioElaborazione(args.worker, args.coda, args.cache_mb)
+    servizio.riscalda()
+    server = crea_server(args.porta, servizio)
+    print(f"Servizio in ascolto su http://{HOST}:{server.server_port} ({args.worker} worker, coda {args.coda})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        servizio.chiudi()
+
+
+if __name__ == "__main__":
+    main_servizio()
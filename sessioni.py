@@ -0,0 +1,267 @@
+"""
+Indice delle sessioni (date) presenti in un export Chronojump.
+
+Costruito una sola volta al caricamento del file: per ogni data della colonna 'Data' della
+tabella salti e delle righe RJ registra le righe corrispondenti e i salti per tipo.
+La pagina Athletic Data lo usa per proporre le sessioni disponibili; gli step 2 e 3 lo usano
+per prendere direttamente le righe della data scelta invece di rifiltrare tutto l'export.
+Nella stessa scansione la tabella salti e le colonne dei blocchi RJ vengono convertite in numeri
+(vedi salti.tabella_tipizzata e salti.ColonneRJ): gli step non riconvertono il testo a ogni data.
+Le righe di una data sono scelte con le stesse regole degli step (vedi date_riga_salti e
+date_riga_rj); le sessioni RJ elencate sono invece una data per riga (vedi data_rj).
+Le intestazioni (anche inglesi e spagnole, vedi intestazioni.py) sono cercate una volta e restano
+nell'indice: gli step non le ricercano a ogni data.
+"""
+import re
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import intestazioni
+import salti
+
+# Valori 'Data' in formato ISO (es. '2024-03-05 09:30:00'): la data sono i primi 10 caratteri
+_ISO = r'[0-9]{4}-[0-9]{2}-[0-9]{2}([ T][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?)?'
+# Date ISO contenute in un testo (anche sovrapposte)
+_DATA_CONTENUTA = re.compile(r'(?=([0-9]{4}-[0-9]{2}-[0-9]{2}))')
+
+
+def trova_intestazione_anagrafica(valori):
+    """(riga_header, col_map) della prima riga con 'id' e 'nome' (array di oggetti); riga_header -1 se assente."""
+    return intestazioni.riconosci(valori, ("anagrafica",)).anagrafica
+
+
+def trova_tabella_salti(valori):
+    """(riga_header, col_map) della tabella 'Tipo' / 'Altezza' (array di oggetti); riga_header -1 se assente."""
+    return intestazioni.riconosci(valori, ("salti",)).salti
+
+
+def trova_colonne_rj(valori):
+    """(idx_tipo, idx_data) dalla prima riga con 'tipo di salto'; idx_tipo -1 se assente."""
+    return intestazioni.riconosci(valori, ("rj",)).rj
+
+
+def _date_contenute(testo):
+    """Date valide il cui testo ISO (str(data)) compare nel testo."""
+    trovate = set()
+    for m in _DATA_CONTENUTA.finditer(testo):
+        try:
+            trovate.add(date.fromisoformat(m.group(1)))
+        except ValueError:
+            pass
+    return trovate
+
+
+def date_riga_salti(testo):
+    """Date a cui corrisponde un valore 'Data' della tabella salti (regola dello step 2)."""
+    try:
+        d = pd.to_datetime(testo).date()
+    except Exception:
+        # Fallback: confronto stringa parziale se il parsing fallisce
+        return _date_contenute(testo)
+    return set() if pd.isna(d) else {d}
+
+
+def date_riga_rj(valore):
+    """Date a cui corrisponde la cella 'Data' di una riga RJ (regola dello step 3)."""
+    try:
+        s = str(valore).strip()
+        d = pd.to_datetime(s, dayfirst=True, errors='coerce').date()
+        trovate = _date_contenute(s)
+        if not pd.isna(d):
+            trovate.add(d)
+        return trovate
+    except Exception:
+        return set()
+
+
+def data_rj(valore):
+    """
+    Data della sessione di una riga RJ, per l'elenco delle sessioni (None se la cella non è una data).
+    date_riga_rj può dare più date per la stessa cella (dayfirst anche sui valori ISO, più le date
+    contenute nel testo) e resta la regola con cui lo step 3 ritrova le righe; qui una sola data:
+    i valori ISO valgono per i loro primi 10 caratteri, gli altri come li legge lo step 3.
+    """
+    s = str(valore).strip()
+    if re.fullmatch(_ISO, s):
+        try:
+            return date.fromisoformat(s[:10])
+        except ValueError:
+            return None
+    try:
+        d = pd.to_datetime(s, dayfirst=True, errors='coerce')
+    except Exception:
+        d = pd.NaT
+    if not pd.isna(d):
+        return d.date()
+    contenute = _date_contenute(s)
+    return min(contenute) if contenute else None
+
+
+def _per_valore(posizioni, valori):
+    """{valore distinto: posizioni con quel valore}."""
+    codici, distinti = pd.factorize(np.asarray(valori, dtype=object))
+    ordine = np.argsort(codici, kind='stable')
+    tagli = np.cumsum(np.bincount(codici, minlength=len(distinti)))[:-1]
+    return dict(zip(distinti, np.split(posizioni[ordine], tagli)))
+
+
+def righe_per_data(testi):
+    """
+    Posizioni (0 = primo valore) per data dei valori 'Data' già ripuliti (str, strip).
+    I valori ISO sono raggruppati in blocco, gli altri valutati una volta per valore distinto.
+    Le celle vuote (NaN) non corrispondono a nessuna data.
+    """
+    testi = pd.Series(testi, dtype=object).reset_index(drop=True)
+    posizioni = np.arange(len(testi))
+    iso = testi.str.fullmatch(_ISO, na=False).to_numpy(dtype=bool)
+    altri = testi.notna().to_numpy() & ~iso
+    per_data = {}
+
+    for giorno, righe in _per_valore(posizioni[iso], testi[iso].str.slice(0, 10)).items():
+        try:
+            per_data.setdefault(date.fromisoformat(giorno), []).append(righe)
+        except ValueError:
+            pass
+
+    for testo, righe in _per_valore(posizioni[altri], testi[altri]).items():
+        for d in date_riga_salti(testo):
+            per_data.setdefault(d, []).append(righe)
+
+    return {d: np.sort(np.concatenate(blocchi)) for d, blocchi in per_data.items()}
+
+
+def righe_rj_candidate(valori, idx_tipo):
+    """Posizioni delle righe con 'rj' nella colonna 'Tipo di salto'."""
+    tipi = pd.Series(valori[:, idx_tipo], dtype=object).astype(str).astype(object).str.lower()
+    return np.flatnonzero(tipi.str.contains("rj", regex=False, na=False).to_numpy(dtype=bool))
+
+
+def righe_rj_per_data(valori, idx_tipo, idx_data):
+    """
+    ({data: posizioni delle righe RJ candidate che lo step 3 prende per quella data},
+     {data della sessione: n righe RJ}) (posizioni: 0 = prima riga di valori).
+    Una riga può comparire sotto più date nel primo dizionario (vedi date_riga_rj), nel secondo
+    conta una volta sola (vedi data_rj).
+    """
+    per_data, sessioni_rj = {}, {}
+    for i in righe_rj_candidate(valori, idx_tipo):
+        for d in date_riga_rj(valori[i, idx_data]):
+            per_data.setdefault(d, []).append(int(i))
+        d = data_rj(valori[i, idx_data])
+        if d is not None:
+            sessioni_rj[d] = sessioni_rj.get(d, 0) + 1
+    return {d: np.array(righe) for d, righe in per_data.items()}, sessioni_rj
+
+
+def conta_salti(tipi, altezze, relative):
+    """{tipo: n} dei salti con altezza numerica tra le righe indicate (posizioni nella tabella salti)."""
+    relative = relative[~np.isnan(altezze[relative])]
+    if not len(relative):
+        return {}
+    conteggi = pd.Series(tipi[relative]).value_counts(sort=False)
+    return {str(t): int(n) for t, n in conteggi.items()}
+
+
+class IndiceSessioni:
+    """Date disponibili in un export, con le righe e i conteggi di ciascuna (vedi indicizza_sessioni)."""
+
+    __slots__ = ("forma", "righe_salti_per_data", "salti_per_data", "righe_rj_per_data", "rj_per_data",
+                 "tabella_salti", "colonne_rj", "intestazioni")
+
+    def __init__(self, forma, righe_salti_per_data, salti_per_data, righe_rj_per_data, rj_per_data,
+                 tabella_salti=None, colonne_rj=None, intestazioni=None):
+        self.forma = forma                                # shape del DataFrame indicizzato
+        self.righe_salti_per_data = righe_salti_per_data  # None se la tabella salti non ha la colonna 'Data'
+        self.salti_per_data = salti_per_data              # {data: {tipo: n salti con altezza}}
+        self.righe_rj_per_data = righe_rj_per_data        # {data: righe RJ candidate per lo step 3}
+        self.rj_per_data = rj_per_data                    # {data della sessione: n righe RJ} (vedi data_rj)
+        self.tabella_salti = tabella_salti                # salti.tabella_tipizzata delle righe sotto l'intestazione
+        self.colonne_rj = colonne_rj                      # salti.ColonneRJ (None con meno di 5 colonne)
+        self.intestazioni = intestazioni                  # intestazioni.Intestazioni dell'export
+
+    @property
+    def date(self):
+        """Date con almeno un salto o una sessione RJ, in ordine crescente."""
+        return sorted(set(self.salti_per_data) | set(self.rj_per_data))
+
+    def valido_per(self, df):
+        return df is not None and df.shape == self.forma
+
+    def righe_salti(self, data):
+        """Posizioni nell'export delle righe salti della data; None se non filtrabili per data."""
+        if self.righe_salti_per_data is None:
+            return None
+        return self.righe_salti_per_data.get(data, np.empty(0, dtype=np.int64))
+
+    def righe_rj(self, data):
+        return self.righe_rj_per_data.get(data, np.empty(0, dtype=np.int64))
+
+    def salti_tipizzati(self, data):
+        """Righe tipizzate della tabella salti per la data (tutte se non filtrabili); None senza tabella."""
+        if self.tabella_salti is None:
+            return None
+        righe = self.righe_salti(data)
+        if righe is None:
+            return self.tabella_salti
+        # La tabella parte dalla riga sotto l'intestazione e arriva alla fine dell'export
+        return self.tabella_salti.iloc[righe - (self.forma[0] - len(self.tabella_salti))]
+
+    def etichetta(self, data):
+        """Es. '05/03/2024 · 34 salti (ABK 6, CMJ 8, ...) · 2 RJ'."""
+        parti = [data.strftime("%d/%m/%Y")]
+        tipi = self.salti_per_data.get(data, {})
+        if tipi:
+            dettaglio = ", ".join(f"{t} {n}" for t, n in tipi.items())
+            n_salti = sum(tipi.values())
+            parti.append(f"{n_salti} {'salto' if n_salti == 1 else 'salti'} ({dettaglio})")
+        n_rj = self.rj_per_data.get(data, 0)
+        if n_rj:
+            parti.append(f"{n_rj} RJ")
+        return " · ".join(parti)
+
+    def tabella(self):
+        """Righe per st.dataframe: una per data, una colonna per tipo di salto."""
+        tipi = sorted({t for conteggi in self.salti_per_data.values() for t in conteggi})
+        righe = []
+        for d in self.date:
+            conteggi = self.salti_per_data.get(d, {})
+            riga = {"Data": d.strftime("%d/%m/%Y"), "RJ": self.rj_per_data.get(d, 0)}
+            riga.update({t: conteggi.get(t, 0) for t in tipi})
+            righe.append(riga)
+        return righe
+
+
+def indicizza_sessioni(df):
+    """Scansiona una volta l'export (DataFrame senza intestazioni) e restituisce l'IndiceSessioni."""
+    valori = df.to_numpy(dtype=object)
+
+    # --- Tabella salti: colonne tipizzate, righe per data e salti validi (altezza numerica) per tipo ---
+    righe_salti_per_data, salti_per_data, tabella = None, {}, None
+    trovate = intestazioni.riconosci(valori)
+    riga_header, col_map = trovate.salti
+    if riga_header != -1:
+        tabella = salti.tabella_tipizzata(df.iloc[riga_header + 1:], col_map)
+    if riga_header != -1 and "data" in col_map:
+        df_data = df.iloc[riga_header + 1:]
+        testi = df_data.iloc[:, col_map["data"]].astype(str).str.strip()
+        righe_salti_per_data = {
+            d: righe + riga_header + 1 for d, righe in righe_per_data(testi).items()
+        }
+        tipi = tabella['Tipo'].to_numpy(dtype=object)
+        altezze = tabella['Altezza'].to_numpy()
+        for d, righe in righe_salti_per_data.items():
+            conteggi = conta_salti(tipi, altezze, righe - (riga_header + 1))
+            if conteggi:
+                salti_per_data[d] = conteggi
+
+    # --- Righe RJ per data ---
+    idx_tipo, idx_data = trovate.rj
+    per_data_rj, sessioni_rj = {}, {}
+    if idx_tipo != -1 and idx_data != -1:
+        per_data_rj, sessioni_rj = righe_rj_per_data(valori, idx_tipo, idx_data)
+    colonne_rj = salti.ColonneRJ.da_valori(valori) if idx_tipo != -1 and valori.shape[1] >= 5 else None
+
+    return IndiceSessioni(df.shape, righe_salti_per_data, salti_per_data, per_data_rj, sessioni_rj, tabella,
+                          colonne_rj, trovate)
@@ -0,0 +1,268 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+# --- CONFIGURAZIONE ARCHIVIO STORICO ---
+# Database SQLite locale alimentato da ogni "Avvia Elaborazione"
+DB_STORICO_DEFAULT = os.environ.get("CHRONOJUMP_DB_STORICO", "storico_atleti.db")
+
+SCHEMA_STORICO = """
+CREATE TABLE IF NOT EXISTS elaborazioni (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    atleta TEXT NOT NULL,
+    id_atleta TEXT,
+    data_test TEXT NOT NULL,
+    file_sorgente TEXT,
+    creato_il TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metriche (
+    elaborazione_id INTEGER NOT NULL REFERENCES elaborazioni(id) ON DELETE CASCADE,
+    atleta TEXT NOT NULL,
+    data_test TEXT NOT NULL,
+    sezione TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    dato TEXT NOT NULL,
+    indice INTEGER NOT NULL,
+    cella TEXT NOT NULL,
+    valore_num REAL,
+    valore_testo TEXT,
+    id_atleta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_elaborazioni_atleta_data ON elaborazioni(atleta, data_test);
+CREATE INDEX IF NOT EXISTS idx_metriche_atleta_data ON metriche(atleta, data_test);
+CREATE INDEX IF NOT EXISTS idx_metriche_atleta_metrica ON metriche(atleta, metrica, dato, data_test);
+"""
+
+# Indici sull'ID dell'atleta: creati dopo la migrazione dei database senza metriche.id_atleta
+INDICI_ID_ATLETA = """
+CREATE INDEX IF NOT EXISTS idx_elaborazioni_id_data ON elaborazioni(id_atleta, data_test);
+CREATE INDEX IF NOT EXISTS idx_metriche_id_data ON metriche(id_atleta, data_test);
+"""
+
+
+def apri_storico(path_db=DB_STORICO_DEFAULT):
+    """Apre (e crea se serve) il database storico in modalità WAL."""
+    conn = sqlite3.connect(path_db, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA_STORICO)
+    colonne = {riga[1] for riga in conn.execute("PRAGMA table_info(metriche)")}
+    if "id_atleta" not in colonne:
+        with conn:
+            conn.execute("ALTER TABLE metriche ADD COLUMN id_atleta TEXT")
+            conn.execute("UPDATE metriche SET id_atleta = "
+                         "(SELECT id_atleta FROM elaborazioni WHERE elaborazioni.id = metriche.elaborazione_id)")
+    conn.executescript(INDICI_ID_ATLETA)
+    return conn
+
+
+def _filtro_atleta(atleta, id_atleta):
+    """Condizione SQL e parametri di un atleta: per ID se noto (due omonimi restano distinti), altrimenti per nome."""
+    if id_atleta is not None:
+        return "id_atleta = ?", [id_atleta]
+    return "atleta = ?", [atleta]
+
+
+def _valore_cella(ws, cella):
+    """Restituisce (valore_num, valore_testo) per una cella (regole.Cella) del foglio elaborato."""
+    val = ws.cell(row=cella.riga, column=cella.colonna).value
+    if val is None or str(val).strip() == "":
+        return None, None
+    if isinstance(val, bool):
+        return None, str(val)
+    if isinstance(val, (int, float)):
+        return float(val), None
+    return None, str(val).strip()
+
+
+def estrai_metriche_da_foglio(ws, piano):
+    """
+    Rilegge dal foglio appena elaborato le celle scritte dai tre step, secondo il piano delle regole:
+    - anagrafica
+    - top 3 delle regole salti (più il peso delle serie SJl)
+    - medie RJ
+    Restituisce una lista di tuple (sezione, metrica, dato, indice, cella, valore_num, valore_testo).
+    """
+    righe = []
+
+    for campo in piano.anagrafica:
+        num, testo = _valore_cella(ws, campo.cella)
+        if num is None and testo is None: continue
+        righe.append(("anagrafica", campo.etichetta, "Valore", 1, campo.cella.coord, num, testo))
+
+    # Le regole ripetute (es. prima/seconda serie ABK) sono già numerate nel piano ("ABK #2")
+    for regola in piano.salti:
+        if regola.cella_peso is not None:
+            num, testo = _valore_cella(ws, regola.cella_peso)
+            if num is not None or testo is not None:
+                righe.append(("salti", regola.metrica, "Peso", 1, regola.cella_peso.coord, num, testo))
+
+        for out_conf in regola.outputs:
+            for k, cella in enumerate(out_conf.celle):
+                num, testo = _valore_cella(ws, cella)
+                if num is None and testo is None: continue
+                righe.append(("salti", regola.metrica, out_conf.dato, k + 1, cella.coord, num, testo))
+
+    for out_rj in piano.rj:
+        num, testo = _valore_cella(ws, out_rj.cella)
+        if num is None and testo is None: continue
+        righe.append(("rj", "RJ", out_rj.dato, 1, out_rj.cella.coord, num, testo))
+
+    return righe
+
+
+def nome_atleta(ws, piano):
+    """'Cognome Nome' dell'atleta scritto sul foglio elaborato, chiave dello storico."""
+    cognome = str(ws.cell(row=piano.cella_cognome.riga, column=piano.cella_cognome.colonna).value or "").strip()
+    nome = str(ws.cell(row=piano.cella_nome.riga, column=piano.cella_nome.colonna).value or "").strip()
+    return f"{cognome} {nome}".strip() or "Atleta_Anonimo"
+
+
+def registra_elaborazione(ws, data_test, piano, id_atleta=None, file_sorgente=None, path_db=DB_STORICO_DEFAULT,
+                          righe=None):
+    """
+    Inserisce nello storico le metriche di una elaborazione.
+    Una nuova elaborazione dello stesso atleta per la stessa data sostituisce la precedente; l'atleta
+    è il suo ID dell'export se presente, altrimenti nome e file sorgente (il nome da solo non basta:
+    omonimi e atleti senza nome lo condividono).
+    righe: metriche già rilette dal foglio (estrai_metriche_da_foglio), altrimenti vengono rilette qui.
+    Restituisce il numero di metriche salvate.
+    """
+    atleta = nome_atleta(ws, piano)
+    data_iso = data_test.isoformat()
+
+    if righe is None:
+        righe = estrai_metriche_da_foglio(ws, piano)
+
+    conn = apri_storico(path_db)
+    try:
+        with conn:
+            if id_atleta is not None:
+                conn.execute("DELETE FROM elaborazioni WHERE id_atleta = ? AND data_test = ?", (id_atleta, data_iso))
+            else:
+                conn.execute(
+                    "DELETE FROM elaborazioni WHERE id_atleta IS NULL AND atleta = ? AND file_sorgente IS ? AND data_test = ?",
+                    (atleta, file_sorgente, data_iso)
+                )
+            cur = conn.execute(
+                "INSERT INTO elaborazioni (atleta, id_atleta, data_test, file_sorgente, creato_il) VALUES (?, ?, ?, ?, ?)",
+                (atleta, id_atleta, data_iso, file_sorgente, datetime.now().isoformat(timespec="seconds"))
+            )
+            elab_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO metriche (elaborazione_id, atleta, id_atleta, data_test, sezione, metrica, dato, indice, cella, valore_num, valore_testo) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(elab_id, atleta, id_atleta, data_iso) + r for r in righe]
+            )
+    finally:
+        conn.close()
+
+    return len(righe)
+
+
+def elenco_atleti(path_db=DB_STORICO_DEFAULT):
+    """Atleti presenti nello storico (nome e ID dell'export, se noto) con le rispettive date di test."""
+    conn = apri_storico(path_db)
+    try:
+        return pd.read_sql_query(
+            "SELECT DISTINCT atleta, id_atleta, data_test FROM elaborazioni ORDER BY atleta, id_atleta, data_test", conn
+        )
+    finally:
+        conn.close()
+
+
+def storico_atleta(atleta, data_da=None, data_a=None, path_db=DB_STORICO_DEFAULT, id_atleta=None):
+    """
+    Serie longitudinale di tutte le metriche di un atleta (una sola query indicizzata), per ID se noto.
+    Le date sono oggetti date oppure stringhe ISO (YYYY-MM-DD).
+    """
+    condizione, params = _filtro_atleta(atleta, id_atleta)
+    sql = ("SELECT data_test, sezione, metrica, dato, indice, cella, valore_num, valore_testo "
+           f"FROM metriche WHERE {condizione}")
+    if data_da is not None:
+        sql += " AND data_test >= ?"
+        params.append(str(data_da))
+    if data_a is not None:
+        sql += " AND data_test <= ?"
+        params.append(str(data_a))
+    sql += " ORDER BY data_test, sezione, metrica, dato, indice"
+
+    conn = apri_storico(path_db)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+
+def confronto_pre_post(atleta, data_pre, data_post, path_db=DB_STORICO_DEFAULT, id_atleta=None):
+    """
+    Confronto PRE/POST di un atleta (per ID se noto): una riga per metrica con i valori delle due date.
+    """
+    condizione, params_atleta = _filtro_atleta(atleta, id_atleta)
+    sql = f"""
+        SELECT sezione, metrica, dato, indice, cella,
+               MAX(CASE WHEN data_test = ? THEN valore_num END) AS pre,
+               MAX(CASE WHEN data_test = ? THEN valore_num END) AS post
+        FROM metriche
+        WHERE {condizione} AND data_test IN (?, ?)
+        GROUP BY sezione, metrica, dato, indice, cella
+        ORDER BY sezione, metrica, dato, indice
+    """
+    pre, post = str(data_pre), str(data_post)
+    conn = apri_storico(path_db)
+    try:
+        df = pd.read_sql_query(sql, conn, params=[pre, post] + params_atleta + [pre, post])
+    finally:
+        conn.close()
+    df['diff'] = df['post'] - df['pre']
+    return df
+
+
+def firma_storico(path_db=DB_STORICO_DEFAULT):
+    """Dimensione e data di modifica del database e del suo WAL: cambia a ogni elaborazione salvata."""
+    firma = []
+    for percorso in (path_db, path_db + "-wal"):
+        try:
+            stato = os.stat(percorso)
+            firma.append((stato.st_mtime_ns, stato.st_size))
+        except OSError:
+            firma.append(None)
+    return tuple(firma)
+
+
+def metriche_numeriche(path_db=DB_STORICO_DEFAULT):
+    """Metriche con valori numerici nello storico, con il numero di atleti e di date di ciascuna."""
+    conn = apri_storico(path_db)
+    try:
+        return pd.read_sql_query(
+            "SELECT sezione, metrica, dato, COUNT(DISTINCT COALESCE(id_atleta, atleta)) AS atleti, "
+            "COUNT(DISTINCT data_test) AS date "
+            "FROM metriche WHERE valore_num IS NOT NULL "
+            "GROUP BY sezione, metrica, dato ORDER BY sezione, metrica, dato", conn
+        )
+    finally:
+        conn.close()
+
+
+def serie_squadra(sezione, metrica, dato, path_db=DB_STORICO_DEFAULT):
+    """
+    Una metrica per tutti gli atleti: una riga per (atleta, data) con la media delle prove
+    (es. i top 3 di un salto), già aggregata da SQLite. Gli atleti con un ID sono distinti per ID
+    e hanno l'ID nel nome (es. 'ROSSI MARIO (12)'), così due omonimi non si sommano.
+    """
+    sql = """
+        SELECT CASE WHEN id_atleta IS NULL THEN atleta ELSE atleta || ' (' || id_atleta || ')' END AS atleta,
+               data_test, AVG(valore_num) AS valore, COUNT(*) AS prove
+        FROM metriche
+        WHERE sezione = ? AND metrica = ? AND dato = ? AND valore_num IS NOT NULL
+        GROUP BY metriche.atleta, id_atleta, data_test
+        ORDER BY data_test, 1
+    """
+    conn = apri_storico(path_db)
+    try:
+        return pd.read_sql_query(sql, conn, params=[sezione, metrica, dato])
+    finally:
+        conn.close()
@@ -0,0 +1,292 @@
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: niente getrusage, il picco RSS resta non disponibile
+    resource = None
+
+# --- CONFIGURAZIONE STRUMENTAZIONE ---
+# File JSONL a cui accodare il record di ogni elaborazione (stringa vuota = disattivato)
+FILE_PRESTAZIONI_DEFAULT = os.environ.get("CHRONOJUMP_LOG_PRESTAZIONI", "prestazioni.jsonl")
+# Misura del picco di memoria per stadio:
+# - "rss": picco della memoria residente del processo (economico, default)
+# - "tracemalloc": picco delle allocazioni Python (preciso ma rallenta molto la pipeline)
+# - "0": nessuna misura
+MISURA_MEMORIA = os.environ.get("CHRONOJUMP_MISURA_MEMORIA", "rss")
+
+# Profilazione cProfile + tracemalloc di ogni elaborazione ("1" per attivarla; altrimenti toggle nascosto)
+PROFILAZIONE_ATTIVA = os.environ.get("CHRONOJUMP_PROFILA", "0") == "1"
+# Numero di righe nel riepilogo cProfile e nella classifica delle allocazioni
+RIGHE_PROFILO = 30
+
+# tracemalloc è globale al processo: lo attiviamo finché almeno una misurazione è in corso
+_lock_tracemalloc = threading.Lock()
+_utenti_tracemalloc = 0
+
+# Anche i picchi (VmHWM di /proc, picco di tracemalloc) sono del processo: un picco viene azzerato
+# solo da una misura che parte quando nessun'altra è in corso, altrimenti le elaborazioni
+# contemporanee si azzererebbero i picchi a vicenda. Una misura che si sovrappone ad altre riporta
+# il picco del processo, non dello stadio (vedi _entra / _esci).
+_lock_picchi = threading.Lock()
+_misure_attive = 0
+_ingressi = 0
+
+
+def _entra(azzera):
+    """
+    Registra una misura di picco in corso; azzera il picco del processo (azzera()) solo se è l'unica.
+    Restituisce (esclusiva, ingresso) da passare a _esci.
+    """
+    global _misure_attive, _ingressi
+    with _lock_picchi:
+        _misure_attive += 1
+        _ingressi += 1
+        esclusiva = _misure_attive == 1
+        azzerato = azzera() if esclusiva else False
+        return esclusiva and azzerato is not False, _ingressi
+
+
+def _esci(esclusiva, ingresso):
+    """Chiude la misura: True se il picco è solo suo (nessun'altra misura durante), False se è del processo."""
+    global _misure_attive
+    with _lock_picchi:
+        _misure_attive -= 1
+        return esclusiva and _ingressi == ingresso
+
+
+def _avvia_tracemalloc():
+    global _utenti_tracemalloc
+    with _lock_tracemalloc:
+        if _utenti_tracemalloc == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _utenti_tracemalloc += 1
+
+
+def _ferma_tracemalloc():
+    global _utenti_tracemalloc
+    with _lock_tracemalloc:
+        _utenti_tracemalloc -= 1
+        if _utenti_tracemalloc == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def _leggi_status_kb(campo):
+    """Legge un campo (es. 'VmRSS', 'VmHWM') da /proc/self/status in kB, None se non disponibile."""
+    try:
+        with open("/proc/self/status") as f:
+            for riga in f:
+                if riga.startswith(campo + ":"):
+                    return int(riga.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _maxrss_kb():
+    """Picco storico RSS del processo in kB (su macOS ru_maxrss è espresso in byte); None su Windows."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def _azzera_picco_rss():
+    """Azzera il picco RSS del processo (Linux). Restituisce False se non supportato."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class _MemoriaRss:
+    """
+    Picco RSS durante lo stadio, rispetto alla memoria residente all'inizio. Se la misura si
+    sovrappone a un'altra (picco_mb restituisce anche esclusiva=False) è il picco del processo.
+    """
+
+    def __init__(self):
+        self.base_kb = _leggi_status_kb("VmRSS")
+        self.proc = self.base_kb is not None
+        # Senza un azzeramento riuscito il picco resta quello del processo (esclusiva False)
+        self.esclusiva, self.ingresso = _entra(lambda: self.proc and _azzera_picco_rss())
+        if not self.proc:
+            # Fallback portabile: crescita del picco storico del processo
+            self.base_kb = _maxrss_kb()
+
+    def picco_mb(self):
+        """(picco in MB o None se non misurabile, esclusiva)."""
+        esclusiva = _esci(self.esclusiva, self.ingresso)
+        picco_kb = (_leggi_status_kb("VmHWM") or self.base_kb) if self.proc else _maxrss_kb()
+        if picco_kb is None or self.base_kb is None:
+            return None, esclusiva
+        return round(max(picco_kb - self.base_kb, 0) / 1024, 2), esclusiva
+
+
+class _MemoriaTracemalloc:
+    """Picco delle allocazioni Python durante lo stadio (del processo se la misura si sovrappone ad altre)."""
+
+    def __init__(self):
+        _avvia_tracemalloc()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.esclusiva, self.ingresso = _entra(tracemalloc.reset_peak)
+
+    def picco_mb(self):
+        """(picco in MB, esclusiva)."""
+        picco = tracemalloc.get_traced_memory()[1]
+        esclusiva = _esci(self.esclusiva, self.ingresso)
+        _ferma_tracemalloc()
+        return round(max(picco - self.base, 0) / (1024 * 1024), 2), esclusiva
+
+
+class MisurazioneStadi:
+    """
+    Tempi e memoria per stadio di una singola elaborazione.
+    - wall time (perf_counter) e CPU time del thread che esegue la pipeline
+    - picco di memoria durante lo stadio (RSS oppure tracemalloc, vedi MISURA_MEMORIA)
+    - conteggi liberi (righe, gruppi, sessioni...) associati allo stadio
+    Con più elaborazioni contemporanee il picco è del processo, non dello stadio: il record lo
+    segnala con picco_processo=True.
+    """
+
+    def __init__(self, pagina, file_sorgente=None, misura_memoria=MISURA_MEMORIA):
+        self.pagina = pagina
+        self.file_sorgente = file_sorgente
+        self.misura_memoria = misura_memoria
+        self.inizio = datetime.now()
+        self.stadi = []
+
+    @contextmanager
+    def stadio(self, nome):
+        """Misura il blocco di codice come stadio 'nome'. Restituisce il dizionario dei conteggi."""
+        conteggi = {}
+        memoria = None
+        if self.misura_memoria == "rss":
+            memoria = _MemoriaRss()
+        elif self.misura_memoria == "tracemalloc":
+            memoria = _MemoriaTracemalloc()
+        t_wall = time.perf_counter()
+        t_cpu = time.thread_time()
+        try:
+            yield conteggi
+        finally:
+            picco, esclusiva = memoria.picco_mb() if memoria is not None else (None, True)
+            record = {
+                "stadio": nome,
+                "wall_s": round(time.perf_counter() - t_wall, 4),
+                "cpu_s": round(time.thread_time() - t_cpu, 4),
+                "picco_mem_mb": picco,
+                "picco_processo": not esclusiva,
+                "conteggi": conteggi,
+            }
+            self.stadi.append(record)
+
+    def record(self):
+        """Record serializzabile dell'elaborazione (una riga del file JSONL)."""
+        return {
+            "timestamp": self.inizio.isoformat(timespec="seconds"),
+            "pagina": self.pagina,
+            "file_sorgente": self.file_sorgente,
+            "totale_wall_s": round(sum(s["wall_s"] for s in self.stadi), 4),
+            "totale_cpu_s": round(sum(s["cpu_s"] for s in self.stadi), 4),
+            "stadi": self.stadi,
+        }
+
+    def tabella(self):
+        """Righe pronte per st.dataframe (un dizionario per stadio)."""
+        righe = []
+        for s in self.stadi:
+            righe.append({
+                "Stadio": s["stadio"],
+                "Wall (s)": s["wall_s"],
+                "CPU (s)": s["cpu_s"],
+                "Picco memoria (MB)": s["picco_mem_mb"],
+                "Picco di": "processo" if s.get("picco_processo") else "stadio",
+                "Conteggi": ", ".join(f"{k}={v}" for k, v in s["conteggi"].items()),
+            })
+        return righe
+
+    def accoda_jsonl(self, path=FILE_PRESTAZIONI_DEFAULT):
+        """Accoda il record al file JSONL delle prestazioni (nessuna azione se path è vuoto)."""
+        if not path:
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.record(), ensure_ascii=False) + "\n")
+
+
+class ProfiloEsecuzione:
+    """Risultato di una esecuzione profilata: statistiche cProfile e allocazioni principali."""
+
+    def __init__(self, stats, top_allocazioni, picco_mb, picco_processo=False):
+        self.stats = stats
+        self.top_allocazioni = top_allocazioni
+        self.picco_mb = picco_mb
+        self.picco_processo = picco_processo  # True se altre misure erano in corso: picco del processo
+
+    def prof_bytes(self):
+        """Contenuto di un file .prof (stesso formato di cProfile.Profile.dump_stats)."""
+        return marshal.dumps(self.stats)
+
+    def testo_statistiche(self, ordinamento="cumulative", righe=RIGHE_PROFILO):
+        """Riepilogo testuale pstats delle funzioni più costose."""
+        testo = io.StringIO()
+        statistiche = pstats.Stats(stream=testo)
+        statistiche.stats = self.stats
+        statistiche.get_top_level_stats()
+        statistiche.sort_stats(ordinamento).print_stats(righe)
+        return testo.getvalue()
+
+
+def esegui_profilato(funzione, *args, **kwargs):
+    """
+    Esegue funzione(*args, **kwargs) sotto cProfile e tracemalloc.
+    Restituisce (risultato, ProfiloEsecuzione). Va chiamata solo quando la profilazione è richiesta:
+    le elaborazioni normali non passano di qui e non pagano alcun costo aggiuntivo.
+    """
+    profilo = cProfile.Profile()
+    _avvia_tracemalloc()
+    esclusiva, ingresso = _entra(tracemalloc.reset_peak)
+    try:
+        profilo.enable()
+        try:
+            risultato = funzione(*args, **kwargs)
+        finally:
+            profilo.disable()
+        picco = tracemalloc.get_traced_memory()[1]
+        esclusiva = _esci(esclusiva, ingresso)
+        ingresso = None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+    finally:
+        if ingresso is not None:
+            _esci(esclusiva, ingresso)
+        _ferma_tracemalloc()
+
+    top_allocazioni = []
+    for stat in snapshot.statistics("lineno")[:RIGHE_PROFILO]:
+        frame = stat.traceback[0]
+        top_allocazioni.append({
+            "Posizione": f"{frame.filename}:{frame.lineno}",
+            "Memoria (KB)": round(stat.size / 1024, 1),
+            "Blocchi": stat.count,
+        })
+
+    profilo.create_stats()
+    return risultato, ProfiloEsecuzione(profilo.stats, top_allocazioni, round(picco / (1024 * 1024), 2),
+                                        picco_processo=not esclusiva)
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# I moduli dell'app sono nella radice del progetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# I test non devono toccare lo storico né il log prestazioni di produzione
+os.environ["CHRONOJUMP_DB_STORICO"] = os.path.join(tempfile.mkdtemp(prefix="chronojump_test_"), "storico.db")
+os.environ["CHRONOJUMP_LOG_PRESTAZIONI"] = ""
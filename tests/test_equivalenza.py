@@ -0,0 +1,59 @@
+"""
+La pipeline della pagina (e le sue varianti con indice e step memorizzati) deve produrre le
+stesse celle della copia congelata in equivalenza.py, su ogni formato di genera_export.
+"""
+import os
+from datetime import datetime
+
+import pytest
+
+import equivalenza
+import genera_export
+
+MODELLO = os.path.join(equivalenza.CARTELLA_PROGETTO, "excel.xlsx")
+N_DATE = 3
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    cartella = tmp_path_factory.mktemp("export")
+    percorsi = genera_export.genera_file(str(cartella), 300, N_DATE, formati=tuple(genera_export.FORMATI))
+    return dict(zip(genera_export.FORMATI, percorsi))
+
+
+@pytest.fixture(scope="module")
+def riferimento():
+    """Motore di riferimento calcolato una volta per file, per tutti i candidati."""
+    calcolati = {}
+
+    def motore(dati, nome, date, modello):
+        if nome not in calcolati:
+            calcolati[nome] = equivalenza.motore_riferimento(dati, nome, date, modello)
+        return calcolati[nome]
+    return motore
+
+
+@pytest.mark.parametrize("candidato", ["pipeline", "indice", "incrementale"])
+@pytest.mark.parametrize("formato", list(genera_export.FORMATI))
+def test_stesse_celle_del_riferimento(export, riferimento, formato, candidato):
+    esito = equivalenza.verifica_file(export[formato], riferimento, equivalenza.MOTORI[candidato], MODELLO)
+    assert esito["errore"] is None
+    assert esito["date"] == N_DATE
+    assert esito["differenze"] == {}
+
+
+@pytest.mark.parametrize("formato", list(genera_export.FORMATI))
+def test_date_trovate_dal_riferimento(export, formato):
+    with open(export[formato], "rb") as f:
+        dati = f.read()
+    attese = [d.date() for d in genera_export.date_sessioni(N_DATE, datetime(2024, 1, 8, 9, 0))]
+    assert equivalenza.date_riferimento(dati, os.path.basename(export[formato])) == attese
+
+
+def test_sessione_persa_dal_candidato(export, riferimento, monkeypatch):
+    # Un indice che perde l'ultima sessione: quella data deve far fallire il file, non sparire dal confronto
+    date_candidato = equivalenza.date_candidato
+    monkeypatch.setattr(equivalenza, "date_candidato", lambda dati, nome: date_candidato(dati, nome)[:-1])
+    esito = equivalenza.verifica_file(export["xlsx"], riferimento, equivalenza.motore_incrementale, MODELLO)
+    assert esito["date"] == N_DATE
+    assert list(esito["differenze"].values()) == [[("-", "sessione", "presente", "assente")]]
@@ -0,0 +1,97 @@
+"""
+Indice incrementale (filigrana.indicizza) di export cumulativi: sempre uguale all'indice
+calcolato da zero con sessioni.indicizza_sessioni, e davvero incrementale quando può esserlo.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import filigrana
+import genera_export
+import main
+import memoria
+import sessioni
+
+
+def tronca(righe, togli):
+    """Export senza le ultime 'togli' sessioni: righe della tabella salti e blocchi RJ di quelle date."""
+    date = sorted({r[0].date() for r in righe if r and isinstance(r[0], datetime)})
+    via = set(date[-togli:]) if togli else set()
+    tenute, in_blocco_rj = [], False
+    for riga in righe:
+        if riga and isinstance(riga[0], datetime) and riga[0].date() in via:
+            in_blocco_rj = len(riga) > 1 and riga[1] == "RJ(unlimited)"
+            continue
+        if in_blocco_rj:
+            in_blocco_rj = bool(riga)
+            continue
+        tenute.append(riga)
+    return tenute
+
+
+def assert_indici_uguali(a, b):
+    assert a.forma == b.forma
+    for nome in ("anagrafica", "salti", "rj"):
+        assert getattr(a.intestazioni, nome) == getattr(b.intestazioni, nome)
+    assert a.rj_per_data == b.rj_per_data
+    for x, y in ((a.righe_salti_per_data, b.righe_salti_per_data), (a.righe_rj_per_data, b.righe_rj_per_data)):
+        assert (x is None) == (y is None)
+        if x is None:
+            continue
+        assert x.keys() == y.keys()
+        for data in x:
+            assert x[data].dtype == y[data].dtype and np.array_equal(x[data], y[data])
+    assert a.salti_per_data.keys() == b.salti_per_data.keys()
+    for data in a.salti_per_data:
+        assert list(a.salti_per_data[data].items()) == list(b.salti_per_data[data].items())
+    pd.testing.assert_frame_equal(a.tabella_salti, b.tabella_salti, check_categorical=True, check_exact=True)
+    assert a.tabella_salti["Tipo"].cat.categories.equals(b.tabella_salti["Tipo"].cat.categories)
+    assert (a.colonne_rj is None) == (b.colonne_rj is None)
+    if a.colonne_rj is not None:
+        for colonna in ("fine", "tc", "altezza", "rsi"):
+            assert np.array_equal(getattr(a.colonne_rj, colonna), getattr(b.colonne_rj, colonna), equal_nan=True)
+
+
+@pytest.fixture(scope="module", params=["xlsx", "csv-semicolon"])
+def versioni(request, tmp_path_factory):
+    """Tre export cumulativi dello stesso atleta ({sessioni tolte: DataFrame}), dal più vecchio."""
+    cartella = tmp_path_factory.mktemp(request.param)
+    righe = genera_export.genera_righe_export(600, 5)
+    estensione = genera_export.FORMATI[request.param][0]
+    versioni = {}
+    for togli in (2, 1, 0):
+        path = genera_export.scrivi_export(tronca(righe, togli), str(cartella / f"v{togli}{estensione}"),
+                                           request.param)
+        versioni[togli] = main.carica_file_universale(path)
+    return versioni
+
+
+def test_export_successivi(versioni):
+    governatore = memoria.GovernatoreMemoria()
+    for togli in (2, 1, 0, 0):
+        df = versioni[togli]
+        assert_indici_uguali(filigrana.indicizza(df, governatore), sessioni.indicizza_sessioni(df))
+
+
+def test_percorso_incrementale(versioni):
+    precedente, nuovo = versioni[1], versioni[0]
+    filigrana_precedente = filigrana.Filigrana(
+        filigrana.impronte_righe(precedente), filigrana.tipi_colonne(precedente),
+        sessioni.indicizza_sessioni(precedente)
+    )
+    indice = filigrana.aggiorna_indice(nuovo, nuovo.to_numpy(dtype=object), filigrana_precedente,
+                                       filigrana.impronte_righe(nuovo))
+    assert indice is not None
+    assert_indici_uguali(indice, sessioni.indicizza_sessioni(nuovo))
+    assert len(indice.date) == len(filigrana_precedente.indice.date) + 1
+
+
+def test_export_modificato_o_saltato(versioni):
+    governatore = memoria.GovernatoreMemoria()
+    filigrana.indicizza(versioni[2], governatore)
+    assert_indici_uguali(filigrana.indicizza(versioni[0], governatore), sessioni.indicizza_sessioni(versioni[0]))
+    modificato = versioni[0].copy()
+    modificato.iloc[10, 2] = "99"
+    assert_indici_uguali(filigrana.indicizza(modificato, governatore), sessioni.indicizza_sessioni(modificato))
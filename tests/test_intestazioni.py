@@ -0,0 +1,22 @@
+"""Intestazioni dell'anagrafica riconosciute in italiano, inglese e spagnolo."""
+import numpy as np
+import pytest
+
+import intestazioni
+
+ANAGRAFICA = {
+    "it": ["ID", "Nome", "Nome persona", "Peso", "Lunghezza gamba", "Altezza dei fianchi durante flessione SJ"],
+    "en": ["ID", "Name", "Person name", "Weight", "Leg length", "Hips height on SJ flexion"],
+    "es": ["ID", "Nombre", "Nombre de la persona", "Peso", "Longitud de pierna", "Altura de la cadera en flexión SJ"],
+}
+
+
+@pytest.mark.parametrize("lingua", sorted(ANAGRAFICA))
+def test_campi_anagrafica(lingua):
+    valori = np.array([["Export"] + [None] * 5, ANAGRAFICA[lingua], [7, "", "Rossi Mario", 70, 90, 60]],
+                      dtype=object)
+    riga, mappa = intestazioni.riconosci(valori).anagrafica
+    assert riga == 1
+    for campo, colonna in (("id", 0), ("nome", 1), ("nome persona", 2), ("peso", 3), ("lunghezza gamba", 4),
+                           ("altezza dei fianchi durante flessione sj", 5)):
+        assert mappa[campo] == colonna
@@ -0,0 +1,41 @@
+"""Lettura in streaming degli XLSX (lettura_xlsx) e ripiego su pd.read_excel in main._leggi_excel."""
+import pandas as pd
+import pytest
+
+import genera_export
+import lettura_xlsx
+import main
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    cartella = tmp_path_factory.mktemp("export")
+    return dict(zip(("xlsx", "csv-comma", "numbers"),
+                    genera_export.genera_file(str(cartella), 300, 3, formati=("xlsx", "csv-comma", "numbers"))))
+
+
+def test_identico_a_read_excel(export):
+    pd.testing.assert_frame_equal(lettura_xlsx.leggi_primo_foglio(export["xlsx"]),
+                                  pd.read_excel(export["xlsx"], header=None))
+
+
+@pytest.mark.parametrize("formato", ["csv-comma", "numbers"])
+def test_non_xlsx(export, formato):
+    with pytest.raises(lettura_xlsx.NonXlsx):
+        lettura_xlsx.leggi_primo_foglio(export[formato])
+    registro = main.RegistroEventi()
+    with pytest.raises(Exception):
+        main._leggi_excel(export[formato], registro)
+    assert not registro.filtra("avviso")
+
+
+def test_ripiego_segnalato(export, monkeypatch, capsys):
+    def rotto(*args, **kwargs):
+        raise AttributeError("'Workbook' object has no attribute '_date_formats'")
+
+    monkeypatch.setattr(lettura_xlsx, "ExcelReader", rotto)
+    registro = main.RegistroEventi()
+    df = main._leggi_excel(export["xlsx"], registro)
+    pd.testing.assert_frame_equal(df, pd.read_excel(export["xlsx"], header=None))
+    assert "pd.read_excel" in registro.filtra("avviso")[0][2]
+    assert "AttributeError" in capsys.readouterr().err
@@ -0,0 +1,38 @@
+"""Sessioni elencate dall'indice: una per data dell'export, senza date fantasma dalle righe RJ."""
+import io
+import os
+from datetime import date, datetime
+
+import pytest
+
+import genera_export
+import main
+import sessioni
+
+INIZIO = datetime(2024, 1, 8, 9, 0)
+
+
+@pytest.mark.parametrize("valore, attesa", [
+    ("2024-03-05 09:00:00", date(2024, 3, 5)),   # ISO: non 3 maggio con dayfirst
+    ("2024-03-05", date(2024, 3, 5)),
+    (datetime(2024, 3, 5, 9, 0), date(2024, 3, 5)),
+    ("05/03/2024", date(2024, 3, 5)),
+    ("RJ 2024-03-05 (2)", date(2024, 3, 5)),
+    ("RJ(unlimited)", None),
+])
+def test_data_rj(valore, attesa):
+    assert sessioni.data_rj(valore) == attesa
+
+
+@pytest.mark.parametrize("formato", list(genera_export.FORMATI))
+def test_nessuna_data_fantasma(tmp_path, formato):
+    # Giorno <= 12 in tutte le date: letti con dayfirst, i valori ISO darebbero un'altra data valida
+    date_attese = [d.date() for d in genera_export.date_sessioni(5, INIZIO)]
+    path, = genera_export.genera_file(str(tmp_path), 300, 5, formati=(formato,))
+    # Come un file caricato dalla pagina (da path i .numbers non sono letti)
+    with open(path, "rb") as f:
+        caricato = io.BytesIO(f.read())
+    caricato.name = os.path.basename(path)
+    indice = sessioni.indicizza_sessioni(main.carica_file_universale(caricato))
+    assert indice.date == date_attese
+    assert set(indice.rj_per_data) <= set(date_attese)
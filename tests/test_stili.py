@@ -0,0 +1,62 @@
+"""
+Stili scritti da main.scrivi_celle_stilizzate: StiliCondivisi usa le collezioni interne di
+openpyxl (wb._fonts, wb._number_formats, cella._style), quindi font e formati devono
+sopravvivere a salvataggio e rilettura con la versione installata.
+"""
+import io
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Border, Font, Side
+
+import main
+
+
+def _rileggi(wb):
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return load_workbook(buffer)
+
+
+def test_font_e_formati_dopo_salvataggio():
+    wb = Workbook()
+    ws = wb.active
+    ws["B2"].border = Border(left=Side(style="thin"))
+    grassetto = Font(name="Calibri", size=11, bold=True, color="FFFF0000")
+    celle = [
+        (1, 1, 1.23456, grassetto, "0.000"),      # formato personalizzato
+        (1, 2, 0.5, None, "0.00%"),               # formato predefinito di Excel
+        (2, 2, 7, grassetto, None),               # stile già presente sul foglio
+        (3, 1, "testo", None, None),
+        (4, 1, 9.87654, grassetto, "0.000"),      # stessi oggetti: stessi indici
+    ]
+    assert main.scrivi_celle_stilizzate(ws, celle) == len(celle)
+
+    ws = _rileggi(wb).active
+    for coord in ("A1", "B2", "A4"):
+        assert ws[coord].font.b and ws[coord].font.name == "Calibri" and ws[coord].font.color.rgb == "FFFF0000"
+    assert ws["A1"].number_format == "0.000" and ws["A4"].number_format == "0.000"
+    assert ws["B1"].number_format == "0.00%" and not ws["B1"].font.b
+    assert ws["B2"].number_format == "General" and ws["B2"].border.left.style == "thin"
+    assert ws["A3"].value == "testo" and ws["A3"].number_format == "General"
+
+
+def test_celle_nuove_senza_stile():
+    # Una cella appena creata non ha l'array di stile: scrivi_celle_stilizzate lo deve creare
+    ws = Workbook().active
+    assert ws.cell(row=5, column=5)._style is None
+    main.scrivi_celle_stilizzate(ws, [(5, 5, 1, None, "0.0"), (6, 6, 2, Font(bold=True), None)])
+    ws = _rileggi(ws.parent).active
+    assert ws["E5"].number_format == "0.0" and ws["F6"].font.b
+
+
+def test_stili_del_modello_invariati():
+    wb = Workbook()
+    ws = wb.active
+    ws["A1"].font = Font(italic=True)
+    ws["A1"].number_format = "0.0"
+    main.scrivi_celle_stilizzate(ws, [(2, 1, 1, Font(bold=True), "0.0000")])
+
+    ws = _rileggi(wb).active
+    assert ws["A1"].font.i and ws["A1"].number_format == "0.0"
+    assert ws["A2"].font.b and ws["A2"].number_format == "0.0000"